@@ -0,0 +1,150 @@
+# backend/app/config.py
+"""
+App config snapshot (read env once)
+
+main.py loads .env first, then reads every setting it needs per request from
+one immutable snapshot instead of calling os.getenv on each request / chunk.
+
+- env is treated as immutable after boot
+- reload_config() rebuilds the snapshot (used by POST /api/config/reload)
+- bad numeric values fall back to the default (logged) instead of failing every request
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# env vars echoed by /api/config (raw strings, "" if unset)
+CONFIG_ECHO_KEYS = (
+    "DEBUG",
+    "LOG_LEVEL",
+    "ENABLE_AI_EXTRACT",
+    "ENABLE_LLM",
+    "AI_PROVIDER",
+    "OPENAI_MODEL",
+    "AI_REPAIR_PASS",
+    "AI_FILL_MISSING",
+    "OCR_PROVIDER",
+    "ENABLE_OCR",
+    "CORS_ORIGINS",
+)
+
+# ============================================================
+# Env parsing helpers
+# ============================================================
+def env_bool(name: str, default: bool = False) -> bool:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    return str(v).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        logger.warning("Invalid %s=%r, using %s", name, raw, default)
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        logger.warning("Invalid %s=%r, using %s", name, raw, default)
+        return default
+
+
+# ============================================================
+# Snapshot
+# ============================================================
+@dataclass(frozen=True)
+class AppConfig:
+    debug: bool = False
+
+    # AI
+    ai_enabled: bool = False
+    ai_provider: str = ""
+    openai_model: str = ""
+    ai_repair_pass: bool = False
+    ai_fill_missing: bool = True
+    has_openai_key: bool = False
+
+    # OCR
+    ocr_enabled: bool = True
+    ocr_provider: str = "paddle"
+
+    # Upload limits
+    max_files: int = 500
+    max_file_mb: float = 25.0
+    max_bytes: int = 25 * 1024 * 1024
+    upload_chunk_bytes: int = 1024 * 1024
+    upload_spool_max_bytes: int = 2 * 1024 * 1024
+    upload_concurrency: int = 4
+    max_request_bytes: int = 500 * (25 * 1024 * 1024 + 4096) + 1024 * 1024
+
+    # raw values for /api/config
+    env_echo: Dict[str, str] = field(default_factory=dict)
+
+
+def load_config() -> AppConfig:
+    max_file_mb = _env_float("MAX_FILE_MB", 25.0)
+    max_files = _env_int("MAX_UPLOAD_FILES", 500)
+    max_bytes = int(max_file_mb * 1024 * 1024)
+    # whole multipart body: every file at its limit + part headers / form fields
+    default_total = max_files * (max_bytes + 4096) + 1024 * 1024
+    total_mb = _env_float("MAX_UPLOAD_TOTAL_MB", 0.0)
+    return AppConfig(
+        debug=env_bool("DEBUG", default=False),
+        ai_enabled=env_bool("ENABLE_AI_EXTRACT", default=False) or env_bool("ENABLE_LLM", default=False),
+        ai_provider=os.getenv("AI_PROVIDER", ""),
+        openai_model=os.getenv("OPENAI_MODEL", ""),
+        ai_repair_pass=env_bool("AI_REPAIR_PASS", default=False),
+        ai_fill_missing=env_bool("AI_FILL_MISSING", default=True),
+        has_openai_key=bool(os.getenv("OPENAI_API_KEY")),
+        ocr_enabled=env_bool("ENABLE_OCR", default=True),
+        ocr_provider=os.getenv("OCR_PROVIDER", "paddle"),
+        max_files=max_files,
+        max_file_mb=max_file_mb,
+        max_bytes=max_bytes,
+        upload_chunk_bytes=_env_int("UPLOAD_READ_CHUNK_BYTES", 1024 * 1024),
+        upload_spool_max_bytes=_env_int("UPLOAD_SPOOL_MAX_BYTES", 2 * 1024 * 1024),
+        upload_concurrency=max(1, _env_int("UPLOAD_CONCURRENCY", 4)),
+        max_request_bytes=int(total_mb * 1024 * 1024) if total_mb > 0 else default_total,
+        env_echo={k: os.getenv(k, "") for k in CONFIG_ECHO_KEYS},
+    )
+
+
+_CFG: AppConfig = load_config()
+
+
+def get_config() -> AppConfig:
+    """current snapshot (cheap attribute reads; no env access)"""
+    return _CFG
+
+
+def reload_config() -> AppConfig:
+    """re-read env into a new snapshot (explicit admin refresh)"""
+    global _CFG
+    _CFG = load_config()
+    return _CFG
+
+
+__all__ = [
+    "AppConfig",
+    "CONFIG_ECHO_KEYS",
+    "env_bool",
+    "get_config",
+    "load_config",
+    "reload_config",
+]
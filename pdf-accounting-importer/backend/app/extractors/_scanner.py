@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# backend/app/extractors/_scanner.py
+"""
+Shared one-pass keyword scanner (optional Hyperscan / RE2 Set)
+
+Extractor modules register their "is this pattern even present?" regexes at
+import time; the first scan_text() builds ONE multi-pattern database over all
+of them. A single pass over a document then answers, for every registered
+pattern, whether it can match -> extractors skip regex searches that cannot
+hit instead of each module scanning the text again.
+
+Notes:
+- register only patterns the engines accept (no lookarounds/backrefs);
+  one unsupported pattern makes the combined database fall back to "no engine"
+- without hyperscan/re2 every pattern counts as present, so callers simply run
+  their normal .search() as before
+- the RE2 Set is used only with EXTRACT_USE_RE2=1, and patterns with \\d \\s \\w \\b
+  always count as present there (RE2 reads those as ASCII; `re` matches Thai
+  digits / NBSP)
+- the index is about presence only; positions still come from `re`
+
+ContainsMatcher answers the other recurring question ("which of these keywords
+does this label contain?") in one pass: Aho-Corasick when pyahocorasick is
+installed, otherwise one escaped alternation. KeywordCounter does the same for
+"how many keywords of each list does this text contain?".
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from .common import compile_pattern_set, pattern_set_hits
+
+# Optional: Aho-Corasick automaton for ContainsMatcher
+try:
+    import ahocorasick  # type: ignore
+except Exception:  # pragma: no cover
+    ahocorasick = None  # type: ignore
+
+_LOCK = threading.Lock()
+
+# owner -> registered patterns (order = local index)
+_GROUPS: Dict[str, Tuple[Any, ...]] = {}
+
+# (pset, global id -> (owner, local index), pattern count); None = rebuild
+_DB: Optional[Tuple[Any, Dict[int, Tuple[str, int]], int]] = None
+
+
+class MatchIndex:
+    """Per-document result of scan_text(): which registered patterns may match."""
+
+    __slots__ = ("_hits", "_all")
+
+    def __init__(self, hits: Dict[str, FrozenSet[int]], all_present: bool = False) -> None:
+        self._hits = hits
+        self._all = all_present
+
+    def hits(self, owner: str) -> FrozenSet[int]:
+        """local indexes (registration order) of owner's patterns that may match"""
+        if self._all:
+            return frozenset(range(len(_GROUPS.get(owner, ()))))
+        return self._hits.get(owner, frozenset())
+
+    def has(self, owner: str, idx: int) -> bool:
+        return idx in self.hits(owner)
+
+
+_EMPTY = MatchIndex({})
+_LAST: Tuple[str, Optional[MatchIndex]] = ("", None)
+
+
+def register_patterns(owner: str, patterns: Tuple[Any, ...]) -> str:
+    """Register (or replace) owner's compiled patterns; returns owner for use as a key."""
+    global _DB, _LAST
+    with _LOCK:
+        _GROUPS[owner] = tuple(patterns)
+        _DB = None
+        _LAST = ("", None)
+    return owner
+
+
+def _database() -> Tuple[Any, Dict[int, Tuple[str, int]], int]:
+    global _DB
+    db = _DB
+    if db is not None:
+        return db
+    with _LOCK:
+        if _DB is None:
+            ids: Dict[int, Tuple[str, int]] = {}
+            flat = []
+            for owner, pats in _GROUPS.items():
+                for i, p in enumerate(pats):
+                    ids[len(flat)] = (owner, i)
+                    flat.append(p)
+            _DB = (compile_pattern_set(tuple(flat)), ids, len(flat))
+        return _DB
+
+
+def scan_text(text: str) -> MatchIndex:
+    """
+    One pass over text for every registered pattern.
+    The last (text, index) pair is kept, so calling again with the same str
+    object (e.g. several helpers of one extractor) is free.
+    """
+    global _LAST
+    if not text:
+        return _EMPTY
+    last = _LAST
+    if last[0] is text and last[1] is not None:
+        return last[1]
+
+    pset, ids, n = _database()
+    if pset is None:
+        index = MatchIndex({}, all_present=True)
+    else:
+        grouped: Dict[str, set] = {}
+        for gid in pattern_set_hits(pset, text, n):
+            owner, i = ids[gid]
+            grouped.setdefault(owner, set()).add(i)
+        index = MatchIndex({owner: frozenset(s) for owner, s in grouped.items()})
+
+    _LAST = (text, index)
+    return index
+
+
+# ============================================================
+# Keyword "contains" lookup
+# ============================================================
+class ContainsMatcher:
+    """
+    Built once from ((key, value), ...) in priority order (e.g. longest key first).
+    first(hay) returns the value of the highest-priority key contained in hay,
+    the same answer as `for k, v in pairs: if k in hay: return v`, in one scan.
+    """
+
+    __slots__ = ("_values", "_rank", "_empty", "_aho", "_re")
+
+    def __init__(self, pairs: Tuple[Tuple[str, Any], ...]) -> None:
+        rank: Dict[str, int] = {}
+        empty: Optional[int] = None
+        for i, (k, _v) in enumerate(pairs):
+            if not k:
+                # "" is contained in every non-empty hay
+                if empty is None:
+                    empty = i
+                continue
+            rank.setdefault(k, i)
+        self._values = tuple(v for _k, v in pairs)
+        self._rank = rank
+        self._empty = empty
+        self._aho = None
+        self._re = None
+        if not rank:
+            return
+        if ahocorasick is not None:
+            try:
+                aho = ahocorasick.Automaton()
+                for k, i in rank.items():
+                    aho.add_word(k, i)
+                aho.make_automaton()
+                self._aho = aho
+                return
+            except Exception:  # pragma: no cover
+                self._aho = None
+        # alternation in priority order: at each start the regex reports the
+        # best-ranked key beginning there; advancing by one start covers the rest
+        self._re = re.compile("|".join(map(re.escape, sorted(rank, key=rank.__getitem__))))
+
+    def first(self, hay: str, default: Any = "") -> Any:
+        if not hay:
+            return default
+        best = self._empty
+        if self._aho is not None:
+            for _end, i in self._aho.iter(hay):
+                if best is None or i < best:
+                    best = i
+                    if i == 0:
+                        break
+        elif self._re is not None:
+            search = self._re.search
+            rank = self._rank
+            pos = 0
+            while True:
+                m = search(hay, pos)
+                if not m:
+                    break
+                i = rank[m.group(0)]
+                if best is None or i < best:
+                    best = i
+                    if i == 0:
+                        break
+                pos = m.start() + 1
+        return default if best is None else self._values[best]
+
+
+class KeywordCounter:
+    """
+    Built once from {name: (keyword, ...)}.
+    counts(hay) -> {name: number of that list's keywords contained in hay}, the
+    same numbers as `sum(1 for k in kws if k and k in hay)` per list, but with a
+    single automaton pass over hay for all lists together (pyahocorasick).
+    Without it each distinct keyword is tested once with `in`.
+    """
+
+    __slots__ = ("_names", "_owners", "_aho")
+
+    def __init__(self, groups: Mapping[str, Tuple[str, ...]]) -> None:
+        # keyword -> list names it belongs to (repeated if listed twice)
+        owners: Dict[str, List[str]] = {}
+        for name, kws in groups.items():
+            for k in kws:
+                if k:
+                    owners.setdefault(k, []).append(name)
+        self._names = tuple(groups)
+        self._owners = {k: tuple(v) for k, v in owners.items()}
+        self._aho = None
+        if owners and ahocorasick is not None:
+            try:
+                aho = ahocorasick.Automaton()
+                for k in owners:
+                    aho.add_word(k, k)
+                aho.make_automaton()
+                self._aho = aho
+            except Exception:  # pragma: no cover
+                self._aho = None
+
+    def counts(self, hay: str) -> Dict[str, int]:
+        out = dict.fromkeys(self._names, 0)
+        if not hay:
+            return out
+        owners = self._owners
+        if self._aho is not None:
+            found = set()
+            for _end, k in self._aho.iter(hay):
+                found.add(k)
+                if len(found) == len(owners):
+                    break
+        else:
+            found = [k for k in owners if k in hay]
+        for k in found:
+            for name in owners[k]:
+                out[name] += 1
+        return out
+
+
+__all__ = ["ContainsMatcher", "KeywordCounter", "MatchIndex", "register_patterns", "scan_text"]
@@ -64,10 +64,11 @@ except Exception:
 
 # Classifier (existing)
 try:
-    from ..services.classifier import classify_platform
+    from ..services.classifier import classify_platform, classify_platform_batch
     _CLASSIFIER_OK = True
 except Exception:
     classify_platform = None  # type: ignore
+    classify_platform_batch = None  # type: ignore
     _CLASSIFIER_OK = False
 
 
@@ -164,10 +165,12 @@ def _norm_profile_hint(seg: Segment) -> Tuple[str, str]:
 def _choose_route_from_segment(
     seg: Segment,
     filename: str = "",
-    use_classifier: bool = True
+    use_classifier: bool = True,
+    classified: Optional[str] = None,
 ) -> Tuple[str, str, str, bool]:
     """
     Decide route_name and prompt_name.
+    - classified: classifier label already computed for this segment (batch)
 
     Returns:
       (route_name, prompt_name, platform_hint, use_rule_based)
@@ -175,7 +178,9 @@ def _choose_route_from_segment(
     detected = "unknown"
 
     # 1) Classifier first
-    if use_classifier and _CLASSIFIER_OK and classify_platform:
+    if use_classifier and classified is not None:
+        detected = _norm_classifier_label(classified)
+    elif use_classifier and _CLASSIFIER_OK and classify_platform:
         try:
             detected = _norm_classifier_label(
                 classify_platform(seg.merged_text, filename=filename)
@@ -254,6 +259,17 @@ def _build_partial_row_for_ai(
 # Build routing plans
 # ============================================================
 
+def _classify_segments(segments: List[Segment], filename: str) -> List[Optional[str]]:
+    """classifier labels for all segments in one batch call (None -> per-segment fallback)"""
+    if not (_CLASSIFIER_OK and classify_platform_batch) or not segments:
+        return [None] * len(segments)
+    try:
+        return list(classify_platform_batch([seg.merged_text for seg in segments], [filename] * len(segments)))
+    except Exception as e:
+        logger.warning(f"Batch classifier failed: {e}")
+        return [None] * len(segments)
+
+
 def build_routing_plan_from_pdf(
     pdf_bytes: bytes,
     filename: str,
@@ -270,11 +286,13 @@ def build_routing_plan_from_pdf(
 
     jobs: List[RoutedJob] = []
 
-    for seg in analysis.segments:
+    labels = _classify_segments(analysis.segments, filename)
+    for seg, label in zip(analysis.segments, labels):
         route_name, prompt_name, platform_hint, use_rule = _choose_route_from_segment(
             seg,
             filename=filename,
-            use_classifier=True
+            use_classifier=True,
+            classified=label,
         )
 
         partial = _build_partial_row_for_ai(route_name, platform_hint, cfg=cfg)
@@ -321,11 +339,13 @@ def build_routing_plan_from_text(
 
     jobs: List[RoutedJob] = []
 
-    for seg in analysis.segments:
+    labels = _classify_segments(analysis.segments, filename)
+    for seg, label in zip(analysis.segments, labels):
         route_name, prompt_name, platform_hint, use_rule = _choose_route_from_segment(
             seg,
             filename=filename,
-            use_classifier=True
+            use_classifier=True,
+            classified=label,
         )
 
         partial = _build_partial_row_for_ai(route_name, platform_hint, cfg=cfg)
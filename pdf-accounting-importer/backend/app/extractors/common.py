@@ -17,12 +17,182 @@ Version 3.3.2 (Finalize Row: client_tax_ids + compute_wht enforcement)
 
 from __future__ import annotations
 
+import functools
+import hashlib
 import os
 import re
-from typing import Dict, Any, Tuple, List, Optional
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Callable, Dict, Any, Tuple, List, Optional, Union
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
+# Optional multi-pattern engines (one pass over the text for many patterns)
+#   - hyperscan: SIMD literal prescan + DFA
+#   - google-re2: RE2 Set (DFA, linear time)
+try:
+    import hyperscan  # type: ignore
+except Exception:  # pragma: no cover
+    hyperscan = None  # type: ignore
+
+try:
+    import re2  # type: ignore
+except Exception:  # pragma: no cover
+    re2 = None  # type: ignore
+
+
+# ============================================================
+# Multi-pattern prefilter (Hyperscan / RE2 Set, optional)
+# ============================================================
+
+# RE2 is opt-in (prefilter set and single patterns alike): its \d \s \w \b are
+# ASCII-only, so it can miss what `re` matches (NBSP, Thai digits ๐-๙).
+_USE_RE2 = str(os.getenv("EXTRACT_USE_RE2", "")).strip().lower() in ("1", "true", "yes", "on")
+
+# Last (text, utf-8 bytes) pair: several pattern sets scan the same document
+# back-to-back, so it is encoded once instead of once per set.
+_LAST_UTF8: Tuple[str, bytes] = ("", b"")
+
+
+def _utf8_once(text: str) -> bytes:
+    global _LAST_UTF8
+    last = _LAST_UTF8
+    if last[0] is text:
+        return last[1]
+    data = text.encode("utf-8")
+    _LAST_UTF8 = (text, data)
+    return data
+
+
+class _HyperscanSet:
+    """Hyperscan database with the same .Match(text) contract as re2.Set."""
+
+    def __init__(self, patterns: Tuple[Any, ...]) -> None:
+        flags = []
+        for p in patterns:
+            f = hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP | hyperscan.HS_FLAG_SINGLEMATCH
+            if p.flags & re.IGNORECASE:
+                f |= hyperscan.HS_FLAG_CASELESS
+            if p.flags & re.MULTILINE:
+                f |= hyperscan.HS_FLAG_MULTILINE
+            if p.flags & re.DOTALL:
+                f |= hyperscan.HS_FLAG_DOTALL
+            flags.append(f)
+        self._db = hyperscan.Database()
+        self._db.compile(
+            expressions=[p.pattern.encode("utf-8") for p in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=flags,
+        )
+
+    def Match(self, text: str) -> List[int]:
+        found: List[int] = []
+
+        def _on_match(idx: int, _frm: int, _to: int, _flags: int, _ctx: Any) -> None:
+            found.append(idx)
+
+        self._db.scan(_utf8_once(text), match_event_handler=_on_match)
+        return found
+
+
+# escapes RE2 reads as ASCII-only where Python's re is Unicode (Thai digits, NBSP)
+_RE2_ASCII_CLASS = re.compile(r"\\[dDsSwWbB]")
+
+
+class _Re2Set:
+    """
+    re2.Set with the same .Match(text) contract, minus false "absent":
+    patterns using \\d \\s \\w \\b (or negations) are kept out of the set and
+    always reported present, so their normal `re` search still runs.
+    """
+
+    def __init__(self, patterns: Tuple[Any, ...]) -> None:
+        self._ids: List[int] = []      # set slot -> pattern index
+        self._always: List[int] = []
+        self._set = None
+        rset = re2.Set.SearchSet(re2.Options())
+        for i, p in enumerate(patterns):
+            if _RE2_ASCII_CLASS.search(p.pattern):
+                self._always.append(i)
+                continue
+            flags = ""
+            if p.flags & re.IGNORECASE:
+                flags += "i"
+            if p.flags & re.MULTILINE:
+                flags += "m"
+            if p.flags & re.DOTALL:
+                flags += "s"
+            rset.Add(f"(?{flags}){p.pattern}" if flags else p.pattern)
+            self._ids.append(i)
+        if self._ids:
+            rset.Compile()
+            self._set = rset
+
+    def Match(self, text: str) -> List[int]:
+        found = list(self._always)
+        if self._set is not None:
+            ids = self._ids
+            found.extend(ids[j] for j in self._set.Match(text))
+        return found
+
+
+def compile_pattern_set(patterns: Tuple[Any, ...]) -> Any:
+    """
+    Build a one-pass multi-pattern matcher from compiled Python patterns.
+    Prefers hyperscan (UCP), then RE2 Set when EXTRACT_USE_RE2=1. Returns None
+    when no engine is available or a pattern is not supported by the engine.
+    """
+    if hyperscan is not None:
+        try:
+            return _HyperscanSet(patterns)
+        except Exception:
+            pass
+    if _USE_RE2 and re2 is not None:
+        try:
+            return _Re2Set(patterns)
+        except Exception:
+            pass
+    return None
+
+
+def compile_regex(pattern: str, flags: int = 0) -> Any:
+    """
+    re.compile(pattern, flags), or RE2 (linear time, no backtracking) when
+    EXTRACT_USE_RE2=1 and google-re2 is installed. Patterns RE2 cannot compile
+    (lookarounds, backrefs) silently stay on `re`.
+    """
+    if _USE_RE2 and re2 is not None:
+        inline = ""
+        if flags & re.IGNORECASE:
+            inline += "i"
+        if flags & re.MULTILINE:
+            inline += "m"
+        if flags & re.DOTALL:
+            inline += "s"
+        try:
+            return re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+        except Exception:
+            pass
+    return re.compile(pattern, flags)
+
+
+def pattern_set_hits(pset: Any, text: str, n: int) -> frozenset:
+    """
+    One linear pass -> indexes of patterns that may match.
+    Without an engine (or on error) every index is returned, so callers just
+    run their normal per-pattern .search() as before.
+    """
+    if not text:
+        return frozenset()
+    if pset is None:
+        return frozenset(range(n))
+    try:
+        return frozenset(pset.Match(text))
+    except Exception:
+        return frozenset(range(n))
+
 
 # ============================================================
 # Text normalization utilities
@@ -40,12 +210,16 @@ _WS_MANY_NL_RE = re.compile(r"\n{3,}")
 # Reference cleanup
 _WS_ANY_RE = re.compile(r"\s+")
 
+# Same character set as regex \s (str.isspace), deleted in one C-level pass
+# (all Unicode whitespace lives below U+3001)
+WS_STRIP_TABLE = {c: None for c in range(0x3001) if chr(c).isspace()}
+
 
 def squash_all_ws(text: str) -> str:
     """Remove ALL whitespace (space/newline/tab) - used for strict reference outputs."""
     if not text:
         return ""
-    return _WS_ANY_RE.sub("", str(text))
+    return str(text).translate(WS_STRIP_TABLE)
 
 
 def normalize_reference_no_space(ref: str) -> str:
@@ -94,6 +268,17 @@ def normalize_text(text: str) -> str:
     return s
 
 
+def text_tail(text: str, max_chars: int = 4096) -> str:
+    """
+    Last ~max_chars of text, cut at a line start (so ^-anchored MULTILINE
+    patterns never see half a line). Whole text when it is short enough.
+    """
+    if not text or len(text) <= max_chars:
+        return text or ""
+    cut = text.find("\n", len(text) - max_chars)
+    return text[cut + 1:] if cut != -1 else ""
+
+
 def normalize_one_line(text: str) -> str:
     """Single-line normalization (for patterns that don't need line anchors)."""
     if not text:
@@ -181,6 +366,10 @@ def parse_en_date(date_str: str) -> str:
     return ""
 
 
+# Plain "1,234.56" / "1234" (the shape captured by totals patterns)
+_MONEY_PLAIN_RE = re.compile(r"[0-9,]*[0-9](?:\.[0-9]{1,2})?")
+
+
 def parse_money(value: str) -> str:
     """
     Parse money string to decimal format
@@ -190,6 +379,11 @@ def parse_money(value: str) -> str:
     if value is None:
         return ""
 
+    # Fast path: plain amount -> pure string ops (no Decimal / try-except)
+    if isinstance(value, str) and _MONEY_PLAIN_RE.fullmatch(value):
+        ip, _dot, fp = value.replace(",", "").partition(".")
+        return f"{int(ip)}.{(fp + '00')[:2]}"
+
     s = str(value)
     s = s.replace("฿", "").replace("THB", "").replace("บาท", "")
     s = s.replace(",", "").strip()
@@ -214,6 +408,27 @@ def safe_decimal(s: str) -> Decimal:
         return Decimal("0")
 
 
+def money_to_cents(value: str) -> Optional[int]:
+    """
+    Plain amount -> integer cents ('1,070.50' -> 107050).
+    None if not a plain non-negative amount (max 2 decimals).
+    """
+    if not value:
+        return None
+    s = str(value).replace(",", "").strip()
+    if not _MONEY_PLAIN_RE.fullmatch(s):
+        return None
+    ip, _dot, fp = s.partition(".")
+    return int(ip) * 100 + int((fp + "00")[:2])
+
+
+def cents_to_money(cents: int) -> str:
+    """Integer cents -> '%.2f' string (107050 -> '1070.50')."""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
 # ============================================================
 # Core patterns (enhanced with full reference support)
 # ============================================================
@@ -355,35 +570,76 @@ DATE_ANCHOR_KEYWORDS = [
 # Row template (PEAK A-U format)
 # ============================================================
 
+_BASE_ROW_TEMPLATE: Dict[str, Any] = {
+    "A_seq": "1",
+    "A_company_name": "",      # ✅ MUST EXIST for XLSX
+    "B_doc_date": "",
+    "C_reference": "",
+    "D_vendor_code": "",
+    "E_tax_id_13": "",
+    "F_branch_5": "",
+    "G_invoice_no": "",
+    "H_invoice_date": "",
+    "I_tax_purchase_date": "",
+    "J_price_type": "1",
+    "K_account": "",
+    "L_description": "",
+    "M_qty": "1",
+    "N_unit_price": "0",
+    "O_vat_rate": "7%",        # ✅ MUST EXIST for XLSX
+    "P_wht": "0",              # ✅ MUST EXIST for XLSX (rate-only)
+    "Q_payment_method": "",
+    "R_paid_amount": "0",
+    "S_pnd": "",
+    "T_note": "",
+    "U_group": "",
+}
+
+
 def base_row_dict() -> Dict[str, Any]:
     """
     PEAK A-U format template
     ใช้สำหรับ import เข้าระบบบัญชี PEAK
+    (ค่าเป็น str ทั้งหมด -> shallow copy ของ template พอ)
     """
-    return {
-        "A_seq": "1",
-        "A_company_name": "",      # ✅ MUST EXIST for XLSX
-        "B_doc_date": "",
-        "C_reference": "",
-        "D_vendor_code": "",
-        "E_tax_id_13": "",
-        "F_branch_5": "",
-        "G_invoice_no": "",
-        "H_invoice_date": "",
-        "I_tax_purchase_date": "",
-        "J_price_type": "1",
-        "K_account": "",
-        "L_description": "",
-        "M_qty": "1",
-        "N_unit_price": "0",
-        "O_vat_rate": "7%",        # ✅ MUST EXIST for XLSX
-        "P_wht": "0",              # ✅ MUST EXIST for XLSX (rate-only)
-        "Q_payment_method": "",
-        "R_paid_amount": "0",
-        "S_pnd": "",
-        "T_note": "",
-        "U_group": "",
-    }
+    return _BASE_ROW_TEMPLATE.copy()
+
+
+@dataclass(slots=True)
+class PeakRow:
+    """
+    Slot-based PEAK A-U row (same keys/defaults as base_row_dict()).
+    Attribute writes are plain slot stores - used by extractors while
+    filling a row; call to_dict() before handing it to dict-based hooks.
+    """
+    A_seq: str = "1"
+    A_company_name: str = ""
+    B_doc_date: str = ""
+    C_reference: str = ""
+    D_vendor_code: str = ""
+    E_tax_id_13: str = ""
+    F_branch_5: str = ""
+    G_invoice_no: str = ""
+    H_invoice_date: str = ""
+    I_tax_purchase_date: str = ""
+    J_price_type: str = "1"
+    K_account: str = ""
+    L_description: str = ""
+    M_qty: str = "1"
+    N_unit_price: str = "0"
+    O_vat_rate: str = "7%"
+    P_wht: str = "0"
+    Q_payment_method: str = ""
+    R_paid_amount: str = "0"
+    S_pnd: str = ""
+    T_note: str = ""
+    U_group: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in _PEAK_ROW_FIELDS}
+
+
+_PEAK_ROW_FIELDS: Tuple[str, ...] = tuple(f.name for f in fields(PeakRow))
 
 
 # ============================================================
@@ -1386,13 +1642,15 @@ def validate_date(date_str: str) -> bool:
         return False
 
 
-def format_peak_row(row: Dict[str, Any]) -> Dict[str, Any]:
+def format_peak_row(row: Union[Dict[str, Any], PeakRow]) -> Dict[str, Any]:
     """
     Final formatting and validation for PEAK import
 
     ✅ IMPORTANT:
     - P_wht is RATE-ONLY: "3%" or "0"
     """
+    if isinstance(row, PeakRow):
+        row = row.to_dict()
     formatted = base_row_dict()
     formatted.update(row)
 
@@ -1518,6 +1776,58 @@ def find_total_amount(text: str) -> str:
     return ""
 
 
+# ============================================================
+# Extractor memo (duplicate uploads / retries)
+# ============================================================
+
+def memoize_extractor(maxsize: Optional[int] = None) -> Callable:
+    """
+    Decorator for extract_xxx(text, client_tax_id="", filename="") -> row dict.
+    Keyed by (blake2b(text), client_tax_id, filename); bounded LRU; thread-safe.
+    Returns a copy each call so callers may mutate their row freely.
+    maxsize: default ENV EXTRACT_MEMO_SIZE (4096); <= 0 disables the cache.
+    """
+    if maxsize is None:
+        try:
+            maxsize = int(os.getenv("EXTRACT_MEMO_SIZE", "4096") or 0)
+        except Exception:
+            maxsize = 4096
+
+    def deco(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        if maxsize <= 0:
+            return fn
+
+        cache: "OrderedDict[Tuple[bytes, str, str], Dict[str, Any]]" = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(text: str, client_tax_id: str = "", filename: str = "") -> Dict[str, Any]:
+            try:
+                digest = hashlib.blake2b(str(text or "").encode("utf-8", "surrogatepass"), digest_size=16).digest()
+            except Exception:
+                return fn(text, client_tax_id, filename)
+            key = (digest, client_tax_id or "", filename or "")
+
+            with lock:
+                hit = cache.get(key)
+                if hit is not None:
+                    cache.move_to_end(key)
+                    return dict(hit)
+
+            row = fn(text, client_tax_id, filename)
+            if isinstance(row, dict):
+                with lock:
+                    cache[key] = dict(row)
+                    if len(cache) > maxsize:
+                        cache.popitem(last=False)
+            return row
+
+        wrapper.cache_clear = cache.clear  # type: ignore[attr-defined]
+        return wrapper
+
+    return deco
+
+
 # ============================================================
 # Export all functions
 # ============================================================
@@ -1526,7 +1836,9 @@ __all__ = [
     # Normalization
     "normalize_text",
     "normalize_one_line",
+    "text_tail",
     "squash_all_ws",
+    "WS_STRIP_TABLE",
     "normalize_reference_no_space",
     "fmt_tax_13",
     "fmt_branch_5",
@@ -1534,9 +1846,17 @@ __all__ = [
     "parse_en_date",
     "parse_money",
     "safe_decimal",
+    "money_to_cents",
+    "cents_to_money",
+
+    # Multi-pattern prefilter
+    "compile_pattern_set",
+    "pattern_set_hits",
+    "compile_regex",
 
     # Row template
     "base_row_dict",
+    "PeakRow",
 
     # Detection
     "detect_platform_vendor",
@@ -1569,6 +1889,9 @@ __all__ = [
     "validate_date",
     "format_peak_row",
 
+    # Extractor memo
+    "memoize_extractor",
+
     # Backward compatibility
     "find_tax_id",
     "find_first_date",
@@ -33,10 +33,11 @@ Plan alignment:
 from __future__ import annotations
 
 import re
+import sys
 from typing import Dict, Any, Tuple, Optional
 
 from .common import (
-    base_row_dict,
+    PeakRow,
     normalize_text,
     find_vendor_tax_id,
     find_branch,
@@ -46,6 +47,13 @@ from .common import (
     extract_amounts,          # fallback only
     format_peak_row,
     parse_money,
+    memoize_extractor,
+    money_to_cents,
+    cents_to_money,
+    compile_pattern_set,
+    pattern_set_hits,
+    WS_STRIP_TABLE,
+    text_tail,
 )
 
 # ========================================
@@ -55,6 +63,16 @@ from .common import (
 # "RATE"  = P_wht "3%" if WHT exists else ""
 WHT_MODE = "EMPTY"
 
+# ========================================
+# Output policy constants (interned once, shared by every row)
+# ========================================
+_DESC_MP = sys.intern("Marketplace Expense")
+_PAY_METHOD = sys.intern("หักจากยอดขาย")
+_VAT7 = sys.intern("7%")
+_BR0 = sys.intern("00000")
+_PND53 = sys.intern("53")
+_VENDOR_LABEL = sys.intern("Lazada")
+
 # ========================================
 # Optional post-process hook
 # ========================================
@@ -94,6 +112,10 @@ RE_LAZADA_INVOICE_NO_FIELD = re.compile(
     re.IGNORECASE,
 )
 RE_LAZADA_DOC_THMPTI = re.compile(r"\b(THMPTI\d{16,})\b", re.IGNORECASE)
+# Same token but tolerant to whitespace/newlines inside it (searched on raw text;
+# word boundaries are checked against the nearest non-space neighbours)
+RE_LAZADA_DOC_THMPTI_WS = re.compile(r"T\s*H\s*M\s*P\s*T\s*I(?:\s*\d){16,}", re.IGNORECASE)
+RE_WORD_CHAR = re.compile(r"\w")
 
 # date
 RE_LAZADA_INVOICE_DATE = re.compile(
@@ -115,6 +137,17 @@ RE_LAZADA_TOTAL_INC = re.compile(
     re.MULTILINE | re.IGNORECASE
 )
 
+# All three strict lines in ONE pass (one named amount group per line kind;
+# most specific literal first so "Total" never swallows "Total (Including Tax)")
+RE_LAZADA_TOTALS_ANY = re.compile(
+    r"^\s*(?:"
+    r"Total\s*\(Including\s*Tax\)\s+(?P<inc>[0-9,]+\.[0-9]{2})"
+    r"|(?:7%\s*\(VAT\)|VAT\s*7%|7%\s*VAT)\s+(?P<vat>[0-9,]+\.[0-9]{2})"
+    r"|Total\s+(?P<ex>[0-9,]+\.[0-9]{2})"
+    r")\s*$",
+    re.MULTILINE | re.IGNORECASE
+)
+
 # Inline totals fallback
 RE_LAZADA_TOTAL_INC_INLINE = re.compile(
     r"(?:Total\s*\(Including\s*Tax\)|Grand\s*Total|Amount\s*Due)\s*[:#：]?\s*([0-9,]+(?:\.[0-9]{2})?)",
@@ -139,7 +172,30 @@ RE_LAZADA_WHT_EN = re.compile(
     re.IGNORECASE | re.DOTALL
 )
 
-RE_ALL_WS = re.compile(r"\s+")
+# Totals patterns in fixed order -> one hyperscan/RE2 pass tells which can match
+# (falls back to "all" when neither engine is installed)
+_TOTALS_PATTERNS = (
+    RE_LAZADA_TOTALS_ANY,
+    RE_LAZADA_TOTAL_INC_INLINE,
+    RE_LAZADA_SUBTOTAL_INLINE,
+    RE_LAZADA_VAT_INLINE,
+)
+_TOTALS_SET = compile_pattern_set(_TOTALS_PATTERNS)
+
+# Literal keywords (lowercase) every match of an inline fallback must contain;
+# a plain substring test is far cheaper than an IGNORECASE regex sweep
+_INLINE_KEYWORDS: Dict[int, Tuple[str, ...]] = {
+    1: ("total", "amount"),
+    2: ("total",),
+    3: ("vat", "ภาษีมูลค่าเพิ่ม"),
+}
+
+# A strict totals match can only start on a line holding one of these (lowercase);
+# "%" keeps a VAT row that wraps as "7%" + newline + "(VAT) 70.00"
+_STRICT_LINE_KEYWORDS: Tuple[str, ...] = ("total", "vat", "%")
+
+_WHT_PATTERNS = (RE_LAZADA_WHT_TEXT, RE_LAZADA_WHT_EN)
+_WHT_SET = compile_pattern_set(_WHT_PATTERNS)
 
 
 # ============================================================
@@ -152,133 +208,223 @@ def _safe_money(v: str) -> str:
     except Exception:
         return ""
 
-def _safe_float(x: str) -> float:
-    try:
-        return float(str(x).replace(",", "").strip())
-    except Exception:
-        return 0.0
-
 def _squash_ws(s: str) -> str:
     """Remove ALL whitespace (space/tab/newline)."""
     if not s:
         return ""
-    return RE_ALL_WS.sub("", s)
+    return s.translate(WS_STRIP_TABLE)
+
+def _thmpti_on_word_boundary(t: str, start: int, end: int) -> bool:
+    """\b check against the nearest non-space neighbours (as if t were squashed)."""
+    i = start - 1
+    while i >= 0 and t[i].isspace():
+        i -= 1
+    if i >= 0 and RE_WORD_CHAR.match(t[i]):
+        return False
+    j = end
+    while j < len(t) and t[j].isspace():
+        j += 1
+    return not (j < len(t) and RE_WORD_CHAR.match(t[j]))
+
+def _find_thmpti_no_space(t: str) -> str:
+    """
+    THMPTI token even if split by spaces/newlines, returned squashed.
+    Same matches as RE_LAZADA_DOC_THMPTI.search(_squash_ws(t)) but only the
+    matched slice is squashed (no whole-document copy).
+
+    Fast path: the intact upper-case literal is located with str.find
+    (C-level memchr scan) and the regex only runs anchored at those offsets.
+    Split / lower-case tokens fall back to the full regex sweep.
+    """
+    if not t:
+        return ""
+
+    pos = t.find("THMPTI")
+    while pos != -1:
+        m = RE_LAZADA_DOC_THMPTI_WS.match(t, pos)
+        if m and _thmpti_on_word_boundary(t, m.start(), m.end()):
+            return _squash_ws(m.group(0))
+        pos = t.find("THMPTI", pos + 6)
+
+    for m in RE_LAZADA_DOC_THMPTI_WS.finditer(t):
+        if _thmpti_on_word_boundary(t, m.start(), m.end()):
+            return _squash_ws(m.group(0))
+    return ""
 
 def _digits_only(s: str) -> str:
     return "".join(ch for ch in str(s or "") if ch.isdigit())
 
-def _pick_client_tax_id(text: str) -> str:
+def _pick_client_tax_id(text: str, normalized: Optional[str] = None) -> str:
     """
     Best-effort: pick a 13-digit tax id that is NOT vendor tax id.
     """
-    t = normalize_text(text or "")
+    t = normalized if normalized is not None else normalize_text(text or "")
     for m in RE_TAX_ID_13.finditer(t):
         tax = m.group(1)
         if tax and tax != VENDOR_LAZADA:
             return tax
     return ""
 
+def _vendor_code_from_mapping(client_tax_id: str, vendor_tax_id: str) -> str:
+    if not client_tax_id:
+        return _VENDOR_LABEL
+    try:
+        code = get_vendor_code(
+            client_tax_id=client_tax_id,
+            vendor_tax_id=vendor_tax_id,
+            vendor_name="Lazada",
+        )
+        # accept only Cxxxxx as vendor code; else fallback "Lazada"
+        if isinstance(code, str) and re.match(r"^C\d{5}$", code.strip(), re.IGNORECASE):
+            return code.strip().upper()
+        return _VENDOR_LABEL
+    except Exception:
+        return _VENDOR_LABEL
+
+def _vendor_code_fallback(client_tax_id: str, vendor_tax_id: str) -> str:
+    return _VENDOR_LABEL
+
+# strategy bound once at import (mapping availability never changes at runtime)
+_RESOLVE_VENDOR = (
+    _vendor_code_from_mapping
+    if VENDOR_MAPPING_AVAILABLE and callable(get_vendor_code)
+    else _vendor_code_fallback
+)
+
 def _get_vendor_code_safe(client_tax_id: str, vendor_tax_id: str) -> str:
     """
     Prefer vendor_mapping.get_vendor_code if available; otherwise fallback label 'Lazada'.
     Must never raise.
     """
-    if VENDOR_MAPPING_AVAILABLE and client_tax_id and callable(get_vendor_code):
-        try:
-            code = get_vendor_code(
-                client_tax_id=client_tax_id,
-                vendor_tax_id=vendor_tax_id,
-                vendor_name="Lazada",
-            )
-            # accept only Cxxxxx as vendor code; else fallback "Lazada"
-            if isinstance(code, str) and re.match(r"^C\d{5}$", code.strip(), re.IGNORECASE):
-                return code.strip().upper()
-            return "Lazada"
-        except Exception:
-            return "Lazada"
-    return "Lazada"
-
-def extract_wht_from_text(text: str) -> Tuple[str, str]:
-    """Returns (rate, amount) like ('3%', '3219.71') - detection only."""
-    t = normalize_text(text or "")
+    return _RESOLVE_VENDOR(client_tax_id, vendor_tax_id)
 
-    m = RE_LAZADA_WHT_TEXT.search(t)
-    if m:
-        rate = f"{(m.group(1) or '').strip()}%"
-        amt = _safe_money(m.group(2))
-        return (rate, amt)
+def _apply_wht_rate(row: PeakRow, has_wht_3: bool) -> None:
+    row.P_wht = "3%" if has_wht_3 else ""
+    row.S_pnd = _PND53 if has_wht_3 else ""
+
+def _apply_wht_empty(row: PeakRow, has_wht_3: bool) -> None:
+    row.P_wht = ""   # ✅ blank policy
+    row.S_pnd = ""   # keep empty unless you explicitly want it
 
-    m2 = RE_LAZADA_WHT_EN.search(t)
-    if m2:
-        rate = f"{(m2.group(1) or '').strip()}%"
-        amt = _safe_money(m2.group(2))
-        return (rate, amt)
+# P_wht policy bound once at import from WHT_MODE
+_APPLY_WHT = _apply_wht_rate if WHT_MODE.upper() == "RATE" else _apply_wht_empty
+
+def extract_wht_from_text(text: str, normalized: Optional[str] = None) -> Tuple[str, str]:
+    """Returns (rate, amount) like ('3%', '3219.71') - detection only."""
+    t = normalized if normalized is not None else normalize_text(text or "")
+
+    hits = pattern_set_hits(_WHT_SET, t, len(_WHT_PATTERNS))
+    for idx, pat in enumerate(_WHT_PATTERNS):
+        if idx not in hits:
+            continue
+        m = pat.search(t)
+        if m:
+            rate = f"{(m.group(1) or '').strip()}%"
+            amt = _safe_money(m.group(2))
+            return (rate, amt)
 
     return ("", "")
 
-def extract_totals_block(text: str) -> Tuple[str, str, str]:
+def _scan_strict_totals(t: str) -> Dict[str, str]:
+    """
+    First raw amount per strict line kind ('ex' / 'vat' / 'inc').
+    Lines are split once; only lines holding "total"/"vat"/"%" are tried, with the
+    pattern anchored at that line start (it may still run onto the next line,
+    e.g. "Total" + newline + amount).
+    """
+    found: Dict[str, str] = {}
+    pos = 0
+    consumed = 0
+    for ln in t.split("\n"):
+        start = pos
+        pos += len(ln) + 1
+        if start < consumed:
+            continue
+        low = ln.lower()
+        if not any(k in low for k in _STRICT_LINE_KEYWORDS):
+            continue
+        m = RE_LAZADA_TOTALS_ANY.match(t, start)
+        if not m:
+            continue
+        consumed = m.end()
+        kind = m.lastgroup
+        if kind and kind not in found:
+            found[kind] = m.group(kind)
+            if len(found) == 3:
+                break
+    return found
+
+def extract_totals_block(text: str, normalized: Optional[str] = None) -> Tuple[str, str, str]:
     """
     Extract (total_ex_vat, vat_amount, total_inc_vat)
     - Strongest: totals block lines (multiline exact)
     - Fallback: inline forms
     """
-    t = normalize_text(text or "")
-
-    total_ex_vat = ""
-    vat_amount = ""
-    total_inc_vat = ""
-
-    # strict multiline (best)
-    m = RE_LAZADA_SUBTOTAL_TOTAL.search(t)
-    if m:
-        total_ex_vat = _safe_money(m.group(1))
+    t = normalized if normalized is not None else normalize_text(text or "")
+
+    hits = pattern_set_hits(_TOTALS_SET, t, len(_TOTALS_PATTERNS))
+
+    def _grab(idx: int) -> str:
+        if idx not in hits:
+            return ""
+        m = _TOTALS_PATTERNS[idx].search(t)
+        return _safe_money(m.group(1)) if m else ""
+
+    # strict multiline (best) - totals block sits at the end: scan only the tail
+    # when no line before it can start a strict match (else first match = full scan)
+    strict: Dict[str, str] = {}
+    if 0 in hits:
+        tail = text_tail(t)
+        head_low = t[: len(t) - len(tail)].lower()
+        if any(k in head_low for k in _STRICT_LINE_KEYWORDS):
+            tail = t
+        strict = _scan_strict_totals(tail)
+
+    total_ex_vat = _safe_money(strict["ex"]) if "ex" in strict else ""
+    vat_amount = _safe_money(strict["vat"]) if "vat" in strict else ""
+    total_inc_vat = _safe_money(strict["inc"]) if "inc" in strict else ""
+
+    # inline fallback (keyword prefilter first)
+    if not (total_inc_vat and total_ex_vat and vat_amount):
+        t_low = t.lower()
+
+        def _grab_inline(idx: int) -> str:
+            if not any(k in t_low for k in _INLINE_KEYWORDS[idx]):
+                return ""
+            return _grab(idx)
 
-    m = RE_LAZADA_VAT_7.search(t)
-    if m:
-        vat_amount = _safe_money(m.group(1))
-
-    m = RE_LAZADA_TOTAL_INC.search(t)
-    if m:
-        total_inc_vat = _safe_money(m.group(1))
-
-    # inline fallback
-    if not total_inc_vat:
-        m = RE_LAZADA_TOTAL_INC_INLINE.search(t)
-        if m:
-            total_inc_vat = _safe_money(m.group(1))
+        if not total_inc_vat:
+            total_inc_vat = _grab_inline(1)
 
-    if not total_ex_vat:
-        m = RE_LAZADA_SUBTOTAL_INLINE.search(t)
-        if m:
-            total_ex_vat = _safe_money(m.group(1))
+        if not total_ex_vat:
+            total_ex_vat = _grab_inline(2)
 
-    if not vat_amount:
-        m = RE_LAZADA_VAT_INLINE.search(t)
-        if m:
-            vat_amount = _safe_money(m.group(1))
+        if not vat_amount:
+            vat_amount = _grab_inline(3)
 
     return (total_ex_vat, vat_amount, total_inc_vat)
 
 def _derive_total_inc_vat(total_ex_vat: str, vat_amount: str) -> str:
     if not total_ex_vat or not vat_amount:
         return ""
-    v = _safe_float(total_ex_vat) + _safe_float(vat_amount)
+    # integer cents: no float round-trip / rounding drift
+    v = (money_to_cents(total_ex_vat) or 0) + (money_to_cents(vat_amount) or 0)
     if v <= 0:
         return ""
-    return f"{v:.2f}"
+    return cents_to_money(v)
 
-def _build_reference_no_space(text: str, filename: str = "") -> str:
+def _build_reference_no_space(text: str, filename: str = "", normalized: Optional[str] = None) -> str:
     """
     Lazada primary reference = THMPTI... token or Invoice No field.
     MUST have NO spaces/newlines (squash).
     """
-    t = normalize_text(text or "")
+    t = normalized if normalized is not None else normalize_text(text or "")
     fn = normalize_text(filename or "")
 
     # 1) THMPTI token anywhere (squashed)
-    m = RE_LAZADA_DOC_THMPTI.search(_squash_ws(t))
-    if m:
-        return _squash_ws(m.group(1))
+    ref = _find_thmpti_no_space(t)
+    if ref:
+        return ref
 
     # 2) Invoice No field
     m = RE_LAZADA_INVOICE_NO_FIELD.search(t)
@@ -286,9 +432,9 @@ def _build_reference_no_space(text: str, filename: str = "") -> str:
         return _squash_ws(m.group(1).strip())
 
     # 3) filename fallback
-    m = RE_LAZADA_DOC_THMPTI.search(_squash_ws(fn))
-    if m:
-        return _squash_ws(m.group(1))
+    ref = _find_thmpti_no_space(fn)
+    if ref:
+        return ref
 
     m = RE_LAZADA_INVOICE_NO_FIELD.search(fn)
     if m:
@@ -301,7 +447,7 @@ def _build_reference_no_space(text: str, filename: str = "") -> str:
 
     return ""
 
-def _enforce_ref_from_filename(row: Dict[str, Any], filename: str) -> None:
+def _enforce_ref_from_filename(row: PeakRow, filename: str) -> None:
     """
     Plan C: enforce C/G from filename at the end.
     If filename contains THMPTI... or an invoice token, overwrite C_reference & G_invoice_no.
@@ -310,14 +456,15 @@ def _enforce_ref_from_filename(row: Dict[str, Any], filename: str) -> None:
         return
     ref = _build_reference_no_space("", filename=filename)
     if ref:
-        row["C_reference"] = ref
-        row["G_invoice_no"] = ref
+        row.C_reference = ref
+        row.G_invoice_no = ref
 
 
 # ============================================================
 # Main
 # ============================================================
 
+@memoize_extractor()
 def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Dict[str, Any]:
     """
     Strict mapping:
@@ -342,28 +489,28 @@ def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Di
     """
     try:
         t = normalize_text(text or "")
-        row = base_row_dict()
+        row = PeakRow()
 
         # --------------------------
         # STEP 1: Vendor tax & code
         # --------------------------
         vendor_tax = find_vendor_tax_id(t, "Lazada") or VENDOR_LAZADA
-        row["E_tax_id_13"] = vendor_tax
+        row.E_tax_id_13 = vendor_tax
 
         # best-effort client tax id
         if not client_tax_id:
-            client_tax_id = _pick_client_tax_id(t)
+            client_tax_id = _pick_client_tax_id(t, normalized=t)
 
-        row["D_vendor_code"] = _get_vendor_code_safe(client_tax_id, vendor_tax)
-        row["F_branch_5"] = find_branch(t) or "00000"
+        row.D_vendor_code = _get_vendor_code_safe(client_tax_id, vendor_tax)
+        row.F_branch_5 = find_branch(t) or _BR0
 
         # --------------------------
         # STEP 2: Reference / Invoice No (NO SPACE)
         # --------------------------
-        full_ref = _build_reference_no_space(t, filename=filename)
+        full_ref = _build_reference_no_space(t, filename=filename, normalized=t)
         if full_ref:
-            row["G_invoice_no"] = full_ref
-            row["C_reference"] = full_ref
+            row.G_invoice_no = full_ref
+            row.C_reference = full_ref
 
         # --------------------------
         # STEP 3: Date (invoice date first)
@@ -376,14 +523,14 @@ def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Di
             doc_date = find_best_date(t) or ""
 
         if doc_date:
-            row["B_doc_date"] = doc_date
-            row["H_invoice_date"] = doc_date
-            row["I_tax_purchase_date"] = doc_date
+            row.B_doc_date = doc_date
+            row.H_invoice_date = doc_date
+            row.I_tax_purchase_date = doc_date
 
         # --------------------------
         # STEP 4: Amounts (STRICT)
         # --------------------------
-        total_ex_vat, vat_amount, total_inc_vat = extract_totals_block(t)
+        total_ex_vat, vat_amount, total_inc_vat = extract_totals_block(t, normalized=t)
 
         # derive inc vat if missing (ex + vat exists)
         if not total_inc_vat:
@@ -392,7 +539,7 @@ def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Di
                 total_inc_vat = derived
 
         # WHT detection (separate channel) - NEVER use as total
-        wht_rate, wht_amount_3pct = extract_wht_from_text(t)
+        wht_rate, wht_amount_3pct = extract_wht_from_text(t, normalized=t)
         has_wht_3 = (wht_rate == "3%" and bool(wht_amount_3pct))
 
         # FINAL fallback: common extractor, but reject if equals WHT
@@ -412,50 +559,43 @@ def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Di
         # --------------------------
         # STEP 5: PEAK mapping (strict)
         # --------------------------
-        row["M_qty"] = "1"
-        row["J_price_type"] = "1"
-        row["O_vat_rate"] = "7%"
-        row["Q_payment_method"] = "หักจากยอดขาย"
+        row.M_qty = "1"
+        row.J_price_type = "1"
+        row.O_vat_rate = _VAT7
+        row.Q_payment_method = _PAY_METHOD
 
+        # PeakRow() already holds "0" for N/R
         if total_inc_vat:
-            row["N_unit_price"] = total_inc_vat
-            row["R_paid_amount"] = total_inc_vat
-        else:
-            row["N_unit_price"] = row.get("N_unit_price") or "0"
-            row["R_paid_amount"] = row.get("R_paid_amount") or "0"
+            row.N_unit_price = total_inc_vat
+            row.R_paid_amount = total_inc_vat
 
         # --------------------------
         # STEP 6: P_wht policy
         # --------------------------
-        if WHT_MODE.upper() == "RATE":
-            row["P_wht"] = "3%" if has_wht_3 else ""
-            row["S_pnd"] = "53" if has_wht_3 else ""
-        else:
-            row["P_wht"] = ""   # ✅ blank policy
-            row["S_pnd"] = ""   # keep empty unless you explicitly want it
+        _APPLY_WHT(row, has_wht_3)
 
         # --------------------------
         # STEP 7: Base description/group (post-process may override)
         # --------------------------
-        row["L_description"] = "Marketplace Expense"
-        row["U_group"] = "Marketplace Expense"
+        row.L_description = _DESC_MP
+        row.U_group = _DESC_MP
 
         # Notes must be blank
-        row["T_note"] = ""
+        row.T_note = ""
 
         # K_account template (post-process is preferred)
-        row["K_account"] = ""
+        row.K_account = ""
 
         # --------------------------
         # STEP 8: Safety sync + strict squash
         # --------------------------
-        row["C_reference"] = _squash_ws(row.get("C_reference", ""))
-        row["G_invoice_no"] = _squash_ws(row.get("G_invoice_no", ""))
+        row.C_reference = _squash_ws(row.C_reference)
+        row.G_invoice_no = _squash_ws(row.G_invoice_no)
 
-        if not row.get("C_reference") and row.get("G_invoice_no"):
-            row["C_reference"] = row["G_invoice_no"]
-        if not row.get("G_invoice_no") and row.get("C_reference"):
-            row["G_invoice_no"] = row["C_reference"]
+        if not row.C_reference and row.G_invoice_no:
+            row.C_reference = row.G_invoice_no
+        if not row.G_invoice_no and row.C_reference:
+            row.G_invoice_no = row.C_reference
 
         # --------------------------
         # STEP 9: Plan C — enforce C/G from filename at end
@@ -463,65 +603,67 @@ def extract_lazada(text: str, client_tax_id: str = "", filename: str = "") -> Di
         _enforce_ref_from_filename(row, filename=filename)
 
         # after enforce: re-squash
-        row["C_reference"] = _squash_ws(row.get("C_reference", ""))
-        row["G_invoice_no"] = _squash_ws(row.get("G_invoice_no", ""))
+        row.C_reference = _squash_ws(row.C_reference)
+        row.G_invoice_no = _squash_ws(row.G_invoice_no)
 
         # --------------------------
         # STEP 10: Post-process (optional)
         # --------------------------
+        out = row.to_dict()
         if callable(post_process_peak_row):
             try:
-                row = post_process_peak_row(
-                    row=row,
+                out = post_process_peak_row(
+                    row=out,
                     platform="lazada",
                     filename=filename or "",
                     client_tax_id=_digits_only(client_tax_id) if client_tax_id else "",
                     text=t,
-                ) or row
+                ) or out
             except Exception:
                 # must never crash extractor
                 pass
 
-        return format_peak_row(row)
+        return format_peak_row(out)
 
     except Exception:
         # Fail-safe: never crash, stable output
-        row = base_row_dict()
-        row["D_vendor_code"] = "Lazada"
-        row["E_tax_id_13"] = VENDOR_LAZADA
-        row["F_branch_5"] = "00000"
-        row["M_qty"] = "1"
-        row["J_price_type"] = "1"
-        row["O_vat_rate"] = "7%"
-        row["P_wht"] = ""       # ✅ blank policy
-        row["S_pnd"] = ""
-        row["N_unit_price"] = "0"
-        row["R_paid_amount"] = "0"
-        row["Q_payment_method"] = "หักจากยอดขาย"
-        row["U_group"] = "Marketplace Expense"
-        row["L_description"] = "Marketplace Expense"
-        row["T_note"] = ""
-        row["K_account"] = ""
+        row = PeakRow()
+        row.D_vendor_code = _VENDOR_LABEL
+        row.E_tax_id_13 = VENDOR_LAZADA
+        row.F_branch_5 = _BR0
+        row.M_qty = "1"
+        row.J_price_type = "1"
+        row.O_vat_rate = _VAT7
+        row.P_wht = ""       # ✅ blank policy
+        row.S_pnd = ""
+        row.N_unit_price = "0"
+        row.R_paid_amount = "0"
+        row.Q_payment_method = _PAY_METHOD
+        row.U_group = _DESC_MP
+        row.L_description = _DESC_MP
+        row.T_note = ""
+        row.K_account = ""
 
         # enforce C/G from filename even in fail-safe
         _enforce_ref_from_filename(row, filename=filename or "")
-        row["C_reference"] = _squash_ws(row.get("C_reference", ""))
-        row["G_invoice_no"] = _squash_ws(row.get("G_invoice_no", ""))
+        row.C_reference = _squash_ws(row.C_reference)
+        row.G_invoice_no = _squash_ws(row.G_invoice_no)
 
         # post-process (optional)
+        out = row.to_dict()
         if callable(post_process_peak_row):
             try:
-                row = post_process_peak_row(
-                    row=row,
+                out = post_process_peak_row(
+                    row=out,
                     platform="lazada",
                     filename=filename or "",
                     client_tax_id=_digits_only(client_tax_id) if client_tax_id else "",
                     text=normalize_text(text or ""),
-                ) or row
+                ) or out
             except Exception:
                 pass
 
-        return format_peak_row(row)
+        return format_peak_row(out)
 
 
 __all__ = [
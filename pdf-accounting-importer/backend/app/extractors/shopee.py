@@ -3,10 +3,11 @@ from __future__ import annotations
 
 import os
 import re
-from typing import Any, Dict, Tuple
+import sys
+from typing import Any, Dict, Optional, Tuple
 
 from .common import (
-    base_row_dict,
+    PeakRow,
     normalize_text,
     find_vendor_tax_id,
     find_branch,
@@ -16,6 +17,13 @@ from .common import (
     extract_seller_info,
     format_peak_row,
     parse_money,
+    memoize_extractor,
+    money_to_cents,
+    cents_to_money,
+    compile_pattern_set,
+    pattern_set_hits,
+    WS_STRIP_TABLE,
+    text_tail,
 )
 
 # ========================================
@@ -38,6 +46,15 @@ except Exception:  # pragma: no cover
     CLIENT_SHD = "0105563022918"
     CLIENT_TOPONE = "0105565027615"
 
+# ========================================
+# Output policy constants (interned once, shared by every row)
+# ========================================
+_DESC_MP = sys.intern("Marketplace Expense")
+_PAY_METHOD = sys.intern("หักจากยอดขาย")
+_VAT7 = sys.intern("7%")
+_BR0 = sys.intern("00000")
+_PND53 = sys.intern("53")
+
 # ============================================================
 # Shopee-specific patterns
 # ============================================================
@@ -54,8 +71,10 @@ RE_SHOPEE_DOC_TRS_FORMAT = re.compile(
     re.IGNORECASE,
 )
 
+# TRS first: it is the common token (also inside TIV/TIR names) and a literal
+# prefix; the branches start with different letters so match results are unchanged
 RE_SHOPEE_DOC_STRICT = re.compile(
-    r"\b((?:Shopee-)?TI[VR]-[A-Z0-9]+-\d{5}-\d{6}-\d{7,}|TRS[A-Z0-9\-/]{10,})\b",
+    r"\b(TRS[A-Z0-9\-/]{10,}|(?:Shopee-)?TI[VR]-[A-Z0-9]+-\d{5}-\d{6}-\d{7,})\b",
     re.IGNORECASE,
 )
 
@@ -118,7 +137,26 @@ RE_SUM_EXCL_AFTER_DISCOUNT = re.compile(
     re.IGNORECASE,
 )
 
-RE_ALL_WS = re.compile(r"\s+")
+# Summary patterns in fixed order -> one hyperscan/RE2 pass tells which can match
+# (falls back to "all" when neither engine is installed)
+_SUMMARY_PATTERNS = (
+    RE_SUM_EXCL,
+    RE_SUM_EXCL_AFTER_DISCOUNT,
+    RE_SUM_VAT,
+    RE_SUM_INCL,
+)
+_SUMMARY_SET = compile_pattern_set(_SUMMARY_PATTERNS)
+
+# Literal (lowercase) each summary match starts with, per _SUMMARY_PATTERNS index
+_SUMMARY_KEYWORDS: Tuple[Tuple[str, ...], ...] = (
+    ("total",),
+    ("excluded",),
+    ("vat", "ภาษีมูลค่าเพิ่ม"),
+    ("total",),
+)
+
+_WHT_PATTERNS = (RE_SHOPEE_WHT_THAI, RE_SHOPEE_WHT_EN)
+_WHT_SET = compile_pattern_set(_WHT_PATTERNS)
 
 # ============================================================
 # Description / account template (override by ENV if you want)
@@ -156,7 +194,7 @@ def _digits_only(s: str) -> str:
 
 
 def _squash_all_ws(s: str) -> str:
-    return re.sub(r"\s+", "", s or "")
+    return (s or "").translate(WS_STRIP_TABLE)
 
 
 def _compact_ref(v: Any) -> str:
@@ -164,7 +202,7 @@ def _compact_ref(v: Any) -> str:
     s = s.strip()
     if not s:
         return ""
-    return RE_ALL_WS.sub("", s)
+    return s.translate(WS_STRIP_TABLE)
 
 
 def _clean_ref_code(mmdd: str, seq7: str) -> str:
@@ -189,18 +227,30 @@ def _vendor_code_fallback_for_shopee(client_tax_id: str) -> str:
     return "Unknown"
 
 
+def _vendor_code_from_mapping(client_tax_id: str, vendor_tax_id: str) -> str:
+    if not client_tax_id:
+        return _vendor_code_fallback_for_shopee(client_tax_id)
+    try:
+        code = get_vendor_code(
+            client_tax_id=client_tax_id,
+            vendor_tax_id=vendor_tax_id,
+            vendor_name="Shopee",
+        )
+        return code or _vendor_code_fallback_for_shopee(client_tax_id)
+    except Exception:
+        return _vendor_code_fallback_for_shopee(client_tax_id)
+
+
+# strategy bound once at import (mapping availability never changes at runtime)
+_RESOLVE_VENDOR = (
+    _vendor_code_from_mapping
+    if VENDOR_MAPPING_AVAILABLE
+    else lambda client_tax_id, _vendor_tax_id: _vendor_code_fallback_for_shopee(client_tax_id)
+)
+
+
 def _get_vendor_code_safe(client_tax_id: str, vendor_tax_id: str) -> str:
-    if VENDOR_MAPPING_AVAILABLE and client_tax_id:
-        try:
-            code = get_vendor_code(
-                client_tax_id=client_tax_id,
-                vendor_tax_id=vendor_tax_id,
-                vendor_name="Shopee",
-            )
-            return code or _vendor_code_fallback_for_shopee(client_tax_id)
-        except Exception:
-            return _vendor_code_fallback_for_shopee(client_tax_id)
-    return _vendor_code_fallback_for_shopee(client_tax_id)
+    return _RESOLVE_VENDOR(client_tax_id, vendor_tax_id)
 
 
 def _infer_shopee_reference_from_filename(filename: str) -> str:
@@ -238,8 +288,8 @@ def _infer_shopee_reference_from_filename(filename: str) -> str:
 # Seller ID helpers
 # ============================================================
 
-def extract_seller_id_shopee(text: str) -> Tuple[str, str]:
-    t = normalize_text(text)
+def extract_seller_id_shopee(text: str, normalized: Optional[str] = None) -> Tuple[str, str]:
+    t = normalized if normalized is not None else normalize_text(text)
     seller_id = ""
     username = ""
 
@@ -267,17 +317,15 @@ def extract_seller_id_shopee(text: str) -> Tuple[str, str]:
 def extract_wht_from_shopee_text(text: str) -> Tuple[str, str]:
     t = text or ""
 
-    m = RE_SHOPEE_WHT_THAI.search(t)
-    if m:
-        rate = f"{m.group(1)}%"
-        amount = _money(m.group(2))
-        return rate, amount
-
-    m2 = RE_SHOPEE_WHT_EN.search(t)
-    if m2:
-        rate = f"{m2.group(1)}%"
-        amount = _money(m2.group(2))
-        return rate, amount
+    hits = pattern_set_hits(_WHT_SET, t, len(_WHT_PATTERNS))
+    for idx, pat in enumerate(_WHT_PATTERNS):
+        if idx not in hits:
+            continue
+        m = pat.search(t)
+        if m:
+            rate = f"{m.group(1)}%"
+            amount = _money(m.group(2))
+            return rate, amount
 
     return "", ""
 
@@ -286,7 +334,7 @@ def extract_wht_from_shopee_text(text: str) -> Tuple[str, str]:
 # Reference extraction (NO whitespace allowed; handle newline split)
 # ============================================================
 
-def extract_shopee_full_reference(text: str, filename: str = "") -> str:
+def extract_shopee_full_reference(text: str, filename: str = "", normalized: Optional[str] = None) -> str:
     """
     FULL reference (compact; no whitespace):
       - TRS + MMDD-XXXXXXX (glue)
@@ -294,7 +342,7 @@ def extract_shopee_full_reference(text: str, filename: str = "") -> str:
     Handles real case:
       "No. TRSPEMKP00-00000-25" then next line "1203-0012589" -> glue.
     """
-    t = normalize_text(text or "")
+    t = normalized if normalized is not None else normalize_text(text or "")
     fn = normalize_text(filename or "")
 
     # 1) direct pattern (with whitespace)
@@ -373,32 +421,35 @@ def extract_shopee_full_reference(text: str, filename: str = "") -> str:
 # Amount extraction (summary-first)
 # ============================================================
 
-def extract_amounts_shopee_summary(text: str) -> Dict[str, str]:
-    t = normalize_text(text or "")
-
-    subtotal = ""
-    vat = ""
-    total = ""
+def extract_amounts_shopee_summary(text: str, normalized: Optional[str] = None) -> Dict[str, str]:
+    t = normalized if normalized is not None else normalize_text(text or "")
+
+    hits = pattern_set_hits(_SUMMARY_SET, t, len(_SUMMARY_PATTERNS))
+    tail = text_tail(t)
+    head_low = t[: len(t) - len(tail)].lower()
+
+    # summary block sits at the end: the tail alone is enough when the text
+    # before it holds no leading keyword of the pattern (else keep first match)
+    def _grab(idx: int) -> str:
+        if idx not in hits:
+            return ""
+        pat = _SUMMARY_PATTERNS[idx]
+        if any(k in head_low for k in _SUMMARY_KEYWORDS[idx]):
+            m = pat.search(t)
+        else:
+            m = pat.search(tail)
+        return _money(m.group(1)) if m else ""
 
     # subtotal
-    m = RE_SUM_EXCL.search(t)
-    if m:
-        subtotal = _money(m.group(1))
-
+    subtotal = _grab(0)
     if not subtotal:
-        m2 = RE_SUM_EXCL_AFTER_DISCOUNT.search(t)
-        if m2:
-            subtotal = _money(m2.group(1))
+        subtotal = _grab(1)
 
     # vat
-    m = RE_SUM_VAT.search(t)
-    if m:
-        vat = _money(m.group(1))
+    vat = _grab(2)
 
     # total
-    m = RE_SUM_INCL.search(t)
-    if m:
-        total = _money(m.group(1))
+    total = _grab(3)
 
     # withholding detection only (do NOT write to P_wht)
     wht_rate, wht_amount = extract_wht_from_shopee_text(t)
@@ -471,7 +522,7 @@ def post_process_peak_row(
     # Keep your current default labels but allow richer description.
     ref = row.get("C_reference") or row.get("G_invoice_no") or ""
     if not row.get("L_description"):
-        row["L_description"] = "Marketplace Expense"
+        row["L_description"] = _DESC_MP
     if not row.get("U_group"):
         row["U_group"] = row["L_description"]
 
@@ -496,6 +547,7 @@ def post_process_peak_row(
 #   ✅ number policy: N & R = total(incl VAT) as your latest requirement
 # ============================================================
 
+@memoize_extractor()
 def extract_shopee(text: str, client_tax_id: str = "", filename: str = "") -> Dict[str, Any]:
     """
     Extract Shopee receipt/tax invoice to PEAK A-U.
@@ -509,22 +561,22 @@ def extract_shopee(text: str, client_tax_id: str = "", filename: str = "") -> Di
       4) P_wht must stay blank ALWAYS (WHT only used for S_pnd detection)
     """
     t = normalize_text(text)
-    row = base_row_dict()
+    row = PeakRow()
 
     # Vendor tax + vendor code
     vendor_tax = find_vendor_tax_id(t, "Shopee") or VENDOR_SHOPEE
-    row["E_tax_id_13"] = vendor_tax
-    row["D_vendor_code"] = _get_vendor_code_safe(client_tax_id, vendor_tax)
+    row.E_tax_id_13 = vendor_tax
+    row.D_vendor_code = _get_vendor_code_safe(client_tax_id, vendor_tax)
 
     # Branch (Shopee invoices often "Head Office"; you want 00000 for unknown)
-    row["F_branch_5"] = find_branch(t) or "00000"
+    row.F_branch_5 = find_branch(t) or _BR0
 
     # Full reference (glued, no whitespace) from text or filename
-    full_ref = extract_shopee_full_reference(t, filename=filename)
+    # (every return path of extract_shopee_full_reference is already compact)
+    full_ref = extract_shopee_full_reference(t, filename=filename, normalized=t)
     if full_ref:
-        full_ref = _compact_ref(full_ref)
-        row["G_invoice_no"] = full_ref
-        row["C_reference"] = full_ref
+        row.G_invoice_no = full_ref
+        row.C_reference = full_ref
 
     # Dates
     date = ""
@@ -539,12 +591,12 @@ def extract_shopee(text: str, client_tax_id: str = "", filename: str = "") -> Di
         date = find_best_date(t) or ""
 
     if date:
-        row["B_doc_date"] = date
-        row["H_invoice_date"] = date
-        row["I_tax_purchase_date"] = date
+        row.B_doc_date = date
+        row.H_invoice_date = date
+        row.I_tax_purchase_date = date
 
     # Amounts (summary first; fallback later)
-    sums = extract_amounts_shopee_summary(t)
+    sums = extract_amounts_shopee_summary(t, normalized=t)
     subtotal = sums.get("subtotal", "")
     vat = sums.get("vat", "")
     total = sums.get("total", "")
@@ -566,50 +618,48 @@ def extract_shopee(text: str, client_tax_id: str = "", filename: str = "") -> Di
     # ----------------------------
     # You asked: "การคำนวณตัวเลข ให้ถูกทุกไฟล์" + finish by post-process.
     # For Shopee TIV/TRS invoices: safest is to map Total (Included VAT) as the main expense total.
-    row["M_qty"] = "1"
-    row["J_price_type"] = "1"
-    row["O_vat_rate"] = "7%"
+    row.M_qty = "1"
+    row.J_price_type = "1"
+    row.O_vat_rate = _VAT7
 
     main_total = total or ""
     if (not main_total) and subtotal and vat:
-        try:
-            main_total = f"{(float(subtotal) + float(vat)):.2f}"
-        except Exception:
-            main_total = ""
+        sub_c, vat_c = money_to_cents(subtotal), money_to_cents(vat)
+        main_total = cents_to_money(sub_c + vat_c) if sub_c is not None and vat_c is not None else ""
 
     if main_total:
-        row["N_unit_price"] = main_total
-        row["R_paid_amount"] = main_total
+        row.N_unit_price = main_total
+        row.R_paid_amount = main_total
     elif subtotal:
-        row["N_unit_price"] = subtotal
-        row["R_paid_amount"] = subtotal
+        row.N_unit_price = subtotal
+        row.R_paid_amount = subtotal
     else:
-        row["N_unit_price"] = "0"
-        row["R_paid_amount"] = "0"
+        row.N_unit_price = "0"
+        row.R_paid_amount = "0"
 
     # WHT policy
-    row["P_wht"] = ""  # ALWAYS blank
-    row["S_pnd"] = "53" if wht_amount else ""
+    row.P_wht = ""  # ALWAYS blank
+    row.S_pnd = _PND53 if wht_amount else ""
 
     # Payment method (wallet mapping can override later in job_worker)
-    row["Q_payment_method"] = "หักจากยอดขาย"
+    row.Q_payment_method = _PAY_METHOD
 
     # Default group/desc (post_process will template it if ENV is set)
-    row["L_description"] = "Marketplace Expense"
-    row["U_group"] = "Marketplace Expense"
-    row["T_note"] = ""
+    row.L_description = _DESC_MP
+    row.U_group = _DESC_MP
+    row.T_note = ""
 
     # ----------------------------
     # ✅ Required finishing step
     # ----------------------------
-    row = post_process_peak_row(
-        row,
+    out = post_process_peak_row(
+        row.to_dict(),
         filename=filename,
         client_tax_id=client_tax_id,
         platform="shopee",
     )
 
-    return format_peak_row(row)
+    return format_peak_row(out)
 
 
 __all__ = [
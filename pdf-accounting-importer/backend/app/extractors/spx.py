@@ -2,8 +2,9 @@
 # backend/app/extractors/spx.py
 from __future__ import annotations
 
+import functools
 import re
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
 
 from .common import (
     base_row_dict,
@@ -15,58 +16,100 @@ from .common import (
     extract_amounts,
     format_peak_row,
     parse_money,
+    compile_regex,
 )
+from ._scanner import MatchIndex, register_patterns, scan_text
 
 WHT_RATE_MODE = "AUTO"
 
-try:
-    from .vendor_mapping import get_vendor_code, VENDOR_SPX, CLIENT_RABBIT, CLIENT_SHD, CLIENT_TOPONE
-    VENDOR_MAPPING_AVAILABLE = True
-except Exception:
-    VENDOR_MAPPING_AVAILABLE = False
-    VENDOR_SPX = "0105561164871"
-    CLIENT_RABBIT = "0105561071873"
-    CLIENT_SHD    = "0105563022918"
-    CLIENT_TOPONE = "0105565027615"
+# same values as vendor_mapping; vendor_mapping itself is imported lazily
+# (first vendor-code lookup) so loading spx doesn't pay for its tables/regexes
+VENDOR_SPX = "0105561164871"
+CLIENT_RABBIT = "0105561071873"
+CLIENT_SHD    = "0105563022918"
+CLIENT_TOPONE = "0105565027615"
 
+_VM = None
+_VM_CHECKED = False
 
-RE_SPX_DOCNO = re.compile(
+
+def _vendor_mapping():
+    """vendor_mapping module, or None if it can't be imported (checked once)"""
+    global _VM, _VM_CHECKED
+    if not _VM_CHECKED:
+        try:
+            from . import vendor_mapping as vm
+        except Exception:
+            vm = None
+        _VM = vm
+        _VM_CHECKED = True
+    return _VM
+
+
+RE_SPX_DOCNO = compile_regex(
     r"(?:เลขที่|No\.?)\s*[:#：]?\s*(RCS[A-Z0-9\-/]{8,})",
     re.IGNORECASE,
 )
-RE_SPX_FULL_REFERENCE = re.compile(
+RE_SPX_FULL_REFERENCE = compile_regex(
     r"\b(RCS[A-Z0-9\-/]{8,})\s+(\d{4})\s*-\s*(\d{7})\b",
     re.IGNORECASE,
 )
-RE_SPX_REF_CODE_FLEX = re.compile(r"\b(\d{4})\s*-\s*(\d{7})\b")
-
-RE_TOTAL_INC_VAT = re.compile(
-    r"(?:รวม\s*ทั้ง\s*สิ้น|Total\s*(?:amount)?\s*\(?(?:including|incl\.?)\s*VAT\)?|Grand\s*Total|จำนวนเงินรวม)\s*[:#：]?\s*฿?\s*([0-9,]+(?:\.[0-9]{1,2})?)",
+RE_SPX_REF_CODE_FLEX = compile_regex(r"\b(\d{4})\s*-\s*(\d{7})\b")
+# ultimate fallback (ข้อความที่ squash whitespace แล้ว)
+_RE_SPX_DOCNO_BARE = compile_regex(r"(RCS[A-Z0-9\-/]{8,})", re.IGNORECASE)
+_RE_SPX_REF_CODE_BARE = compile_regex(r"(\d{4})-(\d{7})")
+
+# ✅ amounts: keyword ทุกชนิดอยู่ใน alternation เดียว (named group = ชนิด)
+#    สแกนเอกสารรอบเดียว แล้วค่อย match ตัวเลขต่อท้าย keyword ด้วย regex สั้นๆ
+_AMOUNT_KEY_PARTS: Tuple[Tuple[str, str], ...] = (
+    ("inc", r"รวม\s*ทั้ง\s*สิ้น|Total\s*(?:amount)?\s*\(?(?:including|incl\.?)\s*VAT\)?|Grand\s*Total|จำนวนเงินรวม"),
+    ("ex", r"ก่อน\s*ภาษี|Subtotal\s*\(?(?:excluding|excl\.?)\s*VAT\)?|Total\s*excluding\s*VAT"),
+    ("vat", r"ภาษีมูลค่าเพิ่ม|VAT"),
+    ("wht_th", r"หักภาษีเงินได้\s*ณ\s*ที่จ่าย"),
+    ("wht_en", r"withholding\s+tax"),
+)
+RE_SPX_AMOUNT_KEYS = re.compile(
+    "|".join(f"(?P<{kind}>{rx})" for kind, rx in _AMOUNT_KEY_PARTS),
     re.IGNORECASE,
 )
-RE_TOTAL_EX_VAT = re.compile(
-    r"(?:ก่อน\s*ภาษี|Subtotal\s*\(?(?:excluding|excl\.?)\s*VAT\)?|Total\s*excluding\s*VAT)\s*[:#：]?\s*฿?\s*([0-9,]+(?:\.[0-9]{1,2})?)",
+# (RE_SPX_AMOUNT_KEYS อยู่บน `re` เสมอ: ใช้ m.lastgroup แยกชนิด)
+# shared scanner (hyperscan / RE2 set ถ้ามี): บอกได้ในรอบเดียวว่า keyword ชนิดไหนมีในเอกสารบ้าง
+_SCAN_AMOUNT_KEYS = register_patterns(
+    "spx.amount_keys",
+    tuple(re.compile(rx, re.IGNORECASE) for _kind, rx in _AMOUNT_KEY_PARTS),
+)
+_AMOUNT_TAIL = r"\s*[:#：]?\s*฿?\s*([0-9,]+(?:\.[0-9]{1,2})?)"
+RE_SPX_AMOUNT_TAIL = compile_regex(_AMOUNT_TAIL)
+RE_SPX_VAT_TAIL = compile_regex(r"\s*(?:7\s*%|7%|@?\s*7%)?" + _AMOUNT_TAIL)
+
+# ✅ WHT: anchor (ใน RE_SPX_AMOUNT_KEYS) -> ตัด window สั้นๆ -> หา rate แล้วค่อยหา amount หลัง rate
+#    (แทน `.*?` + DOTALL ทั้งเอกสาร ซึ่ง backtrack หนักบน OCR ยาวๆ)
+RE_SPX_WHT_TH_RATE = compile_regex(r"อัตรา(?:ร้อย)?ละ\s*(\d+)\s*%", re.IGNORECASE)
+RE_SPX_WHT_TH_AMOUNT = compile_regex(
+    r"(?:เป็นจำนวนเงิน|จำนวน)\s*([0-9,]+(?:\.[0-9]{1,2})?)",
     re.IGNORECASE,
 )
-RE_VAT_AMOUNT = re.compile(
-    r"(?:ภาษีมูลค่าเพิ่ม|VAT)\s*(?:7\s*%|7%|@?\s*7%)?\s*[:#：]?\s*฿?\s*([0-9,]+(?:\.[0-9]{1,2})?)",
+RE_SPX_WHT_EN_RATE = compile_regex(r"(\d+)\s*%")
+RE_SPX_WHT_EN_AMOUNT = compile_regex(
+    r"(?:at|=)\s*([0-9,]+(?:\.[0-9]{1,2})?)\s*THB",
     re.IGNORECASE,
 )
+_WHT_WINDOW = 240
 
-RE_SPX_WHT_TH = re.compile(
-    r"หักภาษีเงินได้\s*ณ\s*ที่จ่าย.*?อัตรา(?:ร้อย)?ละ\s*(\d+)\s*%.*?(?:เป็นจำนวนเงิน|จำนวน)\s*([0-9,]+(?:\.[0-9]{1,2})?)",
-    re.IGNORECASE | re.DOTALL,
-)
-RE_SPX_WHT_EN = re.compile(
-    r"withholding\s+tax.*?(\d+)\s*%.*?(?:at|=)\s*([0-9,]+(?:\.[0-9]{1,2})?)\s*THB",
-    re.IGNORECASE | re.DOTALL,
-)
+_NUM_RE = re.compile(r"\s*-?[0-9][0-9,]*(?:\.[0-9]{1,2})?\s*")
 
-RE_WHT_HINT = re.compile(r"(withholding\s+tax|หักภาษี|ณ\s*ที่จ่าย|wht)", re.IGNORECASE)
+RE_WHT_HINT = compile_regex(r"(withholding\s+tax|หักภาษี|ณ\s*ที่จ่าย|wht)", re.IGNORECASE)
+
+def _has_rcs(s: str) -> bool:
+    """
+    ✅ prefilter ก่อนรัน regex DOCNO (IGNORECASE): ไม่มี "rcs" = ไม่มีทาง match
+    DOCNO จริงเป็นตัวใหญ่เกือบทั้งหมด -> เช็ค "RCS" ก่อน ค่อย lower() ทั้งก้อน
+    """
+    return "RCS" in s or "rcs" in s.lower()
 
 
 def _squash_all_ws(s: str) -> str:
-    return re.sub(r"\s+", "", s or "")
+    return "".join(s.split()) if s else ""
 
 def _clean_ref_code(mmdd: str, seq7: str) -> str:
     return f"{mmdd}-{seq7}"
@@ -78,6 +121,7 @@ def _extract_ref_code_anywhere(raw_text: str) -> str:
         return ""
     return _clean_ref_code(m.group(1), m.group(2))
 
+@functools.lru_cache(maxsize=256)
 def _vendor_code_fallback_for_spx(client_tax_id: str) -> str:
     cid = _squash_all_ws(str(client_tax_id or ""))
     if cid == CLIENT_TOPONE:
@@ -88,10 +132,12 @@ def _vendor_code_fallback_for_spx(client_tax_id: str) -> str:
         return "C00563"
     return "Unknown"
 
+@functools.lru_cache(maxsize=256)
 def _get_vendor_code_safe(client_tax_id: str, vendor_tax_id: str) -> str:
-    if VENDOR_MAPPING_AVAILABLE and client_tax_id:
+    vm = _vendor_mapping() if client_tax_id else None
+    if vm is not None:
         try:
-            code = get_vendor_code(
+            code = vm.get_vendor_code(
                 client_tax_id=client_tax_id,
                 vendor_tax_id=vendor_tax_id,
                 vendor_name="SPX",
@@ -101,66 +147,119 @@ def _get_vendor_code_safe(client_tax_id: str, vendor_tax_id: str) -> str:
             return _vendor_code_fallback_for_spx(client_tax_id)
     return _vendor_code_fallback_for_spx(client_tax_id)
 
+def _full_reference_from(s: str) -> str:
+    """DOCNO + ref จาก s (text หรือ filename ที่ normalize แล้ว); "" ถ้าไม่เจอ DOCNO"""
+    m = RE_SPX_FULL_REFERENCE.search(s)
+    if m:
+        return f"{m.group(1)}{_clean_ref_code(m.group(2), m.group(3))}"
+
+    m_doc = RE_SPX_DOCNO.search(s)
+    doc = m_doc.group(1) if m_doc else ""
+    if doc:
+        return f"{doc}{_extract_ref_code_anywhere(s)}"
+    return ""
+
 def extract_spx_full_reference(text: str, filename: str = "") -> str:
     """
     ✅ Force Full Reference = DOCNO + MMDD-XXXXXXX (NO SPACES)
+    - DOCNO/ref มาจาก regex ที่ไม่มี whitespace อยู่แล้ว ไม่ต้อง squash ซ้ำ
     """
     t_norm = normalize_text(text or "")
     f_norm = normalize_text(filename or "")
 
-    m = RE_SPX_FULL_REFERENCE.search(t_norm)
-    if m:
-        doc = m.group(1)
-        ref = _clean_ref_code(m.group(2), m.group(3))
-        return _squash_all_ws(f"{doc}{ref}")
-
-    m_doc = RE_SPX_DOCNO.search(t_norm)
-    doc = m_doc.group(1) if m_doc else ""
-    if doc:
-        ref = _extract_ref_code_anywhere(t_norm)
-        if ref:
-            return _squash_all_ws(f"{doc}{ref}")
-        return _squash_all_ws(doc)
-
-    # filename fallback
-    m = RE_SPX_FULL_REFERENCE.search(f_norm)
-    if m:
-        doc = m.group(1)
-        ref = _clean_ref_code(m.group(2), m.group(3))
-        return _squash_all_ws(f"{doc}{ref}")
-
-    m_doc = RE_SPX_DOCNO.search(f_norm)
-    doc = m_doc.group(1) if m_doc else ""
-    if doc:
-        ref = _extract_ref_code_anywhere(f_norm)
-        if ref:
-            return _squash_all_ws(f"{doc}{ref}")
-        return _squash_all_ws(doc)
+    # text ก่อน แล้วค่อย filename fallback
+    for src in (t_norm, f_norm):
+        if src and _has_rcs(src):
+            ref = _full_reference_from(src)
+            if ref:
+                return ref
 
     # ultimate fallback on squashed
     t_sq = _squash_all_ws(t_norm)
-    m_doc2 = re.search(r"(RCS[A-Z0-9\-/]{8,})", t_sq, flags=re.IGNORECASE)
-    m_ref2 = re.search(r"(\d{4})-(\d{7})", t_sq)
+    if not _has_rcs(t_sq):
+        return ""
+    m_doc2 = _RE_SPX_DOCNO_BARE.search(t_sq)
+    m_ref2 = _RE_SPX_REF_CODE_BARE.search(t_sq)
     if m_doc2 and m_ref2:
         doc = m_doc2.group(1)
         ref = _clean_ref_code(m_ref2.group(1), m_ref2.group(2))
-        return _squash_all_ws(f"{doc}{ref}")
+        return f"{doc}{ref}"
 
     return ""
 
 def _safe_float(s: str) -> float:
+    s = str(s)
+    # ✅ fast path: ตัวเลขปกติ (ไม่ต้องเข้า try/except)
+    if _NUM_RE.fullmatch(s):
+        return float(s.replace(",", ""))
     try:
-        return float(str(s).replace(",", "").strip())
+        return float(s.replace(",", "").strip())
     except Exception:
         return 0.0
 
+def _wht_in_window(t: str, start: int, re_rate: re.Pattern, re_amount: re.Pattern) -> Tuple[str, str]:
+    """(rate, raw_amount) จาก window หลัง anchor; ("", "") ถ้าไม่เจอ"""
+    window = t[start: start + _WHT_WINDOW]
+    mr = re_rate.search(window)
+    if not mr:
+        return "", ""
+    ma = re_amount.search(window, mr.end())
+    if not ma:
+        return "", ""
+    return mr.group(1), ma.group(1)
+
+_WHT_PATTERNS = {
+    "wht_th": (RE_SPX_WHT_TH_RATE, RE_SPX_WHT_TH_AMOUNT),
+    "wht_en": (RE_SPX_WHT_EN_RATE, RE_SPX_WHT_EN_AMOUNT),
+}
+
+def _scan_amounts_spx(t: str, index: Optional[MatchIndex] = None) -> Dict[str, Tuple[int, int, str]]:
+    """
+    One pass over RE_SPX_AMOUNT_KEYS.
+    Return first hit per kind -> (start, end, raw_amount)
+    - inc/ex/vat: keyword + ตัวเลขต่อท้าย (span ใช้เช็ค WHT context)
+    - wht_th/wht_en: anchor ตัวแรกที่มี rate + amount ใน window
+    - เลื่อน pos ทีละ start+1 เพื่อไม่พลาด keyword ที่ซ้อนกัน (เช่น VAT ใน "incl VAT")
+    """
+    found: Dict[str, Tuple[int, int, str]] = {}
+    # kind ที่ keyword ไม่อยู่ในเอกสารเลย หาไม่เจอแน่นอน -> หยุดได้เมื่อครบเท่าที่มี
+    want = len((index or scan_text(t)).hits(_SCAN_AMOUNT_KEYS))
+    if not want:
+        return found
+    search = RE_SPX_AMOUNT_KEYS.search
+    pos = 0
+    while True:
+        m = search(t, pos)
+        if not m:
+            break
+        pos = m.start() + 1
+        kind = m.lastgroup
+        if not kind or kind in found:
+            continue
+        if kind in _WHT_PATTERNS:
+            _rate, raw = _wht_in_window(t, m.end(), *_WHT_PATTERNS[kind])
+            if raw:
+                found[kind] = (m.start(), m.end(), raw)
+        else:
+            tail = RE_SPX_VAT_TAIL if kind == "vat" else RE_SPX_AMOUNT_TAIL
+            mt = tail.match(t, m.end())
+            if mt:
+                found[kind] = (m.start(), mt.end(), mt.group(1))
+        if len(found) == want:
+            break
+    return found
+
+def _near_wht_hint(t: str, start: int, end: int) -> bool:
+    return bool(RE_WHT_HINT.search(t[max(0, start - 60): end + 60]))
+
+@functools.lru_cache(maxsize=1024)
 def _money(s: str) -> str:
     try:
         return parse_money(s) or ""
     except Exception:
         return ""
 
-def _extract_amounts_spx_strict(t: str) -> Tuple[str, str, str, str, bool]:
+def _extract_amounts_spx_strict(t: str, index: Optional[MatchIndex] = None) -> Tuple[str, str, str, str, bool]:
     """
     Return (total_ex_vat, vat_amount, total_inc_vat, wht_amount, has_wht)
     - กัน WHT ไปทับ total
@@ -170,53 +269,41 @@ def _extract_amounts_spx_strict(t: str) -> Tuple[str, str, str, str, bool]:
     total_inc_vat = ""
     wht_amount = ""
     has_wht = False
+    hits = _scan_amounts_spx(t, index)
 
-    # WHT (separate)
-    m = RE_SPX_WHT_TH.search(t)
-    if m:
-        rate = (m.group(1) or "").strip()
-        amt = _money(m.group(2))
+    # WHT (separate) — Thai ก่อน แล้วค่อย EN
+    for kind in ("wht_th", "wht_en"):
+        hit = hits.get(kind)
+        amt = _money(hit[2]) if hit else ""
         if amt:
             wht_amount = amt
             has_wht = True
-
-    if not has_wht:
-        m = RE_SPX_WHT_EN.search(t)
-        if m:
-            rate = (m.group(1) or "").strip()
-            amt = _money(m.group(2))
-            if amt:
-                wht_amount = amt
-                has_wht = True
+            break
 
     # totals
-    m = RE_TOTAL_INC_VAT.search(t)
-    if m:
-        ctx = t[max(0, m.start() - 60): m.end() + 60]
-        if not RE_WHT_HINT.search(ctx):
-            total_inc_vat = _money(m.group(1))
-
-    m = RE_TOTAL_EX_VAT.search(t)
-    if m:
-        ctx = t[max(0, m.start() - 60): m.end() + 60]
-        if not RE_WHT_HINT.search(ctx):
-            total_ex_vat = _money(m.group(1))
-
-    m = RE_VAT_AMOUNT.search(t)
-    if m:
-        ctx = t[max(0, m.start() - 60): m.end() + 60]
-        if not RE_WHT_HINT.search(ctx):
-            vat_amount = _money(m.group(1))
-
-    # Derive
-    if not total_inc_vat and total_ex_vat and vat_amount:
-        v = _safe_float(total_ex_vat) + _safe_float(vat_amount)
-        if v > 0:
-            total_inc_vat = f"{v:.2f}"
-    if not total_ex_vat and total_inc_vat and vat_amount:
-        v = _safe_float(total_inc_vat) - _safe_float(vat_amount)
-        if v > 0:
-            total_ex_vat = f"{v:.2f}"
+    hit = hits.get("inc")
+    if hit and not _near_wht_hint(t, hit[0], hit[1]):
+        total_inc_vat = _money(hit[2])
+
+    hit = hits.get("ex")
+    if hit and not _near_wht_hint(t, hit[0], hit[1]):
+        total_ex_vat = _money(hit[2])
+
+    hit = hits.get("vat")
+    if hit and not _near_wht_hint(t, hit[0], hit[1]):
+        vat_amount = _money(hit[2])
+
+    # Derive — มีแค่ฝั่งเดียว (inc หรือ ex) + vat; parse vat เป็น float ครั้งเดียว
+    if vat_amount and bool(total_inc_vat) != bool(total_ex_vat):
+        vat_f = _safe_float(vat_amount)
+        if total_ex_vat:
+            v = _safe_float(total_ex_vat) + vat_f
+            if v > 0:
+                total_inc_vat = f"{v:.2f}"
+        else:
+            v = _safe_float(total_inc_vat) - vat_f
+            if v > 0:
+                total_ex_vat = f"{v:.2f}"
 
     # fallback common.extract_amounts
     if not total_inc_vat:
@@ -239,6 +326,7 @@ def extract_spx(text: str, client_tax_id: str = "", filename: str = "") -> Dict[
     """
     try:
         t = normalize_text(text or "")
+        index = scan_text(t)
         row = base_row_dict()
 
         vendor_tax = find_vendor_tax_id(t, "SPX") or VENDOR_SPX
@@ -264,7 +352,7 @@ def extract_spx(text: str, client_tax_id: str = "", filename: str = "") -> Dict[
         row["_seller_id"] = info.get("seller_id", "") or ""
         row["_username"] = info.get("username", "") or ""
 
-        total_ex_vat, vat_amount, total_inc_vat, wht_amount, has_wht = _extract_amounts_spx_strict(t)
+        total_ex_vat, vat_amount, total_inc_vat, wht_amount, has_wht = _extract_amounts_spx_strict(t, index)
 
         if total_inc_vat:
             row["N_unit_price"] = total_inc_vat
@@ -3,11 +3,74 @@ Thai Tax Invoice Extractor
 Extracts data from Thai tax invoices (ใบเสร็จรับเงิน/ใบกำกับภาษี)
 """
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import re
 
+from ._scanner import MatchIndex, register_patterns, scan_text
 
-def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str = "") -> Dict[str, Any]:
+
+# ============================================================
+# Precompiled patterns
+# ============================================================
+_RE_TTI_INV_NO = re.compile(r"เลขที่\s*[:\s]+([0-9]+)")
+_RE_TTI_DATE = re.compile(r"(?:ใบเสร็จวันที่|วันที่)[:\s]*(\d{1,2})/(\d{1,2})/(\d{4})")
+_RE_TTI_TAXID = re.compile(r"(?:เลขประจำตัวผู้เสียภาษี|Tax ID)[:\s]*(\d{13})")
+_RE_TTI_VENDOR = re.compile(r"(บริษัท[^0-9\n]+?)(?=เลขประจำตัวผู้เสียภาษี)", re.DOTALL)
+_RE_TTI_WS = re.compile(r"\s+")
+_RE_TTI_BRANCH = re.compile(r"สาขาที่[:\s]*(\d{5})")
+# Pattern: "รวมยอดที่ต้ระ: 1,841.00" or "รวมทั้งสิ้น"
+# keyword เรียงตาม priority (k0 ดีสุด) — regex เดียว สแกนรอบเดียว
+_RE_TTI_AMOUNTS = re.compile(
+    r"(?:(?P<k0>รวมยอดที่ต้?ระ)|(?P<k1>รวมทั้งสิ้น)|(?P<k2>ยอดรวม)|(?P<k3>รวม))"
+    r"[:\s]*(?P<amt>[\d,]+\.?\d*)"
+)
+_TTI_AMOUNT_KEYS = ("k0", "k1", "k2", "k3")
+# ทุก keyword มี "รวม" อยู่ในตัว; "ยอดรวม" เริ่มก่อน "รวม" 3 ตัวอักษร
+_TTI_AMOUNT_ANCHOR = "รวม"
+_TTI_AMOUNT_LEAD = len("ยอด")
+_RE_TTI_VAT = re.compile(r"ภาษีมูลค่าเพิ่ม[:\s]*([\d,]+\.?\d*)")
+
+# shared scanner: one pass tells which of these can match (index = tuple order)
+# (_RE_TTI_VENDOR ใช้ lookahead -> ไม่ลงทะเบียน; รันหลังเจอ tax id อยู่แล้ว)
+_SCAN_TTI = register_patterns(
+    "thai_tax_invoice",
+    (_RE_TTI_INV_NO, _RE_TTI_DATE, _RE_TTI_TAXID, _RE_TTI_BRANCH, _RE_TTI_AMOUNTS, _RE_TTI_VAT),
+)
+_I_INV_NO, _I_DATE, _I_TAXID, _I_BRANCH, _I_AMOUNTS, _I_VAT = range(6)
+
+
+def _find_total_amount(text: str) -> str:
+    """
+    Raw amount of the highest-priority keyword found anywhere in text
+    (same result as trying each keyword pattern in order). "" if none.
+    - เลื่อน pos ทีละ start+1 กัน match ซ้อนกัน (เช่น "รวม" ใน "ยอดรวม")
+    """
+    best_rank = len(_TTI_AMOUNT_KEYS)
+    best = ""
+    # ✅ ไม่มี "รวม" = ไม่มีทาง match; มี -> เริ่มสแกนจากตรงนั้นเลย (str.find เร็วกว่า regex มาก)
+    idx = text.find(_TTI_AMOUNT_ANCHOR)
+    if idx < 0:
+        return best
+    search = _RE_TTI_AMOUNTS.search
+    pos = max(0, idx - _TTI_AMOUNT_LEAD)
+    while best_rank:
+        m = search(text, pos)
+        if not m:
+            break
+        pos = m.start() + 1
+        for rank, key in enumerate(_TTI_AMOUNT_KEYS[:best_rank]):
+            if m.group(key) is not None:
+                best_rank, best = rank, m.group("amt")
+                break
+    return best
+
+
+def extract_thai_tax_invoice(
+    text: str,
+    filename: str = "",
+    client_tax_id: str = "",
+    index: Optional[MatchIndex] = None,
+) -> Dict[str, Any]:
     """
     Extract PEAK row from Thai Tax Invoice
     
@@ -17,15 +80,18 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     - ใบเสร็จวันที่: 17/12/2568
     - เลขประจำตัวผู้เสียภาษี (vendor): 0107567000414
     - รวมยอดที่ต้ระ: 1,841.00
+
+    index: MatchIndex ของ text (ถ้า caller scan ไว้แล้ว) — ไม่ส่งมาก็ scan เอง
     """
     
     row: Dict[str, Any] = {}
+    present = (index or scan_text(text)).hits(_SCAN_TTI)
     
     # ============================================================
     # Extract invoice/receipt number
     # ============================================================
     # Pattern: "เลขที่: 0518520251217000011" or "เลขที่ :"
-    invoice_match = re.search(r"เลขที่\s*[:\s]+([0-9]+)", text)
+    invoice_match = _RE_TTI_INV_NO.search(text) if _I_INV_NO in present else None
     if invoice_match:
         row["C_reference"] = invoice_match.group(1)
         row["G_invoice_no"] = invoice_match.group(1)
@@ -37,7 +103,7 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # Extract date
     # ============================================================
     # Pattern: "17/12/2568" (BE format) or "17/12/2025"
-    date_match = re.search(r"(?:ใบเสร็จวันที่|วันที่)[:\s]*(\d{1,2})/(\d{1,2})/(\d{4})", text)
+    date_match = _RE_TTI_DATE.search(text) if _I_DATE in present else None
     if date_match:
         day = date_match.group(1).zfill(2)
         month = date_match.group(2).zfill(2)
@@ -57,7 +123,7 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # ============================================================
     # Pattern: "เลขประจำตัวผู้เสียภาษี : 0107567000414"
     # Look for 13-digit tax ID (first occurrence = vendor)
-    tax_ids = re.findall(r"(?:เลขประจำตัวผู้เสียภาษี|Tax ID)[:\s]*(\d{13})", text)
+    tax_ids = _RE_TTI_TAXID.findall(text) if _I_TAXID in present else []
     if tax_ids:
         # First = vendor, Second = buyer (if exists)
         row["E_tax_id_13"] = tax_ids[0]
@@ -69,15 +135,11 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # ============================================================
     # Try to find company name before first tax ID
     if tax_ids:
-        vendor_match = re.search(
-            r"(บริษัท[^0-9\n]+?)(?=เลขประจำตัวผู้เสียภาษี)",
-            text,
-            re.DOTALL
-        )
+        vendor_match = _RE_TTI_VENDOR.search(text)
         if vendor_match:
             vendor_name = vendor_match.group(1).strip()
             # Clean up
-            vendor_name = re.sub(r"\s+", " ", vendor_name)
+            vendor_name = _RE_TTI_WS.sub(" ", vendor_name)
             vendor_name = vendor_name[:100]  # limit length
             row["D_vendor_code"] = vendor_name
         else:
@@ -88,7 +150,7 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # ============================================================
     # Extract branch
     # ============================================================
-    branch_match = re.search(r"สาขาที่[:\s]*(\d{5})", text)
+    branch_match = _RE_TTI_BRANCH.search(text) if _I_BRANCH in present else None
     if branch_match:
         row["F_branch_5"] = branch_match.group(1)
     else:
@@ -98,20 +160,11 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # Extract total amount
     # ============================================================
     # Pattern: "รวมยอดที่ต้ระ: 1,841.00" or "รวมทั้งสิ้น"
-    amount_patterns = [
-        r"รวมยอดที่ต้?ระ[:\s]*([\d,]+\.?\d*)",
-        r"รวมทั้งสิ้น[:\s]*([\d,]+\.?\d*)",
-        r"ยอดรวม[:\s]*([\d,]+\.?\d*)",
-        r"รวม[:\s]*([\d,]+\.?\d*)"
-    ]
-    
-    for pattern in amount_patterns:
-        amount_match = re.search(pattern, text)
-        if amount_match:
-            amount_str = amount_match.group(1).replace(",", "")
-            row["R_paid_amount"] = amount_str
-            row["N_unit_price"] = amount_str
-            break
+    amount_raw = _find_total_amount(text) if _I_AMOUNTS in present else ""
+    if amount_raw:
+        amount_str = amount_raw.replace(",", "")
+        row["R_paid_amount"] = amount_str
+        row["N_unit_price"] = amount_str
     
     if "R_paid_amount" not in row:
         row["R_paid_amount"] = ""
@@ -121,7 +174,7 @@ def extract_thai_tax_invoice(text: str, filename: str = "", client_tax_id: str =
     # Extract VAT
     # ============================================================
     # Pattern: "ภาษีมูลค่าเพิ่ม" or "VAT"
-    vat_match = re.search(r"ภาษีมูลค่าเพิ่ม[:\s]*([\d,]+\.?\d*)", text)
+    vat_match = _RE_TTI_VAT.search(text) if _I_VAT in present else None
     if vat_match:
         vat_str = vat_match.group(1).replace(",", "")
         if float(vat_str) > 0:
@@ -60,6 +60,7 @@ RE_WHT_HINT = re.compile(r"(withheld\s*tax|withholding\s*tax|wht|ภาษี\s*
 RE_ADS_HINT = re.compile(r"\b(ads|advertising|promotion|โฆษณา|ค่าโฆษณา)\b", re.IGNORECASE)
 
 RE_ALL_WS = re.compile(r"\s+")
+RE_NON_DIGIT = re.compile(r"\D+")
 
 RE_INVOICE_NO_LINE = re.compile(
     r"(invoice\s*(?:no|number)|reference|ref\.?)\s*[:：#\-]?\s*([A-Za-z0-9][A-Za-z0-9\-\_\/]{6,})",
@@ -77,7 +78,8 @@ TIKTOK_VENDOR_TAX_ALIASES: Dict[str, str] = {
 def _clean_digits(s: Any, max_len: int | None = None) -> str:
     if s is None:
         return ""
-    out = "".join([c for c in str(s) if c.isdigit()])
+    s = str(s)
+    out = RE_NON_DIGIT.sub("", s) if s.isascii() else "".join(filter(str.isdigit, s))
     if max_len is not None:
         out = out[:max_len]
     return out
@@ -171,29 +173,33 @@ def _extract_wht_amount_3pct(text: str) -> str:
     return ""
 
 
+_BLANK_ROW_TEMPLATE: Dict[str, Any] = {
+    "B_doc_date": "",
+    "C_reference": "",
+    "D_vendor_code": "Unknown",
+    "E_tax_id_13": "",
+    "F_branch_5": "00000",
+    "G_invoice_no": "",
+    "H_invoice_date": "",
+    "I_tax_purchase_date": "",
+    "J_price_type": "1",
+    "K_account": "",
+    "L_description": "",
+    "M_qty": "1",
+    "N_unit_price": "0",
+    "O_vat_rate": "7%",
+    "P_wht": "",          # ✅ TikTok: blank always
+    "Q_payment_method": "",
+    "R_paid_amount": "0",
+    "S_pnd": "",
+    "T_note": "",
+    "U_group": "Marketplace Expense",
+}
+
+
 def _blank_row() -> Dict[str, Any]:
-    return {
-        "B_doc_date": "",
-        "C_reference": "",
-        "D_vendor_code": "Unknown",
-        "E_tax_id_13": "",
-        "F_branch_5": "00000",
-        "G_invoice_no": "",
-        "H_invoice_date": "",
-        "I_tax_purchase_date": "",
-        "J_price_type": "1",
-        "K_account": "",
-        "L_description": "",
-        "M_qty": "1",
-        "N_unit_price": "0",
-        "O_vat_rate": "7%",
-        "P_wht": "",          # ✅ TikTok: blank always
-        "Q_payment_method": "",
-        "R_paid_amount": "0",
-        "S_pnd": "",
-        "T_note": "",
-        "U_group": "Marketplace Expense",
-    }
+    # all values are str -> shallow copy of the template (same as common.base_row_dict)
+    return _BLANK_ROW_TEMPLATE.copy()
 
 
 def _extract_reference_invoice_glued(t: str) -> str:
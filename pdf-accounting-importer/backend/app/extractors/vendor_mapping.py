@@ -25,8 +25,26 @@ Goals:
 
 from __future__ import annotations
 
-from typing import Dict, Optional, Tuple, List
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple, List
+import functools
+import os
 import re
+import sys
+
+from ._scanner import ContainsMatcher
+
+# Optional: Aho-Corasick automaton (single pass over the name for all aliases)
+try:
+    import ahocorasick  # type: ignore
+except Exception:  # pragma: no cover
+    ahocorasick = None  # type: ignore
+
+# Optional: RE2 (linear time) for the normalization regexes, opt-in via EXTRACT_USE_RE2=1
+try:
+    import re2  # type: ignore
+except Exception:  # pragma: no cover
+    re2 = None  # type: ignore
 
 # ============================================================
 # Client Tax ID Constants
@@ -116,6 +134,48 @@ VENDOR_NAME_TO_TAX: Dict[str, str] = {
     "เบ็ตเตอร์": VENDOR_MARKETPLACE_OTHER,
 }
 
+
+def _build_vendor_name_automaton():
+    """
+    value = (dict order, tax) — ถ้าเจอหลาย alias ให้ตัวที่อยู่ก่อนใน VENDOR_NAME_TO_TAX ชนะ
+    (เหมือน loop เดิม)
+    """
+    if ahocorasick is None:
+        return None
+    try:
+        aho = ahocorasick.Automaton()
+        for i, (key, tax) in enumerate(VENDOR_NAME_TO_TAX.items()):
+            if key:
+                aho.add_word(key, (i, tax))
+        aho.make_automaton()
+        return aho
+    except Exception:  # pragma: no cover
+        return None
+
+
+_VENDOR_NAME_AHO = _build_vendor_name_automaton()
+
+
+def _build_vendor_name_regex() -> Tuple[Optional["re.Pattern"], Dict[str, Tuple[int, str]]]:
+    """
+    Fallback without pyahocorasick: one alternation (longest key first).
+    At a given position the regex reports only the longest key, but every
+    shorter key that is a prefix of it matches there too -> best[key] keeps the
+    (dict order, tax) of the earliest such key, so priority = dict order as before.
+    """
+    order = {k: i for i, k in enumerate(VENDOR_NAME_TO_TAX) if k}
+    if not order:
+        return None, {}
+    keys = sorted(order, key=len, reverse=True)
+    best: Dict[str, Tuple[int, str]] = {}
+    for k in keys:
+        p = min((j for j in keys if k.startswith(j)), key=order.__getitem__)
+        best[k] = (order[p], VENDOR_NAME_TO_TAX[p])
+    return re.compile("|".join(map(re.escape, keys))), best
+
+
+_VENDOR_NAME_RE, _VENDOR_NAME_BEST = _build_vendor_name_regex()
+
 # ============================================================
 # Aliases for vendor tax IDs (OCR mistakes / variant formats)
 # map alias -> canonical vendor tax id
@@ -239,26 +299,73 @@ TOPONE_CREDIT_BY_LAST4: Dict[str, str] = {
     # "xxxx": "ADVxxx",
 }
 
+# ============================================================
+# Intern table keys (lookup keys from _norm_* are interned too)
+# ============================================================
+_INTERN_MAX_LEN = 32
+
+
+def _intern_short(s: str) -> str:
+    # ✅ key สั้น (tax id / seller id / last4) -> intern ให้ dict lookup เทียบ identity ได้ทันที
+    return sys.intern(s) if s and len(s) <= _INTERN_MAX_LEN else s
+
+
+def _interned_keys(d: Dict[str, str]) -> Dict[str, str]:
+    return {_intern_short(k): v for k, v in d.items()}
+
+
+CLIENT_RABBIT = sys.intern(CLIENT_RABBIT)
+CLIENT_SHD = sys.intern(CLIENT_SHD)
+CLIENT_TOPONE = sys.intern(CLIENT_TOPONE)
+
+VENDOR_CODE_BY_CLIENT = {_intern_short(c): _interned_keys(m) for c, m in VENDOR_CODE_BY_CLIENT.items()}
+ALIAS_VENDOR_TAX_ID_MAP = _interned_keys(ALIAS_VENDOR_TAX_ID_MAP)
+RABBIT_WALLET_BY_SELLER_ID = _interned_keys(RABBIT_WALLET_BY_SELLER_ID)
+SHD_WALLET_BY_SELLER_ID = _interned_keys(SHD_WALLET_BY_SELLER_ID)
+TOPONE_WALLET_BY_SELLER_ID = _interned_keys(TOPONE_WALLET_BY_SELLER_ID)
+RABBIT_CREDIT_BY_LAST4 = _interned_keys(RABBIT_CREDIT_BY_LAST4)
+SHD_CREDIT_BY_LAST4 = _interned_keys(SHD_CREDIT_BY_LAST4)
+TOPONE_CREDIT_BY_LAST4 = _interned_keys(TOPONE_CREDIT_BY_LAST4)
+
 # ============================================================
 # Normalization helpers
 # ============================================================
-_TAX13_RE   = re.compile(r"\b\d{13}\b")
-_CCODE_RE   = re.compile(r"^C\d{5}$", re.IGNORECASE)
-_EWL_RE     = re.compile(r"^EWL\d{3}$", re.IGNORECASE)
-_ADV_RE     = re.compile(r"^ADV\d{3}$", re.IGNORECASE)
-_WS_RE      = re.compile(r"\s+")
+def _compile_linear(pattern: str) -> "re.Pattern":
+    if re2 is not None and str(os.getenv("EXTRACT_USE_RE2", "")).strip().lower() in ("1", "true", "yes", "on"):
+        try:
+            return re2.compile(pattern)
+        except Exception:  # pragma: no cover
+            pass
+    return re.compile(pattern)
+
+
+_TAX13_RE   = _compile_linear(r"\b\d{13}\b")
 
 _TH_DIGITS = "๐๑๒๓๔๕๖๗๘๙"
 _AR_DIGITS = "0123456789"
-_TH2AR = str.maketrans({ _TH_DIGITS[i]: _AR_DIGITS[i] for i in range(10) })
+_TH2AR = str.maketrans(_TH_DIGITS, _AR_DIGITS)
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+# noisy brackets/quotes often from OCR
+_NOISE_CHARS = "\"'`“”‘’()[]{}<>"
+# ✅ ตารางเดียว: Thai digit -> Arabic + noise char -> space (ช่องว่างซ้อนถูกยุบตอน split/join)
+_NAME_TRANS = str.maketrans(_TH_DIGITS + _NOISE_CHARS, _AR_DIGITS + " " * len(_NOISE_CHARS))
 
 # tries to catch seller id patterns (OCR)
+_SELLER_ID_KEYWORDS: Tuple[str, ...] = ('seller', 'shop', 'merchant')
+_SELLER_ID_TAIL = r"\s*(?:id)?\s*[:#=\-]?\s*(?P<sid>[0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b"
+
 SELLER_ID_PATTERNS: List[re.Pattern] = [
-    re.compile(r"\bseller\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
-    re.compile(r"\bshop\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
-    re.compile(r"\bmerchant\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
+    re.compile(r"\b" + kw + _SELLER_ID_TAIL, re.IGNORECASE) for kw in _SELLER_ID_KEYWORDS
 ]
 
+# ✅ alternation เดียว: สแกนข้อความรอบเดียวแทน 1 รอบต่อ pattern
+#    group "kw" บอกว่า hit มาจาก pattern ไหน (priority = ลำดับใน SELLER_ID_PATTERNS)
+_RE_SELLER_ID_ANY = re.compile(
+    r"\b(?P<kw>" + "|".join(_SELLER_ID_KEYWORDS) + ")" + _SELLER_ID_TAIL, re.IGNORECASE
+)
+_SELLER_ID_RANK: Dict[str, int] = {kw: i for i, kw in enumerate(_SELLER_ID_KEYWORDS)}
+
 # credit last4 patterns (OCR/name)
 LAST4_PATTERNS: List[re.Pattern] = [
     re.compile(r"(?:visa|master|amex|american\s*express)\D{0,30}(\d{4})\b", re.IGNORECASE),
@@ -272,26 +379,48 @@ def _thai_digits_to_arabic(s: str) -> str:
     return (s or "").translate(_TH2AR)
 
 
+# ชื่อสั้นๆ (vendor/shop/platform) วนซ้ำทุกไฟล์ -> cache; ข้อความยาว (OCR ทั้งหน้า) ไม่ cache
+_NORM_NAME_CACHE_MAX_LEN = 256
+
+
 def _norm_name(name: str) -> str:
+    if name and len(name) <= _NORM_NAME_CACHE_MAX_LEN:
+        return _norm_name_cached(name)
+    return _norm_name_uncached(name)
+
+
+def _norm_name_uncached(name: str) -> str:
     s = (name or "").strip().lower()
     if not s:
         return ""
-    s = _thai_digits_to_arabic(s)
-    s = _WS_RE.sub(" ", s)
-    # remove noisy brackets/quotes often from OCR
-    s = re.sub(r"[\"'`“”‘’\(\)\[\]\{\}<>]+", " ", s)
-    s = _WS_RE.sub(" ", s).strip()
-    return s
+    # ✅ fast path: ASCII ตัวอักษร/ตัวเลขล้วน = normalized อยู่แล้ว
+    if s.isascii() and s.isalnum():
+        return _intern_short(s)
+    # Thai digits + noise ใน translate เดียว แล้ว collapse whitespace + strip ด้วย str.split()
+    return _intern_short(" ".join(s.translate(_NAME_TRANS).split()))
+
+
+_norm_name_cached = functools.lru_cache(maxsize=4096)(_norm_name_uncached)
+
+
+def _cacheable(*args) -> bool:
+    # ✅ ตาราง mapping ไม่เปลี่ยนหลัง import -> resolver เป็น pure function, cache ได้
+    #    เฉพาะ str สั้น (ไม่ถือ OCR ทั้งหน้าไว้ใน cache / ไม่พังกับ arg ที่ hash ไม่ได้)
+    return all(type(a) is str and len(a) <= _NORM_NAME_CACHE_MAX_LEN for a in args)
 
 
 def _extract_13_digits(s: str) -> str:
     if not s:
         return ""
-    s = _thai_digits_to_arabic(s)
+    s = s.translate(_TH2AR)
+    # ✅ ตัวเลขล้วน: \b\d{13}\b match ได้ก็ต่อเมื่อยาว 13 พอดี ไม่ต้องเข้า regex
+    if s.isdecimal():
+        return s if len(s) == 13 else ""
     m = _TAX13_RE.search(s)
     return m.group(0) if m else ""
 
 
+@functools.lru_cache(maxsize=4096)
 def _norm_tax_id(tax_id: str) -> str:
     """
     Normalize tax id:
@@ -302,71 +431,94 @@ def _norm_tax_id(tax_id: str) -> str:
     s = (tax_id or "").strip()
     if not s:
         return ""
-    s = _thai_digits_to_arabic(s)
-    d13 = _extract_13_digits(s)
+    # ✅ fast path: 13 ASCII digits พอดี (กรณีส่วนใหญ่)
+    if len(s) == 13 and s.isascii() and s.isdigit():
+        return sys.intern(ALIAS_VENDOR_TAX_ID_MAP.get(s, s))
+    d13 = _extract_13_digits(s)  # แปลงเลขไทยในตัวแล้ว
     if not d13:
         return ""
-    return ALIAS_VENDOR_TAX_ID_MAP.get(d13, d13)
+    return sys.intern(ALIAS_VENDOR_TAX_ID_MAP.get(d13, d13))
+
+
+_KNOWN_CLIENTS = frozenset((CLIENT_RABBIT, CLIENT_SHD, CLIENT_TOPONE))
 
 
 def _is_known_client(client_tax_id: str) -> bool:
     c = _norm_tax_id(client_tax_id)
-    return c in (CLIENT_RABBIT, CLIENT_SHD, CLIENT_TOPONE)
+    return c in _KNOWN_CLIENTS
+
+
+def _has_code_shape(code: str, prefix: str, ndigits: int) -> bool:
+    # ✅ string ops แทน regex ^PREFIX\d{n}$ (prefix ไม่สน case) — ไม่ต้องเข้า regex engine
+    s = code.strip()
+    n = len(prefix)
+    return len(s) == n + ndigits and s[:n].upper() == prefix and s[n:].isdecimal()
 
 
 def _code_is_valid(code: str) -> bool:
-    return bool(code) and bool(_CCODE_RE.match(code.strip()))
+    return bool(code) and _has_code_shape(code, "C", 5)
 
 
 def _wallet_is_valid(code: str) -> bool:
-    return bool(code) and bool(_EWL_RE.match(code.strip()))
+    return bool(code) and _has_code_shape(code, "EWL", 3)
 
 
 def _adv_is_valid(code: str) -> bool:
-    return bool(code) and bool(_ADV_RE.match(code.strip()))
+    return bool(code) and _has_code_shape(code, "ADV", 3)
 
 
 def _digits_only(s: str) -> str:
     if not s:
         return ""
-    s = _thai_digits_to_arabic(str(s))
-    return "".join(ch for ch in s if ch.isdigit())
+    s = str(s)
+    if s.isascii() and s.isdigit():
+        return s
+    s = s.translate(_TH2AR)
+    if s.isascii():
+        return _NON_DIGIT_RE.sub("", s)
+    # non-ASCII: isdigit() ยังนับ superscript ฯลฯ ซึ่ง \D ตัดทิ้ง -> คง semantics เดิม
+    return "".join(filter(str.isdigit, s))
 
 
+@functools.lru_cache(maxsize=4096)
 def _norm_seller_id(seller_id: str) -> str:
     """
     seller_id should be digits only.
     Accepts: ' 628,286,975 ' -> '628286975'
     """
-    return _digits_only(seller_id)
+    return _intern_short(_digits_only(seller_id))
 
 
 def _extract_seller_id_from_text(text: str) -> str:
     t = _norm_name(text)
     if not t:
         return ""
-    for rx in SELLER_ID_PATTERNS:
-        m = rx.search(t)
+    # first hit per pattern (ตาม text order) -> pattern แรกตามลำดับที่ได้ id ยาว >= 5 ชนะ
+    # (เหมือนเดิมที่ลอง rx.search ทีละตัว)
+    firsts: Dict[int, str] = {}
+    pos = 0
+    while len(firsts) < len(_SELLER_ID_KEYWORDS):
+        m = _RE_SELLER_ID_ANY.search(t, pos)
         if not m:
-            continue
-        sid = _norm_seller_id(m.group(1))
+            break
+        rank = _SELLER_ID_RANK[m.group("kw").casefold()]
+        if rank not in firsts:
+            firsts[rank] = _norm_seller_id(m.group("sid"))
+        pos = m.end()
+    for rank in sorted(firsts):
+        sid = firsts[rank]
         if len(sid) >= 5:
             return sid
     return ""
 
 
-def _match_contains_longest_first(hay: str, mapping: Dict[str, str], *, validator) -> str:
+def _longest_first(mapping: Dict[str, str], *, validator) -> Tuple[Tuple[str, str], ...]:
     """
-    contains-match with longest-first keys to avoid false early hits.
+    (normalized key, value) pairs, longest key first, valid values only.
+    sort แบบ stable -> key ยาวเท่ากันคงลำดับเดิมของ dict
     """
-    if not hay or not mapping:
-        return ""
-    keys = sorted((k for k in mapping.keys() if k), key=len, reverse=True)
-    for k in keys:
-        v = mapping.get(k, "")
-        if v and validator(v) and (k in hay):
-            return v
-    return ""
+    items = [(_norm_name(k), v) for k, v in mapping.items() if k and v and validator(v)]
+    return tuple(sorted(items, key=lambda kv: len(kv[0]), reverse=True))
 
 
 def _extract_last4_best_effort(*parts: str) -> str:
@@ -404,15 +556,39 @@ def get_vendor_tax_id_from_name(vendor_name: str) -> str:
     if not vn:
         return ""
     # contains match
-    for key, tax in VENDOR_NAME_TO_TAX.items():
-        if key and key in vn:
-            return tax
-    return ""
+    if _VENDOR_NAME_AHO is not None:
+        best = min((hit for _end, hit in _VENDOR_NAME_AHO.iter(vn)), default=None)
+        return best[1] if best else ""
+    if _VENDOR_NAME_RE is None:
+        return ""
+    best = None
+    pos = 0
+    while True:
+        m = _VENDOR_NAME_RE.search(vn, pos)
+        if not m:
+            break
+        hit = _VENDOR_NAME_BEST[m.group(0)]
+        if best is None or hit < best:
+            best = hit
+            if hit[0] == 0:
+                break
+        pos = m.start() + 1
+    return best[1] if best else ""
 
 
 # ============================================================
 # Public API: main vendor mapping (HARDENED)
 # ============================================================
+# ✅ flat (client, vendor_tax) -> Cxxxxx, validate ครั้งเดียวตอน import
+#    lookup เดียวแทน .get(c, {}).get(v) (ไม่สร้าง {} ทิ้งตอน miss)
+_VENDOR_CODE_FLAT: Mapping[Tuple[str, str], str] = MappingProxyType({
+    (c, v): code
+    for c, sub in VENDOR_CODE_BY_CLIENT.items()
+    for v, code in sub.items()
+    if _code_is_valid(code)
+})
+
+
 def get_vendor_code(client_tax_id: str, vendor_tax_id: str = "", vendor_name: str = "") -> str:
     """
     Return vendor code (Cxxxxx) for PEAK "ผู้รับเงิน/คู่ค้า".
@@ -422,32 +598,55 @@ def get_vendor_code(client_tax_id: str, vendor_tax_id: str = "", vendor_name: st
     - ถ้ารู้ client + vendor (จาก tax หรือ name) ต้องคืน Cxxxxx เสมอ
     - ห้ามคืนชื่อ platform เด็ดขาด
     """
-    c = _norm_tax_id(client_tax_id)
+    if _cacheable(client_tax_id, vendor_tax_id, vendor_name):
+        return _get_vendor_code_cached(client_tax_id, vendor_tax_id, vendor_name)
+    return _get_vendor_code_uncached(client_tax_id, vendor_tax_id, vendor_name)
+
 
-    if not c or not _is_known_client(c):
+def _get_vendor_code_uncached(client_tax_id: str, vendor_tax_id: str, vendor_name: str) -> str:
+    # c เป็น normalized tax id แล้ว -> เช็ค set ตรงๆ ไม่ต้อง normalize ซ้ำใน _is_known_client
+    c = _norm_tax_id(client_tax_id)
+    if c not in _KNOWN_CLIENTS:
         return "Unknown"
 
     # 1) try vendor tax id (13 digits only)
     v = _norm_tax_id(vendor_tax_id)
-    if v:
-        code = VENDOR_CODE_BY_CLIENT.get(c, {}).get(v, "")
-        if _code_is_valid(code):
-            return code
+    code = _VENDOR_CODE_FLAT.get((c, v)) if v else None
+    if code:
+        return code
 
     # 2) treat vendor_tax_id as name hint too if not 13 digits
-    name_hint = vendor_name or vendor_tax_id or ""
-    v2 = get_vendor_tax_id_from_name(name_hint)
-    if v2:
-        code = VENDOR_CODE_BY_CLIENT.get(c, {}).get(v2, "")
-        if _code_is_valid(code):
-            return code
+    v2 = get_vendor_tax_id_from_name(vendor_name or vendor_tax_id or "")
+    return (_VENDOR_CODE_FLAT.get((c, v2)) if v2 else None) or "Unknown"
+
 
-    return "Unknown"
+_get_vendor_code_cached = functools.lru_cache(maxsize=4096)(_get_vendor_code_uncached)
 
 
 # ============================================================
 # Wallet mapping (Q_payment_method) — EWLxxx
 # ============================================================
+# ✅ prebuilt: flat (client, seller_id) -> EWL + per-client shop keyword matcher
+#    normalize/sort/validate ครั้งเดียวตอน import แทนทุกครั้งที่เรียก
+#    matcher = contains-match longest-first (กัน hit สั้นๆ ก่อน) แต่สแกน shop รอบเดียว
+_WALLET_BY_CLIENT_SID: Mapping[Tuple[str, str], str] = MappingProxyType({
+    (c, sid): code
+    for c, table in (
+        (CLIENT_RABBIT, RABBIT_WALLET_BY_SELLER_ID),
+        (CLIENT_SHD, SHD_WALLET_BY_SELLER_ID),
+        (CLIENT_TOPONE, TOPONE_WALLET_BY_SELLER_ID),
+    )
+    for sid, code in table.items()
+    if _wallet_is_valid(code)
+})
+
+_WALLET_BY_CLIENT: Mapping[str, ContainsMatcher] = MappingProxyType({
+    CLIENT_RABBIT: ContainsMatcher(_longest_first(RABBIT_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)),
+    CLIENT_SHD: ContainsMatcher(_longest_first(SHD_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)),
+    CLIENT_TOPONE: ContainsMatcher(_longest_first(TOPONE_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)),
+})
+
+
 def get_wallet_code(
     client_tax_id: str,
     *,
@@ -466,8 +665,19 @@ def get_wallet_code(
     - NEVER return platform name
     - If cannot map -> "" (let worker mark NEEDS_REVIEW)
     """
+    if _cacheable(client_tax_id, seller_id, shop_name, platform, text):
+        return _get_wallet_code_cached(client_tax_id, seller_id, shop_name, platform, text)
+    return _get_wallet_code_uncached(client_tax_id, seller_id, shop_name, platform, text)
+
+
+def _get_wallet_code_uncached(
+    client_tax_id: str, seller_id: str, shop_name: str, platform: str, text: str
+) -> str:
     c = _norm_tax_id(client_tax_id)
-    if not c or not _is_known_client(c):
+    if c not in _KNOWN_CLIENTS:
+        return ""
+    by_shop = _WALLET_BY_CLIENT.get(c)
+    if by_shop is None:
         return ""
 
     sid = _norm_seller_id(seller_id)
@@ -477,49 +687,35 @@ def get_wallet_code(
     shop = _norm_name(shop_name)
     _ = _norm_name(platform)  # kept for future use
 
-    if c == CLIENT_RABBIT:
-        if sid:
-            code = RABBIT_WALLET_BY_SELLER_ID.get(sid, "")
-            if _wallet_is_valid(code):
-                return code
-        code = _match_contains_longest_first(shop, RABBIT_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        if _wallet_is_valid(code):
+    if sid:
+        code = _WALLET_BY_CLIENT_SID.get((c, sid))
+        if code:
             return code
-        # last fallback: sometimes shop label appears inside OCR text
-        t = _norm_name(text)
-        code = _match_contains_longest_first(t, RABBIT_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        return code if _wallet_is_valid(code) else ""
+    code = by_shop.first(shop)
+    if code:
+        return code
+    # last fallback: sometimes shop label appears inside OCR text
+    return by_shop.first(_norm_name(text))
 
-    if c == CLIENT_SHD:
-        if sid:
-            code = SHD_WALLET_BY_SELLER_ID.get(sid, "")
-            if _wallet_is_valid(code):
-                return code
-        code = _match_contains_longest_first(shop, SHD_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        if _wallet_is_valid(code):
-            return code
-        t = _norm_name(text)
-        code = _match_contains_longest_first(t, SHD_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        return code if _wallet_is_valid(code) else ""
-
-    if c == CLIENT_TOPONE:
-        if sid:
-            code = TOPONE_WALLET_BY_SELLER_ID.get(sid, "")
-            if _wallet_is_valid(code):
-                return code
-        code = _match_contains_longest_first(shop, TOPONE_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        if _wallet_is_valid(code):
-            return code
-        t = _norm_name(text)
-        code = _match_contains_longest_first(t, TOPONE_WALLET_BY_SHOP_NAME, validator=_wallet_is_valid)
-        return code if _wallet_is_valid(code) else ""
 
-    return ""
+_get_wallet_code_cached = functools.lru_cache(maxsize=4096)(_get_wallet_code_uncached)
 
 
 # ============================================================
 # Credit mapping — ADVxxx
 # ============================================================
+_CREDIT_BY_CLIENT_LAST4: Mapping[Tuple[str, str], str] = MappingProxyType({
+    (c, last4): adv
+    for c, table in (
+        (CLIENT_RABBIT, RABBIT_CREDIT_BY_LAST4),
+        (CLIENT_SHD, SHD_CREDIT_BY_LAST4),
+        (CLIENT_TOPONE, TOPONE_CREDIT_BY_LAST4),
+    )
+    for last4, adv in table.items()
+    if _adv_is_valid(adv)
+})
+
+
 def get_credit_id(
     client_tax_id: str,
     *,
@@ -540,29 +736,33 @@ def get_credit_id(
       - "" if unknown (caller can mark NEEDS_REVIEW)
     """
     c = _norm_tax_id(client_tax_id)
-    if not c or not _is_known_client(c):
+    if c not in _KNOWN_CLIENTS:
         return ""
 
     last4 = _extract_last4_best_effort(credit_iv, credit_name, text)
     if not last4:
         return ""
 
-    if c == CLIENT_RABBIT:
-        adv = RABBIT_CREDIT_BY_LAST4.get(last4, "")
-        return adv if _adv_is_valid(adv) else ""
-    if c == CLIENT_SHD:
-        adv = SHD_CREDIT_BY_LAST4.get(last4, "")
-        return adv if _adv_is_valid(adv) else ""
-    if c == CLIENT_TOPONE:
-        adv = TOPONE_CREDIT_BY_LAST4.get(last4, "")
-        return adv if _adv_is_valid(adv) else ""
-
-    return ""
+    return _CREDIT_BY_CLIENT_LAST4.get((c, last4), "")
 
 
 # ============================================================
 # Optional: detect client by context (best effort)
 # ============================================================
+# ✅ ลำดับ = priority เดิม (tax id แรงสุด แล้วค่อย keyword) แต่สแกนข้อความรอบเดียว
+_CLIENT_CONTEXT = ContainsMatcher((
+    # tax id hit is strongest
+    (CLIENT_RABBIT, CLIENT_RABBIT),
+    (CLIENT_SHD, CLIENT_SHD),
+    (CLIENT_TOPONE, CLIENT_TOPONE),
+    # keyword fallback
+    ("rabbit", CLIENT_RABBIT),
+    ("shd", CLIENT_SHD),
+    ("topone", CLIENT_TOPONE),
+    ("top one", CLIENT_TOPONE),
+))
+
+
 def detect_client_from_context(text: str) -> Optional[str]:
     """
     Robust detect:
@@ -572,24 +772,7 @@ def detect_client_from_context(text: str) -> Optional[str]:
     t = _norm_name(text)
     if not t:
         return None
-
-    # tax id hit is strongest
-    if CLIENT_RABBIT in t:
-        return CLIENT_RABBIT
-    if CLIENT_SHD in t:
-        return CLIENT_SHD
-    if CLIENT_TOPONE in t:
-        return CLIENT_TOPONE
-
-    # keyword fallback
-    if "rabbit" in t:
-        return CLIENT_RABBIT
-    if "shd" in t:
-        return CLIENT_SHD
-    if "topone" in t or "top one" in t:
-        return CLIENT_TOPONE
-
-    return None
+    return _CLIENT_CONTEXT.first(t, None)
 
 
 def get_client_name(client_tax_id: str) -> str:
@@ -611,6 +794,22 @@ def get_all_vendor_codes_for_client(client_tax_id: str) -> Dict[str, str]:
 # ============================================================
 # Category mapping for description/group (kept as your version)
 # ============================================================
+_SHIPPING_KWS = ("shipping", "delivery", "ขนส่ง", "จัดส่ง", "spx")
+_COMMISSION_KWS = ("commission", "คอมมิชชั่น", "ค่าคอม")
+_ADVERTISING_KWS = ("advertising", "โฆษณา", "ads", "sponsored")
+_GOODS_KWS = ("goods", "สินค้า", "inventory", "cogs", "cost of goods")
+_SHIPPING_PLATFORMS = frozenset(("spx", "spx express"))
+
+# ✅ keyword -> category ตามลำดับหมวด, สแกน description รอบเดียวแทน any() ทีละหมวด
+#    (marketplace keyword ไม่ต้องใส่: ตกทุกหมวดก็เป็น Marketplace Expense อยู่แล้ว)
+_EXPENSE_CATEGORY = ContainsMatcher(
+    tuple((w, "Shipping Expense") for w in _SHIPPING_KWS)
+    + tuple((w, "Selling Expense") for w in _COMMISSION_KWS)
+    + tuple((w, "Advertising Expense") for w in _ADVERTISING_KWS)
+    + tuple((w, "Inventory / COGS") for w in _GOODS_KWS)
+)
+
+
 def get_expense_category(description: str, platform: str = "") -> str:
     """
     Rules:
@@ -623,24 +822,13 @@ def get_expense_category(description: str, platform: str = "") -> str:
     desc = _norm_name(description)
     plat = _norm_name(platform)
 
-    if any(w in desc for w in ("shipping", "delivery", "ขนส่ง", "จัดส่ง", "spx")) or plat in ("spx", "spx express"):
+    if plat in _SHIPPING_PLATFORMS:
         return "Shipping Expense"
+    # keyword ของหมวดที่มาก่อนชนะ (เหมือน if-chain เดิม); ไม่เจอ -> Marketplace Expense
+    return _EXPENSE_CATEGORY.first(desc, "Marketplace Expense")
 
-    if any(w in desc for w in ("commission", "คอมมิชชั่น", "ค่าคอม")):
-        return "Selling Expense"
-
-    if any(w in desc for w in ("advertising", "โฆษณา", "ads", "sponsored")):
-        return "Advertising Expense"
-
-    if any(w in desc for w in ("goods", "สินค้า", "inventory", "cogs", "cost of goods")):
-        return "Inventory / COGS"
-
-    if plat in ("shopee", "lazada", "tiktok", "ช้อปปี้", "ลาซาด้า", "ติ๊กต๊อก"):
-        return "Marketplace Expense"
-    if any(w in desc for w in ("shopee", "lazada", "tiktok", "ช้อปปี้", "ลาซาด้า", "ติ๊กต๊อก")):
-        return "Marketplace Expense"
 
-    return "Marketplace Expense"
+_SELLER_INFO_RE = re.compile(r"Seller(?:\s+ID)?:\s*([0-9A-Za-z_\-]+)")
 
 
 def format_short_description(platform: str, fee_type: str = "", seller_info: str = "") -> str:
@@ -651,7 +839,7 @@ def format_short_description(platform: str, fee_type: str = "", seller_info: str
         parts.append(fee_type.strip())
 
     if seller_info:
-        m = re.search(r"Seller(?:\s+ID)?:\s*([0-9A-Za-z_\-]+)", seller_info)
+        m = _SELLER_INFO_RE.search(seller_info)
         if m:
             parts.append(f"Seller {m.group(1)}")
 
@@ -20,14 +20,18 @@ Behavior:
 """
 
 from typing import Dict, Tuple, List
+import functools
 import re
+import sys
+
+from ._scanner import ContainsMatcher
 
 # ============================================================
 # Client Tax ID Constants (our companies)
 # ============================================================
-CLIENT_RABBIT = "0105561071873"
-CLIENT_SHD = "0105563022918"
-CLIENT_TOPONE = "0105565027615"
+CLIENT_RABBIT = sys.intern("0105561071873")
+CLIENT_SHD = sys.intern("0105563022918")
+CLIENT_TOPONE = sys.intern("0105565027615")
 
 # ============================================================
 # Wallet mappings by seller_id (digits only)
@@ -123,6 +127,28 @@ TOPONE_WALLET_BY_SHOP_KEYWORD: Dict[str, str] = {
     "vinko": "EWL001",
 }
 
+# ============================================================
+# Intern table keys (lookup keys from _norm_* are interned too)
+# ============================================================
+_INTERN_MAX_LEN = 32
+
+
+def _intern_short(s: str) -> str:
+    # ✅ key สั้น (seller id / keyword) -> intern ให้ dict lookup เทียบ identity ได้ทันที
+    return sys.intern(s) if s and len(s) <= _INTERN_MAX_LEN else s
+
+
+def _interned_keys(d: Dict[str, str]) -> Dict[str, str]:
+    return {_intern_short(k): v for k, v in d.items()}
+
+
+RABBIT_WALLET_BY_SELLER_ID = _interned_keys(RABBIT_WALLET_BY_SELLER_ID)
+SHD_WALLET_BY_SELLER_ID = _interned_keys(SHD_WALLET_BY_SELLER_ID)
+TOPONE_WALLET_BY_SELLER_ID = _interned_keys(TOPONE_WALLET_BY_SELLER_ID)
+RABBIT_WALLET_BY_SHOP_KEYWORD = _interned_keys(RABBIT_WALLET_BY_SHOP_KEYWORD)
+SHD_WALLET_BY_SHOP_KEYWORD = _interned_keys(SHD_WALLET_BY_SHOP_KEYWORD)
+TOPONE_WALLET_BY_SHOP_KEYWORD = _interned_keys(TOPONE_WALLET_BY_SHOP_KEYWORD)
+
 # ============================================================
 # Regex for extracting seller/shop ids from OCR text
 # ============================================================
@@ -135,13 +161,20 @@ TOPONE_WALLET_BY_SHOP_KEYWORD: Dict[str, str] = {
 # - Merchant ID : 123456
 # - shopid 123456
 # และบางทีมี comma/space/dash คั่น
+_SELLER_ID_KEYWORDS: Tuple[str, ...] = ('seller', 'shop', 'merchant', 'store')
+_SELLER_ID_TAIL = r"\s*(?:id)?\s*[:#=\-]?\s*(?P<sid>[0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b"
+
 SELLER_ID_PATTERNS: List[re.Pattern] = [
-    re.compile(r"\bseller\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
-    re.compile(r"\bshop\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
-    re.compile(r"\bmerchant\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
-    re.compile(r"\bstore\s*(?:id)?\s*[:#=\-]?\s*([0-9๐-๙][0-9๐-๙\s,\-]{4,30})\b", re.IGNORECASE),
+    re.compile(r"\b" + kw + _SELLER_ID_TAIL, re.IGNORECASE) for kw in _SELLER_ID_KEYWORDS
 ]
 
+# ✅ alternation เดียว: สแกนข้อความรอบเดียวแทน 1 รอบต่อ pattern
+#    group "kw" บอกว่า hit มาจาก pattern ไหน (priority = ลำดับใน SELLER_ID_PATTERNS)
+_RE_SELLER_ID_ANY = re.compile(
+    r"\b(?P<kw>" + "|".join(_SELLER_ID_KEYWORDS) + ")" + _SELLER_ID_TAIL, re.IGNORECASE
+)
+_SELLER_ID_RANK: Dict[str, int] = {kw: i for i, kw in enumerate(_SELLER_ID_KEYWORDS)}
+
 EWL_RE = re.compile(r"^EWL\d{3}$", re.IGNORECASE)
 
 # ============================================================
@@ -150,7 +183,13 @@ EWL_RE = re.compile(r"^EWL\d{3}$", re.IGNORECASE)
 
 _TH_DIGITS = "๐๑๒๓๔๕๖๗๘๙"
 _AR_DIGITS = "0123456789"
-_TH2AR = str.maketrans({ _TH_DIGITS[i]: _AR_DIGITS[i] for i in range(10) })
+_TH2AR = str.maketrans(_TH_DIGITS, _AR_DIGITS)
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+# brackets/quotes that often appear in OCR (dots/underscores/hyphens stay: keywords use them)
+_NOISE_CHARS = "\"'`“”‘’()[]{}<>"
+# ✅ ตารางเดียว: Thai digit -> Arabic + noise char -> space (ช่องว่างซ้อนถูกยุบตอน split/join)
+_SHOP_TRANS = str.maketrans(_TH_DIGITS + _NOISE_CHARS, _AR_DIGITS + " " * len(_NOISE_CHARS))
 
 
 def _thai_digits_to_arabic(s: str) -> str:
@@ -161,46 +200,70 @@ def _norm_text(s: str) -> str:
     s = (s or "").strip()
     if not s:
         return ""
-    s = _thai_digits_to_arabic(s)
-    # unify whitespace/newlines
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
+    s = s.translate(_TH2AR)
+    # unify whitespace/newlines (+strip) — str.split() ตัดตาม isspace ชุดเดียวกับ \s
+    return " ".join(s.split())
 
 
 def _digits_only(s: str) -> str:
     if not s:
         return ""
-    s = _thai_digits_to_arabic(str(s))
-    return "".join(ch for ch in s if ch.isdigit())
+    s = str(s).translate(_TH2AR)
+    if s.isascii():
+        return _NON_DIGIT_RE.sub("", s)
+    # non-ASCII: isdigit() ยังนับ superscript ฯลฯ ซึ่ง \D ตัดทิ้ง -> คง semantics เดิม
+    return "".join(filter(str.isdigit, s))
 
 
+@functools.lru_cache(maxsize=4096)
 def _norm_seller_id(seller_id: str) -> str:
     # digits only (remove comma/space/hyphen)
-    return _digits_only(seller_id)
+    return _intern_short(_digits_only(seller_id))
+
+
+# shop label สั้นๆ วนซ้ำทุกแถว -> cache; ข้อความยาว (OCR ทั้งหน้า) ไม่ cache
+_CACHE_MAX_ARG_LEN = 256
+
+
+def _cacheable(*args) -> bool:
+    # ✅ ตาราง mapping ไม่เปลี่ยนหลัง import -> resolver เป็น pure function, cache ได้
+    return all(type(a) is str and len(a) <= _CACHE_MAX_ARG_LEN for a in args)
 
 
 def _norm_shop_name(shop_name: str) -> str:
+    if _cacheable(shop_name):
+        return _norm_shop_name_cached(shop_name)
+    return _norm_shop_name_uncached(shop_name)
+
+
+def _norm_shop_name_uncached(shop_name: str) -> str:
     # lower + strip + collapse spaces + remove some punctuation noise
-    s = _norm_text(shop_name).lower()
-    if not s:
-        return ""
-    # keep dots/underscores/hyphens because your keywords use them,
-    # but remove brackets/quotes that often appear in OCR
-    s = re.sub(r"[\"'`“”‘’\(\)\[\]\{\}<>]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # (Thai digits + noise in one translate, then one split/join)
+    s = (shop_name or "").translate(_SHOP_TRANS).lower()
+    return _intern_short(" ".join(s.split()))
+
+
+_norm_shop_name_cached = functools.lru_cache(maxsize=4096)(_norm_shop_name_uncached)
 
 
 def _extract_seller_id_from_text(text: str) -> str:
     t = _norm_text(text).lower()
     if not t:
         return ""
-    for rx in SELLER_ID_PATTERNS:
-        m = rx.search(t)
+    # first hit per pattern (ตาม text order) -> pattern แรกตามลำดับที่ได้ id ยาว >= 5 ชนะ
+    # (เหมือนเดิมที่ลอง rx.search ทีละตัว)
+    firsts: Dict[int, str] = {}
+    pos = 0
+    while len(firsts) < len(_SELLER_ID_KEYWORDS):
+        m = _RE_SELLER_ID_ANY.search(t, pos)
         if not m:
-            continue
-        raw = m.group(1) or ""
-        sid = _norm_seller_id(raw)
+            break
+        rank = _SELLER_ID_RANK[m.group("kw").casefold()]
+        if rank not in firsts:
+            firsts[rank] = _norm_seller_id(m.group("sid"))
+        pos = m.end()
+    for rank in sorted(firsts):
+        sid = firsts[rank]
         # sanity: seller_id usually >= 5 digits
         if len(sid) >= 5:
             return sid
@@ -208,7 +271,9 @@ def _extract_seller_id_from_text(text: str) -> str:
 
 
 def _is_valid_wallet(code: str) -> bool:
-    return bool(code) and bool(EWL_RE.match(code.strip()))
+    # ✅ string ops แทน EWL_RE.match: "EWL" (ไม่สน case) + ตัวเลข 3 หลัก
+    s = code.strip() if code else ""
+    return len(s) == 6 and s[:3].upper() == "EWL" and s[3:].isdecimal()
 
 
 def _client_bucket(client_tax_id: str) -> str:
@@ -232,23 +297,42 @@ def _tables_for_client(bucket: str) -> Tuple[Dict[str, str], Dict[str, str]]:
     return ({}, {})
 
 
-def _match_shop_keyword(shop_norm: str, by_shop: Dict[str, str]) -> str:
+# ✅ flat (bucket, seller_id) -> EWL, validate ครั้งเดียวตอน import (lookup เดียวต่อ sid)
+_WALLET_BY_BUCKET_SID: Dict[Tuple[str, str], str] = {
+    (bucket, sid): code
+    for bucket in ("RABBIT", "SHD", "TOPONE")
+    for sid, code in _tables_for_client(bucket)[0].items()
+    if _is_valid_wallet(code)
+}
+
+
+def _shop_keyword_pairs(by_shop: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
     """
     Match by 'contains' but do longest-key-first to prevent wrong early hits.
+    -> (keyword, EWL) pairs, longest first, valid codes only (stable sort = dict order on ties)
     """
-    if not shop_norm or not by_shop:
-        return ""
-
-    # longest-first keys
     keys = sorted((k for k in by_shop.keys() if k), key=len, reverse=True)
-    for k in keys:
-        code = by_shop.get(k, "")
-        if not _is_valid_wallet(code):
-            continue
-        if k in shop_norm:
-            return code
+    return tuple((k, by_shop[k]) for k in keys if _is_valid_wallet(by_shop[k]))
 
-    return ""
+
+# ✅ tuple-of-pairs สร้างครั้งเดียวตอน import (sort + validate แล้ว) แทนวน dict ทุกครั้ง
+RABBIT_WALLET_PAIRS: Tuple[Tuple[str, str], ...] = _shop_keyword_pairs(RABBIT_WALLET_BY_SHOP_KEYWORD)
+SHD_WALLET_PAIRS: Tuple[Tuple[str, str], ...] = _shop_keyword_pairs(SHD_WALLET_BY_SHOP_KEYWORD)
+TOPONE_WALLET_PAIRS: Tuple[Tuple[str, str], ...] = _shop_keyword_pairs(TOPONE_WALLET_BY_SHOP_KEYWORD)
+
+# matcher สแกน shop label รอบเดียว (ผลเท่ากับวน pairs แล้ว `k in shop`)
+_SHOP_MATCHER: Dict[str, ContainsMatcher] = {
+    "RABBIT": ContainsMatcher(RABBIT_WALLET_PAIRS),
+    "SHD": ContainsMatcher(SHD_WALLET_PAIRS),
+    "TOPONE": ContainsMatcher(TOPONE_WALLET_PAIRS),
+}
+
+
+def _match_shop_keyword(shop_norm: str, bucket: str) -> str:
+    matcher = _SHOP_MATCHER.get(bucket)
+    if not shop_norm or matcher is None:
+        return ""
+    return matcher.first(shop_norm)
 
 
 # ============================================================
@@ -271,31 +355,35 @@ def resolve_wallet_code(
       - "EWLxxx" if resolved
       - "" if unknown (caller should mark NEEDS_REVIEW)
     """
+    if _cacheable(client_tax_id, seller_id, shop_name, text):
+        return _resolve_wallet_code_cached(client_tax_id, seller_id, shop_name, text)
+    return _resolve_wallet_code_uncached(client_tax_id, seller_id, shop_name, text)
+
+
+def _resolve_wallet_code_uncached(client_tax_id: str, seller_id: str, shop_name: str, text: str) -> str:
     bucket = _client_bucket(client_tax_id)
     if not bucket:
         return ""
 
-    by_sid, by_shop = _tables_for_client(bucket)
-
     # 1) direct seller_id
     sid = _norm_seller_id(seller_id)
     if sid:
-        code = by_sid.get(sid, "")
-        if _is_valid_wallet(code):
+        code = _WALLET_BY_BUCKET_SID.get((bucket, sid))
+        if code:
             return code
 
     # 2) extract seller_id from OCR/body text
     if not sid and text:
         sid = _extract_seller_id_from_text(text)
         if sid:
-            code = by_sid.get(sid, "")
-            if _is_valid_wallet(code):
+            code = _WALLET_BY_BUCKET_SID.get((bucket, sid))
+            if code:
                 return code
 
     # 3) fallback by shop_name keywords
     shop_norm = _norm_shop_name(shop_name)
     if shop_norm:
-        code = _match_shop_keyword(shop_norm, by_shop)
+        code = _match_shop_keyword(shop_norm, bucket)
         if _is_valid_wallet(code):
             return code
 
@@ -303,13 +391,16 @@ def resolve_wallet_code(
     #    we only use this as last fallback to avoid false positives
     if text:
         t_norm = _norm_shop_name(text)  # reuse same normalization for keyword contains
-        code = _match_shop_keyword(t_norm, by_shop)
+        code = _match_shop_keyword(t_norm, bucket)
         if _is_valid_wallet(code):
             return code
 
     return ""
 
 
+_resolve_wallet_code_cached = functools.lru_cache(maxsize=4096)(_resolve_wallet_code_uncached)
+
+
 def extract_seller_id_best_effort(text: str) -> str:
     """
     Utility: extract seller_id from OCR text.
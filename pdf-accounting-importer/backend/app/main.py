@@ -1,18 +1,29 @@
 from __future__ import annotations
 
-import io
+import asyncio
 import os
 import json
 import time
+import functools
+import hashlib
+import hmac
 import inspect
 import logging
+import tempfile
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, FrozenSet, Tuple
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 
+# Optional: orjson-backed responses (large /rows payloads)
+try:
+    import orjson  # type: ignore  # noqa: F401
+    from fastapi.responses import ORJSONResponse as _DefaultResponse
+except Exception:  # pragma: no cover
+    _DefaultResponse = JSONResponse  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 # ============================================================
@@ -32,12 +43,8 @@ _setup_logging()
 # ============================================================
 # ✅ Load .env intelligently
 # ============================================================
-def _load_env_safely() -> None:
-    try:
-        from dotenv import load_dotenv  # type: ignore
-    except Exception:
-        return
-
+def _dotenv_path() -> str:
+    """first existing .env candidate; "" -> python-dotenv's own lookup (find_dotenv)"""
     here = Path(__file__).resolve()
     backend_dir = here.parents[1]
     app_dir = here.parent
@@ -51,24 +58,77 @@ def _load_env_safely() -> None:
 
     for p in candidates:
         if p.exists():
-            load_dotenv(dotenv_path=str(p), override=False)
-            logger.info("Loaded .env: %s", str(p))
-            return
+            return str(p)
+    return ""
+
+def _load_env_safely() -> None:
+    try:
+        from dotenv import load_dotenv  # type: ignore
+    except Exception:
+        return
+
+    path = _dotenv_path()
+    if path:
+        load_dotenv(dotenv_path=path, override=False)
+        logger.info("Loaded .env: %s", path)
+        return
 
     load_dotenv(override=False)
 
+# ✅ real process env wins over .env (boot precedence) -> remember what it held
+_PROCESS_ENV_KEYS: FrozenSet[str] = frozenset(os.environ)
+
 _load_env_safely()
+_DOTENV_KEYS = set(os.environ) - _PROCESS_ENV_KEYS  # keys .env itself provided
+
+def _reload_dotenv() -> None:
+    """
+    Re-read .env for /api/config/reload with the boot precedence:
+    only keys the process env did not hold at boot are (re)set / dropped.
+    """
+    try:
+        from dotenv import dotenv_values, find_dotenv  # type: ignore
+    except Exception:
+        return
+
+    path = _dotenv_path() or find_dotenv()
+    values = {k: v for k, v in (dotenv_values(path) if path else {}).items() if v is not None}
+    for k in _DOTENV_KEYS - set(values):
+        os.environ.pop(k, None)  # removed from .env since last load
+    _DOTENV_KEYS.clear()
+    for k, v in values.items():
+        if k not in _PROCESS_ENV_KEYS:
+            os.environ[k] = v
+            _DOTENV_KEYS.add(k)
 
 # ============================================================
 # App imports (after ENV)
 # ============================================================
+from .config import get_config, reload_config
 from .services.job_service import JobService
-from .services.export_service import export_rows_to_csv_bytes, export_rows_to_xlsx_bytes
+from .services.export_service import export_rows_to_csv_chunks, export_rows_to_xlsx_file
 
 # ============================================================
 # FastAPI app
 # ============================================================
-app = FastAPI(title="PDF Accounting Importer (PEAK A–U)")
+app = FastAPI(title="PDF Accounting Importer (PEAK A–U)", default_response_class=_DefaultResponse)
+
+# ============================================================
+# ✅ Reject oversized uploads from Content-Length (before the body is read)
+#    registered before CORS so the error response still gets CORS headers
+# ============================================================
+@app.middleware("http")
+async def upload_size_guard(request: Request, call_next):
+    if request.method == "POST" and request.url.path == "/api/upload":
+        raw = request.headers.get("content-length")
+        if raw and raw.isdigit():
+            limit = get_config().max_request_bytes
+            if int(raw) > limit:
+                return JSONResponse(
+                    status_code=413,
+                    content={"detail": f"Upload too large (max {limit/1024/1024:.1f} MB per request)"},
+                )
+    return await call_next(request)
 
 # ============================================================
 # CORS (configurable)
@@ -92,12 +152,6 @@ jobs = JobService()
 # ============================================================
 # ✅ Helpers
 # ============================================================
-def _env_bool(name: str, default: bool = False) -> bool:
-    v = os.getenv(name)
-    if v is None:
-        return default
-    return str(v).strip().lower() in {"1", "true", "yes", "y", "on"}
-
 def _parse_bool_field(raw: Optional[str], default: Optional[bool] = None) -> Optional[bool]:
     """
     Accept:
@@ -131,7 +185,7 @@ def _safe_filename(name: str) -> str:
 # ============================================================
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
-    debug = _env_bool("DEBUG", default=False)
+    debug = get_config().debug
     payload: Dict[str, Any] = {
         "ok": False,
         "error": "internal_error",
@@ -139,11 +193,18 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
         "path": str(request.url),
         "method": request.method,
     }
-    try:
-        logger.exception("Unhandled error: %s %s", request.method, request.url)
-    except Exception:
-        pass
-    return JSONResponse(status_code=500, content=payload)
+    # traceback formatting is the expensive part -> only when ERROR is actually emitted
+    if logger.isEnabledFor(logging.ERROR):
+        try:
+            logger.exception("Unhandled error: %s %s", request.method, request.url)
+        except Exception:
+            pass
+    return _DefaultResponse(status_code=500, content=payload)
+
+# ============================================================
+# ✅ Minimal platform whitelist
+# ============================================================
+ALLOWED_PLATFORMS = frozenset({"shopee", "lazada", "tiktok", "spx", "ads", "other", "unknown"})
 
 # ============================================================
 # ✅ Helpers: cfg parsing + safe service call
@@ -155,8 +216,22 @@ def _parse_list_field(raw: Optional[str]) -> List[str]:
     if not s:
         return []
 
+    # Plain value / "A,B" (most form fields): cannot be JSON -> no json.loads attempt
+    head = s[0]
+    if head != "[" and head != '"':
+        if "," not in s:
+            return [s]
+        return [x.strip() for x in s.split(",") if x.strip()]
+
+    # '"value"' without escapes/control chars: json.loads would return the inner text as-is
+    if len(s) >= 2 and head == '"' and s[-1] == '"':
+        inner = s[1:-1]
+        if '"' not in inner and "\\" not in inner and inner.isprintable():
+            inner = inner.strip()
+            return [inner] if inner else []
+
     # Try JSON
-    if (s.startswith("[") and s.endswith("]")) or (s.startswith('"') and s.endswith('"')):
+    if (head == "[" and s.endswith("]")) or (head == '"' and s.endswith('"')):
         try:
             v = json.loads(s)
             if isinstance(v, list):
@@ -184,26 +259,19 @@ def _normalize_cfg(
     compute_wht: Optional[str],
     strictMode: Optional[str] = None,
 ) -> Dict[str, Any]:
-    tags = [t.upper().strip() for t in _parse_list_field(client_tags)]
-    plats = [p.lower().strip() for p in _parse_list_field(platforms)]
-    taxs = [t.strip() for t in _parse_list_field(client_tax_ids)]
-
-    def uniq(seq: List[str]) -> List[str]:
-        seen = set()
-        out: List[str] = []
-        for x in seq:
-            if x and x not in seen:
-                seen.add(x)
-                out.append(x)
-        return out
+    # _parse_list_field already strips and drops empties -> case-fold + ordered dedupe in one pass
+    tags = list(dict.fromkeys(t.upper() for t in _parse_list_field(client_tags)))
+    # platforms: keep only the whitelist, in the same pass
+    plats = list(dict.fromkeys(p for p in map(str.lower, _parse_list_field(platforms)) if p in ALLOWED_PLATFORMS))
+    taxs = list(dict.fromkeys(_parse_list_field(client_tax_ids)))
 
     cw = _parse_bool_field(compute_wht, default=None)
     sm = _parse_bool_field(strictMode, default=None)
 
     cfg: Dict[str, Any] = {
-        "client_tags": uniq(tags),
-        "client_tax_ids": uniq(taxs),
-        "platforms": uniq(plats),
+        "client_tags": tags,
+        "client_tax_ids": taxs,
+        "platforms": plats,
     }
 
     # ✅ important: compute_wht flag
@@ -218,93 +286,159 @@ def _normalize_cfg(
 
     return cfg
 
+@functools.lru_cache(maxsize=64)
+def _supported_params(fn: Any) -> FrozenSet[str]:
+    # signature ของ service method ไม่เปลี่ยน -> introspect ครั้งเดียวต่อ function
+    return frozenset(inspect.signature(fn).parameters)
+
 def _call_if_supported(obj: Any, method_name: str, /, *args: Any, **kwargs: Any) -> Any:
     fn = getattr(obj, method_name, None)
     if fn is None:
         raise AttributeError(f"{type(obj).__name__}.{method_name} not found")
 
     try:
-        sig = inspect.signature(fn)
-        params = sig.parameters
+        # key on the plain function (bound methods are new objects per getattr)
+        params = _supported_params(getattr(fn, "__func__", fn))
         supported = {k: v for k, v in kwargs.items() if k in params}
         return fn(*args, **supported)
     except Exception:
         return fn(*args)
 
+def _bind_with_cfg(obj: Any, method_name: str) -> Tuple[Any, bool]:
+    """(bound method, accepts cfg=?) resolved once -> hot loops call it directly"""
+    fn = getattr(obj, method_name)
+    return fn, "cfg" in _supported_params(getattr(fn, "__func__", fn))
+
+# per-file call in upload(): no introspection / kwarg filtering / try-except per file
+_ADD_FILE, _ADD_FILE_TAKES_CFG = _bind_with_cfg(jobs, "add_file")
+
 # ============================================================
 # ✅ Streaming read with max bytes (prevent RAM blow)
 # ============================================================
-async def _read_uploadfile_safely(f: UploadFile, max_bytes: int) -> bytes:
-    buf = io.BytesIO()
+def _file_too_large(filename: Optional[str], max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File too large: {filename} (max {max_bytes/1024/1024:.1f} MB)",
+    )
+
+def _copy_to_spool(src: Any, filename: Optional[str], max_bytes: int, chunk_size: int, spool_max: int) -> Tuple[Any, int, str]:
+    """blocking copy src -> SpooledTemporaryFile (size-limited, blake2b-hashed); run via to_thread"""
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max)
+    digest = hashlib.blake2b(digest_size=16)
     total = 0
-    chunk_size = int(os.getenv("UPLOAD_READ_CHUNK_BYTES", "1048576"))  # 1MB default
-
-    while True:
-        chunk = await f.read(chunk_size)
-        if not chunk:
-            break
-        total += len(chunk)
-        if total > max_bytes:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large: {f.filename} (max {max_bytes/1024/1024:.1f} MB)",
-            )
-        buf.write(chunk)
+    read = src.read
+    write = spool.write
 
-    return buf.getvalue()
+    try:
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise _file_too_large(filename, max_bytes)
+            digest.update(chunk)
+            write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, total, digest.hexdigest()
+
+async def _spool_uploadfile_safely(
+    f: UploadFile,
+    max_bytes: int,
+    chunk_size: int = 1024 * 1024,
+    spool_max: int = 2 * 1024 * 1024,
+) -> Tuple[Any, int, str]:
+    """
+    Stream upload into a SpooledTemporaryFile: RAM up to spool_max, then it rolls
+    over to disk -> a big batch no longer sits in RAM as one bytes object per file.
+    Size limit is enforced mid-stream; content is hashed (blake2b) on the way through.
+    Returns (spool rewound to 0, size, hex digest).
+    """
+    # Starlette already knows the part size -> reject without touching the bytes
+    size_hint = getattr(f, "size", None)
+    if isinstance(size_hint, int) and size_hint > max_bytes:
+        raise _file_too_large(f.filename, max_bytes)
 
-# ============================================================
-# ✅ Minimal platform whitelist
-# ============================================================
-ALLOWED_PLATFORMS = {"shopee", "lazada", "tiktok", "spx", "ads", "other", "unknown"}
+    # the part is already spooled by Starlette: copy it in ONE worker-thread hop
+    # instead of an awaited f.read() (threadpool round-trip once rolled to disk) per chunk
+    return await asyncio.to_thread(_copy_to_spool, f.file, f.filename, max_bytes, chunk_size, spool_max)
+
+def _iter_file_chunks(fileobj: Any, chunk_size: int = 64 * 1024):
+    """yield a (spooled) file in chunks, close it when done or when the client disconnects"""
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
 
 # ============================================================
 # Routes
 # ============================================================
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 @app.get("/api/health")
 def health():
+    cfg = get_config()
     return {
         "ok": True,
         "time_ms": _now_ms(),
         "ai": {
-            "enabled": _env_bool("ENABLE_AI_EXTRACT", default=False) or _env_bool("ENABLE_LLM", default=False),
-            "provider": os.getenv("AI_PROVIDER", ""),
-            "model": os.getenv("OPENAI_MODEL", ""),
-            "repair_pass": _env_bool("AI_REPAIR_PASS", default=False),
-            "fill_missing": _env_bool("AI_FILL_MISSING", default=True),
-            "has_openai_key": bool(os.getenv("OPENAI_API_KEY")),
+            "enabled": cfg.ai_enabled,
+            "provider": cfg.ai_provider,
+            "model": cfg.openai_model,
+            "repair_pass": cfg.ai_repair_pass,
+            "fill_missing": cfg.ai_fill_missing,
+            "has_openai_key": cfg.has_openai_key,
         },
         "ocr": {
-            "enabled": _env_bool("ENABLE_OCR", default=True),
-            "provider": os.getenv("OCR_PROVIDER", "paddle"),
+            "enabled": cfg.ocr_enabled,
+            "provider": cfg.ocr_provider,
         },
         "cors": {"origins": allow_origins},
         "limits": {
-            "max_files": int(os.getenv("MAX_UPLOAD_FILES", "500")),
-            "max_file_mb": float(os.getenv("MAX_FILE_MB", "25")),
+            "max_files": cfg.max_files,
+            "max_file_mb": cfg.max_file_mb,
+            "max_request_mb": round(cfg.max_request_bytes / 1024 / 1024, 1),
         },
     }
 
 @app.get("/api/config")
 def config_check():
+    cfg = get_config()
     return {
         "ok": True,
         "env": {
-            "DEBUG": os.getenv("DEBUG", ""),
-            "LOG_LEVEL": os.getenv("LOG_LEVEL", ""),
-            "ENABLE_AI_EXTRACT": os.getenv("ENABLE_AI_EXTRACT", ""),
-            "ENABLE_LLM": os.getenv("ENABLE_LLM", ""),
-            "AI_PROVIDER": os.getenv("AI_PROVIDER", ""),
-            "OPENAI_MODEL": os.getenv("OPENAI_MODEL", ""),
-            "AI_REPAIR_PASS": os.getenv("AI_REPAIR_PASS", ""),
-            "AI_FILL_MISSING": os.getenv("AI_FILL_MISSING", ""),
-            "OCR_PROVIDER": os.getenv("OCR_PROVIDER", ""),
-            "ENABLE_OCR": os.getenv("ENABLE_OCR", ""),
-            "CORS_ORIGINS": os.getenv("CORS_ORIGINS", ""),
-            "OPENAI_API_KEY_present": bool(os.getenv("OPENAI_API_KEY")),
+            **cfg.env_echo,
+            "OPENAI_API_KEY_present": cfg.has_openai_key,
         },
     }
 
+def _reload_allowed(request: Request) -> bool:
+    # ✅ DEBUG mode, or a shared secret in X-Config-Reload-Token
+    if get_config().debug:
+        return True
+    token = os.getenv("CONFIG_RELOAD_TOKEN", "")
+    given = request.headers.get("x-config-reload-token", "")
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+@app.post("/api/config/reload")
+def config_reload(request: Request):
+    # ✅ env is snapshotted at boot; re-read only when explicitly asked
+    #    (CORS / logging are wired at startup and are not affected)
+    if not _reload_allowed(request):
+        raise HTTPException(status_code=404, detail="Not Found")
+    _reload_dotenv()
+    reload_config()
+    return config_check()
+
 @app.post("/api/upload")
 async def upload(
     files: List[UploadFile] = File(...),
@@ -321,22 +455,20 @@ async def upload(
 
     cfg = _normalize_cfg(client_tags, client_tax_ids, platforms, compute_wht, strictMode=strictMode)
 
-    # keep only allowed platforms
-    if cfg.get("platforms"):
-        cfg["platforms"] = [p for p in cfg["platforms"] if p in ALLOWED_PLATFORMS]
-
     # If compute_wht not provided -> choose default here (so whole pipeline consistent)
     # You can flip to False if your default is "ไม่คำนวณ"
     if "compute_wht" not in cfg:
         cfg["compute_wht"] = True
 
     # limits
-    max_files = int(os.getenv("MAX_UPLOAD_FILES", "500"))
+    app_cfg = get_config()
+    max_files = app_cfg.max_files
     if len(files) > max_files:
         raise HTTPException(status_code=400, detail=f"Too many files (max {max_files})")
 
-    max_mb = float(os.getenv("MAX_FILE_MB", "25"))
-    max_bytes = int(max_mb * 1024 * 1024)
+    max_bytes = app_cfg.max_bytes
+    chunk_size = app_cfg.upload_chunk_bytes
+    spool_max = app_cfg.upload_spool_max_bytes
 
     # create job (attach cfg if supported)
     job_id = _call_if_supported(jobs, "create_job", cfg=cfg)
@@ -345,7 +477,10 @@ async def upload(
     skipped = 0
     reasons: List[str] = []
 
-    for f in files:
+    # ✅ read/spool files concurrently (bounded), then add them to the job in upload order
+    sem = asyncio.Semaphore(app_cfg.upload_concurrency)
+
+    async def _read_one(f: UploadFile) -> Tuple[str, str, Any, str, str]:
         filename = _safe_filename(f.filename or "")
 
         ctype = (f.content_type or "").lower()
@@ -354,25 +489,48 @@ async def upload(
             or ctype.startswith("image/")
             or ctype == "application/octet-stream"
         ):
+            return filename, "", None, "", f"skip:{filename}:unsupported_content_type:{ctype}"
+
+        async with sem:
+            content, size, digest = await _spool_uploadfile_safely(
+                f, max_bytes=max_bytes, chunk_size=chunk_size, spool_max=spool_max
+            )
+        if not size:
+            content.close()
+            return filename, "", None, "", f"skip:{filename}:empty"
+        return filename, f.content_type or "", content, digest, ""
+
+    results = await asyncio.gather(*(_read_one(f) for f in files), return_exceptions=True)
+
+    # first failure in upload order wins (e.g. "File too large"); release every spool
+    first_exc = next((r for r in results if isinstance(r, BaseException)), None)
+    if first_exc is not None:
+        for r in results:
+            if not isinstance(r, BaseException) and r[2] is not None:
+                r[2].close()
+        raise first_exc
+
+    # ✅ same bytes twice in one batch -> OCR/LLM once (first copy wins, later ones are skipped)
+    seen: Dict[str, str] = {}
+
+    for filename, content_type, content, digest, reason in results:
+        if content is None:
             skipped += 1
-            reasons.append(f"skip:{filename}:unsupported_content_type:{ctype}")
+            reasons.append(reason)
             continue
 
-        content = await _read_uploadfile_safely(f, max_bytes=max_bytes)
-        if not content:
+        first = seen.get(digest)
+        if first is not None:
+            content.close()
             skipped += 1
-            reasons.append(f"skip:{filename}:empty")
+            reasons.append(f"skip:{filename}:duplicate_of:{first}")
             continue
+        seen[digest] = filename
 
-        _call_if_supported(
-            jobs,
-            "add_file",
-            job_id=job_id,
-            filename=filename,
-            content_type=f.content_type or "",
-            content=content,
-            cfg=cfg,  # optional
-        )
+        if _ADD_FILE_TAKES_CFG:
+            _ADD_FILE(job_id=job_id, filename=filename, content_type=content_type, content=content, cfg=cfg)
+        else:
+            _ADD_FILE(job_id=job_id, filename=filename, content_type=content_type, content=content)
         added += 1
 
     if added == 0:
@@ -413,12 +571,10 @@ def export_csv(job_id: str):
     if rows is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    data = export_rows_to_csv_bytes(rows)
-    filename = f"peak_import_{job_id}.csv"
     return StreamingResponse(
-        io.BytesIO(data),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        export_rows_to_csv_chunks(rows),
+        media_type=CSV_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="peak_import_{job_id}.csv"'},
     )
 
 @app.get("/api/export/{job_id}.xlsx")
@@ -427,10 +583,8 @@ def export_xlsx(job_id: str):
     if rows is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    data = export_rows_to_xlsx_bytes(rows)
-    filename = f"peak_import_{job_id}.xlsx"
     return StreamingResponse(
-        io.BytesIO(data),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        _iter_file_chunks(export_rows_to_xlsx_file(rows)),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="peak_import_{job_id}.xlsx"'},
     )
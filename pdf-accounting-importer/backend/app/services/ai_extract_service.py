@@ -26,6 +26,8 @@ from openpyxl import Workbook
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, numbers
 from openpyxl.utils import get_column_letter
 
+from ..extractors.common import compile_regex
+
 logger = logging.getLogger(__name__)
 
 # =========================
@@ -145,7 +147,8 @@ RE_YYYYMMDD = re.compile(r"^\d{8}$")
 RE_YYYY_MM_DD = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
 RE_DD_MM_YYYY = re.compile(r"^(\d{2})/(\d{2})/(\d{4})$")
 RE_YYYY_MM_DD_SLASH = re.compile(r"^(\d{4})/(\d{2})/(\d{2})$")
-RE_ALL_WS = re.compile(r"\s+")
+RE_ALL_WS = compile_regex(r"\s+")  # per cell in _compact_no_ws; RE2 when EXTRACT_USE_RE2=1
+RE_NON_DIGIT = re.compile(r"\D+")
 RE_AMOUNT_CLEAN = re.compile(r"[,\s]|฿|THB|บาท", re.IGNORECASE)
 
 MAX_ROWS = 50000
@@ -214,11 +217,16 @@ def _compact_no_ws(v: Any) -> str:
         return s
 
 
+def _digits_only(s: str) -> str:
+    # isdigit() fallback for non-ASCII (Thai digits, superscripts ...)
+    return RE_NON_DIGIT.sub("", s) if s.isascii() else "".join(filter(str.isdigit, s))
+
+
 def _to_tax13(v: Any) -> str:
     s = _s(v)
     if not s:
         return ""
-    digits = "".join(c for c in s if c.isdigit())
+    digits = _digits_only(s)
     return digits[:13] if len(digits) >= 13 else ""
 
 
@@ -226,7 +234,7 @@ def _to_branch5(v: Any) -> str:
     s = _s(v)
     if not s:
         return "00000"
-    digits = "".join(c for c in s if c.isdigit())
+    digits = _digits_only(s)
     if not digits:
         return "00000"
     return digits.zfill(5)[:5]
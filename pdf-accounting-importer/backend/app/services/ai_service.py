@@ -22,15 +22,30 @@ AI Service - Enhanced Version (Multi-Platform + HARD LOCK rules)
 
 from __future__ import annotations
 
+import functools
 import json
 import os
 import re
 import logging
+import threading
+import time
 from decimal import Decimal, InvalidOperation
 from typing import Any, Dict, Optional, Tuple, Set, List
 
 import requests
 
+# Optional: faster JSON for the big Thai prompt / response bodies
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# Optional: token-exact truncation of LLM input
+try:
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------
@@ -168,6 +183,7 @@ RE_DATE_DD_MM_YYYY = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
 
 # ชื่อไฟล์แบบที่คุณย้ำ เช่น ...-251203-...
 RE_FILENAME_YYMMDD = re.compile(r"(?:^|[-_])(\d{2})(\d{2})(\d{2})(?:[-_]|$)")
+RE_NON_DIGIT = re.compile(r"\D+")
 
 
 # ---------------------------------------------------------------------
@@ -194,7 +210,8 @@ def _normalize_text(text: str) -> str:
 
 def _digits_only(v: Any) -> str:
     try:
-        return "".join(c for c in str(v or "") if c.isdigit())
+        s = str(v or "")
+        return RE_NON_DIGIT.sub("", s) if s.isascii() else "".join(filter(str.isdigit, s))
     except Exception:
         return ""
 
@@ -239,6 +256,29 @@ def _clamp_choice(v: Any, allowed: Set[str], fallback: str) -> str:
     except Exception:
         return fallback
 
+def _json_dumps(obj: Any) -> str:
+    """json.dumps(obj, ensure_ascii=False) (orjson when installed; compact separators)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False)
+
+def _json_body(obj: Any) -> bytes:
+    """UTF-8 request body (what requests' json= would send, without the ASCII escaping)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+def _json_loads(raw: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 def _first_json_object(s: str) -> Optional[str]:
     if not s:
         return None
@@ -382,6 +422,45 @@ def _truncate_text_smart(text: str, max_len: int) -> str:
     except Exception:
         return text or ""
 
+@functools.lru_cache(maxsize=8)
+def _token_encoder(model: str) -> Any:
+    """tiktoken encoder per model (slow to build -> cached); None if tiktoken/BPE file unavailable"""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning("tiktoken unavailable for %s: %s", model, e)
+        return None
+
+def _truncate_text_for_model(text: str, model: str, max_len: int) -> str:
+    """
+    Cost/latency follow tokens, not chars (Thai OCR ~2 chars/token):
+    with tiktoken -> keep head 65% / tail of OPENAI_TOKENS_MAX tokens,
+    then OPENAI_TEXT_MAX (max_len) still caps chars via _truncate_text_smart.
+    Without tiktoken only the char limit applies.
+    """
+    enc = _token_encoder(model)
+    if enc is None:
+        return _truncate_text_smart(text, max_len)
+    try:
+        t = (text or "").strip()
+        max_tokens = int(os.getenv("OPENAI_TOKENS_MAX", "8000") or "8000")
+        ids = enc.encode(t, disallowed_special=())
+        if len(ids) > max_tokens:
+            head = max(0, int(max_tokens * 0.65))
+            # ✅ tiny OPENAI_TOKENS_MAX (<= ~45) -> no tail (ids[-0:] would be the whole text)
+            tail = max(0, max_tokens - head - 16)
+            t = enc.decode(ids[:head]) + "\n\n...<TRUNCATED>...\n\n"
+            if tail:
+                t += enc.decode(ids[-tail:])
+        return _truncate_text_smart(t, max_len)
+    except Exception:
+        return _truncate_text_smart(text, max_len)
+
 # ---------------------------------------------------------------------
 # Amount helpers for HARD RULE: WHT from SUBTOTAL
 # ---------------------------------------------------------------------
@@ -414,6 +493,22 @@ def _calc_wht_amount_from_subtotal(subtotal: Decimal, rate: Decimal) -> Decimal:
 # ---------------------------------------------------------------------
 # OpenAI API
 # ---------------------------------------------------------------------
+# one requests.Session per worker thread -> keep-alive pool reused across files
+# (no new TCP + TLS handshake per LLM call); per-thread because jobs run in threads
+_HTTP = threading.local()
+
+# HTTP statuses worth retrying (timeouts / rate limit / upstream hiccups)
+_OPENAI_RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def _http_session() -> requests.Session:
+    sess = getattr(_HTTP, "session", None)
+    if sess is None:
+        sess = requests.Session()
+        _HTTP.session = sess
+    return sess
+
+
 def _openai_chat_json(system: str, user: str, model: str) -> Dict[str, Any]:
     try:
         api_key = os.getenv("OPENAI_API_KEY")
@@ -435,10 +530,29 @@ def _openai_chat_json(system: str, user: str, model: str) -> Dict[str, Any]:
             "response_format": {"type": "json_object"},
         }
 
+        body = _json_body(payload)
+
         timeout = float(os.getenv("OPENAI_TIMEOUT", "90") or "90")
-        r = requests.post(url, headers=headers, json=payload, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
+        retries = max(0, int(os.getenv("OPENAI_MAX_RETRIES", "2") or "2"))
+
+        # ✅ transient 408/429/5xx / timeout / connection reset -> retry with 1s, 2s, 4s ... backoff
+        attempt = 0
+        while True:
+            try:
+                r = _http_session().post(url, headers=headers, data=body, timeout=timeout)
+                r.raise_for_status()
+                break
+            except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                retryable = status is None or status in _OPENAI_RETRY_STATUS
+                if not retryable or attempt >= retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning("OpenAI API transient error (%s), retry %s/%s in %ss", status or type(e).__name__, attempt + 1, retries, delay)
+                time.sleep(delay)
+                attempt += 1
+
+        data = _json_loads(r.content)
 
         content = ""
         try:
@@ -448,7 +562,7 @@ def _openai_chat_json(system: str, user: str, model: str) -> Dict[str, Any]:
 
         js = _first_json_object(content) or "{}"
         try:
-            obj = json.loads(js)
+            obj = _json_loads(js)
             return obj if isinstance(obj, dict) else {}
         except Exception:
             return {}
@@ -719,7 +833,7 @@ def ai_fill_peak_row(
     try:
         model = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
         max_len = int(os.getenv("OPENAI_TEXT_MAX", "22000") or "22000")
-        t = _truncate_text_smart(full_text, max_len)
+        t = _truncate_text_for_model(full_text, model, max_len)
 
         # detect platform
         platform = _detect_platform(full_text, hint=platform_hint)
@@ -784,7 +898,7 @@ def ai_fill_peak_row(
             "document_text": t,
         }
 
-        out = _openai_chat_json(system=system, user=json.dumps(user_payload, ensure_ascii=False), model=model)
+        out = _openai_chat_json(system=system, user=_json_dumps(user_payload), model=model)
         if not out:
             logger.warning("OpenAI returned empty response")
             return {}
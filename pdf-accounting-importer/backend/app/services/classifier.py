@@ -1,12 +1,23 @@
 # backend/app/services/classifier.py
 from __future__ import annotations
 
+import hashlib
 import os
 import re
 import logging
-from typing import Literal, Dict, Tuple, Optional
+import threading
+from collections import OrderedDict
+from typing import Literal, Dict, FrozenSet, List, Tuple, Optional, Sequence
 
 from ..utils.text_utils import normalize_text
+from ..extractors._scanner import KeywordCounter
+from ..extractors.common import compile_regex
+
+# Optional: xxhash (non-crypto, very fast) for the result-cache key
+try:
+    import xxhash  # type: ignore
+except Exception:  # pragma: no cover
+    xxhash = None  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -22,41 +33,69 @@ PlatformLabel = Literal[
     "UNKNOWN",   # Unknown/Other
 ]
 
+# ✅ score slots: _weighted_score works on a plain list indexed by these
+# (dict only at the API boundary, keys in this order)
+_SCORE_LABELS: Tuple[PlatformLabel, ...] = ("META", "GOOGLE", "SHOPEE", "LAZADA", "TIKTOK", "SPX", "THAI_TAX")
+_META, _GOOGLE, _SHOPEE, _LAZADA, _TIKTOK, _SPX, _THAI_TAX = range(len(_SCORE_LABELS))
+
 # ---------------------------------------------------------------------
 # Strong ID Regex (High Confidence)
 # ---------------------------------------------------------------------
 
 # Meta/Facebook Ads patterns
-RE_META_RECEIPT = re.compile(r"\bRC\s*META\s*[A-Z0-9\-/]{6,}\b", re.IGNORECASE)
-RE_META_IRELAND = re.compile(r"meta\s*platforms?\s*ireland", re.IGNORECASE)
-RE_FACEBOOK = re.compile(r"\b(facebook|fb\s*ads|instagram\s*ads)\b", re.IGNORECASE)
+RE_META_RECEIPT = compile_regex(r"\bRC\s*META\s*[A-Z0-9\-/]{6,}\b", re.IGNORECASE)
+RE_META_IRELAND = compile_regex(r"meta\s*platforms?\s*ireland", re.IGNORECASE)
+RE_FACEBOOK = compile_regex(r"\b(facebook|fb\s*ads|instagram\s*ads)\b", re.IGNORECASE)
 
 # Google Ads patterns
-RE_GOOGLE_PAYMENT = re.compile(r"\b[VW]\s*\d{15,20}\b", re.IGNORECASE)  # V0971174339667745
-RE_GOOGLE_ASIA = re.compile(r"google\s*asia\s*pacific", re.IGNORECASE)
-RE_GOOGLE_ADS = re.compile(r"\b(google\s*ad(?:s|words)?|google\s*advertising)\b", re.IGNORECASE)
+RE_GOOGLE_PAYMENT = compile_regex(r"\b[VW]\s*\d{15,20}\b", re.IGNORECASE)  # V0971174339667745
+RE_GOOGLE_ASIA = compile_regex(r"google\s*asia\s*pacific", re.IGNORECASE)
+RE_GOOGLE_ADS = compile_regex(r"\b(google\s*ad(?:s|words)?|google\s*advertising)\b", re.IGNORECASE)
 
 # Thai Tax Invoice patterns
-RE_THAI_TAX_INVOICE = re.compile(r"(ใบกำกับภาษี|ใบเสร็จรับเงิน|tax\s*invoice)", re.IGNORECASE)
-RE_TAX_ID_13 = re.compile(r"\b(\d{13})\b")
-RE_BRANCH_5 = re.compile(r"(?:branch|สาขา)\s*[:#]?\s*(\d{5})", re.IGNORECASE)
+RE_THAI_TAX_INVOICE = compile_regex(r"(ใบกำกับภาษี|ใบเสร็จรับเงิน|tax\s*invoice)", re.IGNORECASE)
+RE_TAX_ID_13 = compile_regex(r"\b(\d{13})\b")
+RE_BRANCH_5 = compile_regex(r"(?:branch|สาขา)\s*[:#]?\s*(\d{5})", re.IGNORECASE)
 
 # SPX patterns (shipping docs)
-RE_SPX_RCSPX = re.compile(r"\bRCS\s*PX\s*[A-Z0-9\-/]{6,}\b", re.IGNORECASE)
+RE_SPX_RCSPX = compile_regex(r"\bRCS\s*PX\s*[A-Z0-9\-/]{6,}\b", re.IGNORECASE)
 RE_SPX_RCS_ANY = re.compile(r"\bRCS\s*[A-Z0-9]{3,}\b", re.IGNORECASE)
 
 # Lazada
-RE_LAZADA_THMPTI = re.compile(r"\bTHMPTI\s*\d{10,20}\b", re.IGNORECASE)
+RE_LAZADA_THMPTI = compile_regex(r"\bTHMPTI\s*\d{10,20}\b", re.IGNORECASE)
 
 # TikTok
-RE_TIKTOK_TTSTH = re.compile(r"\bTTSTH[0-9A-Z\-/]*\b", re.IGNORECASE)
-RE_TIKTOK_WORD = re.compile(r"\btiktok\b", re.IGNORECASE)
+RE_TIKTOK_TTSTH = compile_regex(r"\bTTSTH[0-9A-Z\-/]*\b", re.IGNORECASE)
+RE_TIKTOK_WORD = compile_regex(r"\btiktok\b", re.IGNORECASE)
 
 # Shopee
-RE_SHOPEE_TIV = re.compile(r"\bTIV\s*-\s*[A-Z0-9]{3,}\b", re.IGNORECASE)
-RE_SHOPEE_TIR = re.compile(r"\bTIR\s*-\s*[A-Z0-9]{3,}\b", re.IGNORECASE)
-RE_SHOPEE_WORD = re.compile(r"\bshopee\b", re.IGNORECASE)
-RE_SHOPEE_TRS = re.compile(r"\bTRS\b", re.IGNORECASE)  # weak; only with shopee context
+RE_SHOPEE_TIV = compile_regex(r"\bTIV\s*-\s*[A-Z0-9]{3,}\b", re.IGNORECASE)
+RE_SHOPEE_TIR = compile_regex(r"\bTIR\s*-\s*[A-Z0-9]{3,}\b", re.IGNORECASE)
+RE_SHOPEE_WORD = compile_regex(r"\bshopee\b", re.IGNORECASE)
+RE_SHOPEE_TRS = compile_regex(r"\bTRS\b", re.IGNORECASE)  # weak; only with shopee context
+
+# ✅ strong IDs above: (name, pattern, literals a match must contain - any one).
+# _strong_ids() runs a pattern only when one of its literals is in the
+# (lowercased) text; a plain `in` is far cheaper than an IGNORECASE search.
+# Searched per document -> compile_regex: RE2 with EXTRACT_USE_RE2=1, else `re`
+_STRONG_ID_PATTERNS: Tuple[Tuple[str, re.Pattern, Tuple[str, ...]], ...] = (
+    ("meta_receipt", RE_META_RECEIPT, ("meta",)),
+    ("meta_ireland", RE_META_IRELAND, ("ireland",)),
+    ("facebook", RE_FACEBOOK, ("facebook", "fb", "instagram")),
+    ("google_payment", RE_GOOGLE_PAYMENT, ()),
+    ("google_asia", RE_GOOGLE_ASIA, ("google",)),
+    ("google_ads", RE_GOOGLE_ADS, ("google",)),
+    ("spx", RE_SPX_RCSPX, ("rcs",)),
+    ("lazada", RE_LAZADA_THMPTI, ("thmpti",)),
+    ("tiktok_id", RE_TIKTOK_TTSTH, ("ttsth",)),
+    ("tiktok_word", RE_TIKTOK_WORD, ("tiktok",)),
+    ("shopee_tiv", RE_SHOPEE_TIV, ("tiv",)),
+    ("shopee_tir", RE_SHOPEE_TIR, ("tir",)),
+    ("shopee_word", RE_SHOPEE_WORD, ("shopee",)),
+)
+# lowercase chars IGNORECASE still folds onto ASCII letters (dotless i, long s):
+# literal gating is skipped for text containing them
+_FOLD_TO_ASCII = ("\u0131", "\u017f")
 
 # ---------------------------------------------------------------------
 # Filename-only hints (สำคัญมากเวลาข้อความใน PDF สั้น)
@@ -156,8 +195,13 @@ RE_SELLER_ID_LOOSE = re.compile(r"\bseller\s*id\s*[:#]?\s*([0-9]{6,20})\b", re.I
 def _norm(s: str) -> str:
     """Normalize + lower + trim; keep speed stable"""
     try:
-        t = normalize_text(s or "").lower()
-        # prevent mega text slowdown
+        t = normalize_text(s or "")
+        # prevent mega text slowdown; cut BEFORE lower() so the dropped middle is
+        # never lowercased (same result unless lower() could change length/context:
+        # U+0130 -> 2 chars, U+03A3 final-sigma rule)
+        if len(t) > 160_000 and "\u0130" not in t and "\u03a3" not in t:
+            return (t[:100_000] + "\n...\n" + t[-40_000:]).lower()
+        t = t.lower()
         if len(t) > 160_000:
             t = t[:100_000] + "\n...\n" + t[-40_000:]
         return t
@@ -170,12 +214,21 @@ def _contains_any(t: str, needles: tuple[str, ...]) -> bool:
     return any(n and (n in t) for n in needles)
 
 
-def _count_contains(t: str, needles: tuple[str, ...]) -> int:
-    hit = 0
-    for n in needles:
-        if n and (n in t):
-            hit += 1
-    return hit
+# ✅ every keyword list _weighted_score counts in the text -> one scan per document
+_TEXT_SIGS = KeywordCounter({
+    "META_STRONG": META_SIGS_STRONG,
+    "META_WEAK": META_SIGS_WEAK,
+    "GOOGLE_STRONG": GOOGLE_SIGS_STRONG,
+    "GOOGLE_WEAK": GOOGLE_SIGS_WEAK,
+    "SPX": SPX_SIGS,
+    "LAZADA": LAZADA_SIGS,
+    "TIKTOK": TIKTOK_SIGS,
+    "SHOPEE": SHOPEE_SIGS,
+    "THAI_TAX": THAI_TAX_SIGS,
+    "RCSPX": ("rcspx",),
+    "TRS": ("trs",),
+    "SHOPEE_CTX": ("shopee", "tiv", "tir"),
+})
 
 
 def _regex_hit(t: str, rx: re.Pattern) -> bool:
@@ -185,6 +238,29 @@ def _regex_hit(t: str, rx: re.Pattern) -> bool:
         return False
 
 
+def _folds_to_ascii(t: str) -> bool:
+    """True if t has a non-ASCII char an IGNORECASE pattern matches as an ASCII letter"""
+    return any(ch in t for ch in _FOLD_TO_ASCII)
+
+
+def _strong_ids(t: str) -> FrozenSet[str]:
+    """
+    Names of the _STRONG_ID_PATTERNS that match t (same answers as one
+    _regex_hit per pattern). t is _norm() output, i.e. already lowercase,
+    so a pattern whose literals are all absent cannot match and is skipped.
+    """
+    if not t:
+        return frozenset()
+    gate = not _folds_to_ascii(t)
+    found = set()
+    for name, rx, literals in _STRONG_ID_PATTERNS:
+        if gate and literals and not any(lit in t for lit in literals):
+            continue
+        if _regex_hit(t, rx):
+            found.add(name)
+    return frozenset(found)
+
+
 def _has_vendor_tax_id(t: str) -> bool:
     """
     ✅ Check if text has 13-digit tax ID NOT in client list
@@ -260,196 +336,274 @@ def extract_marketplace_identity(text: str) -> Tuple[str, str]:
         return "", ""
 
 
-def _filename_boost(score: Dict[str, int], fn: str) -> None:
+def _filename_boost(score: List[int], fn: str) -> None:
     """Filename-only boosting (critical for short PDFs / image-based)"""
     if not fn:
         return
 
     # SPX highest among filename hints
     if _contains_any(fn, FILENAME_SPX_HINTS) or "rcspx" in fn:
-        score["SPX"] += 55
+        score[_SPX] += 55
 
     # META / GOOGLE
     if _contains_any(fn, FILENAME_META_HINTS):
-        score["META"] += 40
+        score[_META] += 40
     if _contains_any(fn, FILENAME_GOOGLE_HINTS):
-        score["GOOGLE"] += 40
+        score[_GOOGLE] += 40
 
     # marketplaces
     if _contains_any(fn, FILENAME_LAZADA_HINTS):
-        score["LAZADA"] += 30
+        score[_LAZADA] += 30
     if _contains_any(fn, FILENAME_TIKTOK_HINTS):
-        score["TIKTOK"] += 26
+        score[_TIKTOK] += 26
     if _contains_any(fn, FILENAME_SHOPEE_HINTS):
-        score["SHOPEE"] += 24
+        score[_SHOPEE] += 24
+
+
+# score thresholds in classify priority order (first one reached wins);
+# keep in sync with the early exits in _weighted_score_fast
+_DECISIVE_THRESHOLDS: Tuple[Tuple[int, int], ...] = (
+    (_META, 55),
+    (_GOOGLE, 55),
+    (_SPX, 45),
+    (_LAZADA, 42),
+    (_TIKTOK, 34),
+    (_SHOPEE, 34),
+    (_THAI_TAX, 70),
+)
 
 
-def _weighted_score(t: str, filename: str) -> Dict[str, int]:
+def _weighted_score(
+    t: str,
+    filename: str,
+    ids: Optional[FrozenSet[str]] = None,
+    fn_norm: Optional[str] = None,
+) -> Dict[str, int]:
     """
     ✅ Weighted scoring using BOTH text and filename
+    - ids: _strong_ids(t) | _strong_ids(fn) when the caller already has it
+    - fn_norm: _norm(filename) when the caller already has it
     """
-    fn = _norm(filename)
+    score, _ = _weighted_score_fast(t, filename, ids=ids, fn_norm=fn_norm, early_exit=False)
+    return dict(zip(_SCORE_LABELS, score))
+
+
+def _weighted_score_fast(
+    t: str,
+    filename: str,
+    ids: Optional[FrozenSet[str]] = None,
+    fn_norm: Optional[str] = None,
+    early_exit: bool = True,
+) -> Tuple[List[int], Optional[PlatformLabel]]:
+    """
+    _weighted_score that stops as soon as the classify_platform label is locked:
+    scores only grow, and blocks run in threshold priority order, so once every
+    earlier platform is final and below its threshold, the first platform to
+    reach its own threshold wins whatever the remaining blocks add.
+    Returns (score slots, label or None); slots are partial when a label is returned.
+    """
+    fn = _norm(filename) if fn_norm is None else fn_norm
     tt = t
+    if ids is None:
+        ids = _strong_ids(tt) | _strong_ids(fn)
 
-    score: Dict[str, int] = {
-        "META": 0,
-        "GOOGLE": 0,
-        "SHOPEE": 0,
-        "LAZADA": 0,
-        "TIKTOK": 0,
-        "SPX": 0,
-        "THAI_TAX": 0,
-    }
+    score: List[int] = [0] * len(_SCORE_LABELS)
 
     # filename boost
     _filename_boost(score, fn)
 
     # META strong
-    if _regex_hit(tt, RE_META_RECEIPT) or _regex_hit(fn, RE_META_RECEIPT):
-        score["META"] += 170
-    if _regex_hit(tt, RE_META_IRELAND) or _regex_hit(fn, RE_META_IRELAND):
-        score["META"] += 165
-    if _regex_hit(tt, RE_FACEBOOK) or _regex_hit(fn, RE_FACEBOOK):
-        score["META"] += 90
-    score["META"] += 16 * _count_contains(tt, META_SIGS_STRONG)
-    score["META"] += 10 * _count_contains(tt, META_SIGS_WEAK)
+    if "meta_receipt" in ids:
+        score[_META] += 170
+    if "meta_ireland" in ids:
+        score[_META] += 165
+    if "facebook" in ids:
+        score[_META] += 90
+    # ✅ META locked by IDs alone -> skip the keyword scan entirely
+    if early_exit and score[_META] >= 55:
+        return score, "META"
+
+    hits = _TEXT_SIGS.counts(tt)
+    score[_META] += 16 * hits["META_STRONG"]
+    score[_META] += 10 * hits["META_WEAK"]
+    if early_exit and score[_META] >= 55:
+        return score, "META"
 
     # GOOGLE strong
-    if _regex_hit(tt, RE_GOOGLE_PAYMENT) or _regex_hit(fn, RE_GOOGLE_PAYMENT):
-        score["GOOGLE"] += 170
-    if _regex_hit(tt, RE_GOOGLE_ASIA) or _regex_hit(fn, RE_GOOGLE_ASIA):
-        score["GOOGLE"] += 165
-    if _regex_hit(tt, RE_GOOGLE_ADS) or _regex_hit(fn, RE_GOOGLE_ADS):
-        score["GOOGLE"] += 90
-    score["GOOGLE"] += 16 * _count_contains(tt, GOOGLE_SIGS_STRONG)
-    score["GOOGLE"] += 10 * _count_contains(tt, GOOGLE_SIGS_WEAK)
+    if "google_payment" in ids:
+        score[_GOOGLE] += 170
+    if "google_asia" in ids:
+        score[_GOOGLE] += 165
+    if "google_ads" in ids:
+        score[_GOOGLE] += 90
+    score[_GOOGLE] += 16 * hits["GOOGLE_STRONG"]
+    score[_GOOGLE] += 10 * hits["GOOGLE_WEAK"]
+    if early_exit and score[_GOOGLE] >= 55:
+        return score, "GOOGLE"
 
     # SPX BEFORE Shopee
-    if _regex_hit(tt, RE_SPX_RCSPX) or _regex_hit(fn, RE_SPX_RCSPX):
-        score["SPX"] += 145
-    if "rcspx" in tt or "rcspx" in fn:
-        score["SPX"] += 145
-    score["SPX"] += 10 * _count_contains(tt, SPX_SIGS)
+    if "spx" in ids:
+        score[_SPX] += 145
+    if hits["RCSPX"] or "rcspx" in fn:
+        score[_SPX] += 145
+    score[_SPX] += 10 * hits["SPX"]
+    if early_exit and score[_SPX] >= 45:
+        return score, "SPX"
 
     # LAZADA
-    if _regex_hit(tt, RE_LAZADA_THMPTI) or _regex_hit(fn, RE_LAZADA_THMPTI):
-        score["LAZADA"] += 120
-    score["LAZADA"] += 10 * _count_contains(tt, LAZADA_SIGS)
+    if "lazada" in ids:
+        score[_LAZADA] += 120
+    score[_LAZADA] += 10 * hits["LAZADA"]
+    if early_exit and score[_LAZADA] >= 42:
+        return score, "LAZADA"
 
     # TIKTOK
-    if _regex_hit(tt, RE_TIKTOK_TTSTH) or _regex_hit(fn, RE_TIKTOK_TTSTH):
-        score["TIKTOK"] += 120
-    if _regex_hit(tt, RE_TIKTOK_WORD) or _regex_hit(fn, RE_TIKTOK_WORD):
-        score["TIKTOK"] += 25
-    score["TIKTOK"] += 10 * _count_contains(tt, TIKTOK_SIGS)
+    if "tiktok_id" in ids:
+        score[_TIKTOK] += 120
+    if "tiktok_word" in ids:
+        score[_TIKTOK] += 25
+    score[_TIKTOK] += 10 * hits["TIKTOK"]
+    if early_exit and score[_TIKTOK] >= 34:
+        return score, "TIKTOK"
 
     # SHOPEE
-    if _regex_hit(tt, RE_SHOPEE_TIV) or _regex_hit(fn, RE_SHOPEE_TIV):
-        score["SHOPEE"] += 110
-    if _regex_hit(tt, RE_SHOPEE_TIR) or _regex_hit(fn, RE_SHOPEE_TIR):
-        score["SHOPEE"] += 110
-    if _regex_hit(tt, RE_SHOPEE_WORD) or _regex_hit(fn, RE_SHOPEE_WORD):
-        score["SHOPEE"] += 22
-    score["SHOPEE"] += 10 * _count_contains(tt, SHOPEE_SIGS)
+    if "shopee_tiv" in ids:
+        score[_SHOPEE] += 110
+    if "shopee_tir" in ids:
+        score[_SHOPEE] += 110
+    if "shopee_word" in ids:
+        score[_SHOPEE] += 22
+    score[_SHOPEE] += 10 * hits["SHOPEE"]
 
     # TRS weak: only with Shopee context
-    trs = _regex_hit(tt, RE_SHOPEE_TRS) or ("trs" in tt)
+    # \bTRS\b on lowercase text needs "trs" itself -> regex only for fold chars
+    trs = bool(hits["TRS"]) or (_folds_to_ascii(tt) and _regex_hit(tt, RE_SHOPEE_TRS))
     if trs:
-        has_ctx = ("shopee" in tt) or ("tiv" in tt) or ("tir" in tt) or ("shopee" in fn)
+        has_ctx = bool(hits["SHOPEE_CTX"]) or ("shopee" in fn)
         if has_ctx:
-            score["SHOPEE"] += 18
+            score[_SHOPEE] += 18
+    if early_exit and score[_SHOPEE] >= 34:
+        return score, "SHOPEE"
 
     # THAI_TAX (conservative)
     if _regex_hit(tt, RE_THAI_TAX_INVOICE):
-        score["THAI_TAX"] += 55
+        score[_THAI_TAX] += 55
     if _has_vendor_tax_id(tt):
-        score["THAI_TAX"] += 70
+        score[_THAI_TAX] += 70
     if _regex_hit(tt, RE_BRANCH_5):
-        score["THAI_TAX"] += 35
-    score["THAI_TAX"] += 10 * _count_contains(tt, THAI_TAX_SIGS)
+        score[_THAI_TAX] += 35
+    score[_THAI_TAX] += 10 * hits["THAI_TAX"]
 
     # penalties if strong other platform exists
-    if score["META"] >= 70 or score["GOOGLE"] >= 70 or score["SPX"] >= 70:
-        score["THAI_TAX"] = int(score["THAI_TAX"] * 0.25)
-    elif score["SHOPEE"] >= 55 or score["LAZADA"] >= 55 or score["TIKTOK"] >= 55:
-        score["THAI_TAX"] = int(score["THAI_TAX"] * 0.45)
+    if score[_META] >= 70 or score[_GOOGLE] >= 70 or score[_SPX] >= 70:
+        score[_THAI_TAX] = int(score[_THAI_TAX] * 0.25)
+    elif score[_SHOPEE] >= 55 or score[_LAZADA] >= 55 or score[_TIKTOK] >= 55:
+        score[_THAI_TAX] = int(score[_THAI_TAX] * 0.45)
+
+    return score, None
+
+
+# ---------------------------------------------------------------------
+# Result cache (same PDF re-enters on retries / re-uploads)
+# ---------------------------------------------------------------------
+try:
+    CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "4096") or 0)
+except Exception:
+    CLASSIFY_CACHE_SIZE = 4096
 
-    return score
+_CLASSIFY_CACHE: "OrderedDict[Tuple[bytes, str], PlatformLabel]" = OrderedDict()
+_CLASSIFY_LOCK = threading.Lock()
+
+
+def _text_digest(text: str) -> bytes:
+    """128-bit content key: xxh3 when installed, blake2b otherwise"""
+    data = (text or "").encode("utf-8", "surrogatepass")
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
 
 
 def classify_platform(text: str, filename: str = "", debug: bool = False) -> PlatformLabel:
     """
     ✅ Enhanced platform classifier for 8 platforms
     - MUST accept filename
+    - results cached by (hash(text), filename); debug=True always recomputes
     """
     if debug:
         logger.setLevel(logging.DEBUG)
 
-    try:
-        t = _norm(text)
-        fn = _norm(filename)
+    key = None
+    if CLASSIFY_CACHE_SIZE > 0 and not debug:
+        key = (_text_digest(text), filename or "")
+        with _CLASSIFY_LOCK:
+            hit = _CLASSIFY_CACHE.get(key)
+            if hit is not None:
+                _CLASSIFY_CACHE.move_to_end(key)
+                return hit
 
+    fn = _norm(filename)
+    label = _classify_normalized(_norm(text), fn, filename, _strong_ids(fn), debug=debug)
+
+    if key is not None:
+        with _CLASSIFY_LOCK:
+            _CLASSIFY_CACHE[key] = label
+            if len(_CLASSIFY_CACHE) > CLASSIFY_CACHE_SIZE:
+                _CLASSIFY_CACHE.popitem(last=False)
+    return label
+
+
+def _classify_normalized(
+    t: str,
+    fn: str,
+    filename: str,
+    fn_ids: FrozenSet[str],
+    debug: bool = False,
+) -> PlatformLabel:
+    """classify_platform body on already-normalized text / filename (+ _strong_ids(fn))"""
+    try:
         if not t and not fn:
             return "UNKNOWN"
 
         # --------------------------
         # Fast paths (strong ID)
         # --------------------------
-        if (
-            _regex_hit(t, RE_META_RECEIPT) or _regex_hit(fn, RE_META_RECEIPT) or
-            _regex_hit(t, RE_META_IRELAND) or _regex_hit(fn, RE_META_IRELAND)
-        ):
+        ids = _strong_ids(t) | fn_ids
+
+        if "meta_receipt" in ids or "meta_ireland" in ids:
             return "META"
 
-        if (
-            _regex_hit(t, RE_GOOGLE_PAYMENT) or _regex_hit(fn, RE_GOOGLE_PAYMENT) or
-            _regex_hit(t, RE_GOOGLE_ASIA) or _regex_hit(fn, RE_GOOGLE_ASIA)
-        ):
+        if "google_payment" in ids or "google_asia" in ids:
             return "GOOGLE"
 
         # SPX ก่อน Shopee เสมอ
-        if (
-            _regex_hit(t, RE_SPX_RCSPX) or _regex_hit(fn, RE_SPX_RCSPX) or
-            ("rcspx" in t) or ("rcspx" in fn)
-        ):
+        if "spx" in ids or ("rcspx" in t) or ("rcspx" in fn):
             return "SPX"
 
-        if _regex_hit(t, RE_LAZADA_THMPTI) or _regex_hit(fn, RE_LAZADA_THMPTI):
+        if "lazada" in ids:
             return "LAZADA"
 
-        if _regex_hit(t, RE_TIKTOK_TTSTH) or _regex_hit(fn, RE_TIKTOK_TTSTH):
+        if "tiktok_id" in ids:
             return "TIKTOK"
 
         # --------------------------
         # Weighted scoring
         # --------------------------
-        score = _weighted_score(t, filename=filename)
+        # debug logs the full score table, so no early exit there
+        score, decided = _weighted_score_fast(t, filename, ids=ids, fn_norm=fn, early_exit=not debug)
         if debug:
-            logger.debug("Scores: %s", score)
-
-        best_label, best_score = max(score.items(), key=lambda kv: kv[1])
+            logger.debug("Scores: %s", dict(zip(_SCORE_LABELS, score)))
+        if decided is not None:
+            return decided
 
         # thresholds per priority
-        if score["META"] >= 55:
-            return "META"
-        if score["GOOGLE"] >= 55:
-            return "GOOGLE"
-        if score["SPX"] >= 45:
-            return "SPX"
-        if score["LAZADA"] >= 42:
-            return "LAZADA"
-        if score["TIKTOK"] >= 34:
-            return "TIKTOK"
-        if score["SHOPEE"] >= 34:
-            return "SHOPEE"
-        if score["THAI_TAX"] >= 70:
-            return "THAI_TAX"
+        for idx, minimum in _DECISIVE_THRESHOLDS:
+            if score[idx] >= minimum:
+                return _SCORE_LABELS[idx]
 
-        # modest fallback (only if reasonable)
-        if best_score >= 28 and best_label in (
-            "META", "GOOGLE", "SPX", "SHOPEE", "LAZADA", "TIKTOK", "THAI_TAX"
-        ):
-            return best_label  # type: ignore[return-value]
+        # modest fallback (only if reasonable); first slot wins ties
+        best = max(range(len(score)), key=score.__getitem__)
+        if score[best] >= 28:
+            return _SCORE_LABELS[best]
 
         # invoice + vendor tax -> thai tax
         if _contains_any(t, INVOICE_SIGS) and _has_vendor_tax_id(t):
@@ -462,14 +616,49 @@ def classify_platform(text: str, filename: str = "", debug: bool = False) -> Pla
         return "UNKNOWN"
 
 
+def classify_platform_batch(
+    texts: Sequence[str],
+    filenames: Optional[Sequence[str]] = None,
+) -> List[PlatformLabel]:
+    """
+    ✅ classify_platform for many documents at once (e.g. every segment of one PDF)
+    - result[i] == classify_platform(texts[i], filenames[i])
+    - each distinct filename is normalized + ID-scanned once; repeated
+      (text, filename) pairs are classified once
+    """
+    names = list(filenames) if filenames is not None else [""] * len(texts)
+    if len(names) != len(texts):
+        raise ValueError("texts and filenames must have the same length")
+
+    fn_cache: Dict[str, Tuple[str, FrozenSet[str]]] = {}
+    done: Dict[Tuple[str, str], PlatformLabel] = {}
+    out: List[PlatformLabel] = []
+    for text, filename in zip(texts, names):
+        text = text or ""
+        filename = filename or ""
+        key = (text, filename)
+        label = done.get(key)
+        if label is None:
+            cached = fn_cache.get(filename)
+            if cached is None:
+                fn = _norm(filename)
+                cached = fn_cache[filename] = (fn, _strong_ids(fn))
+            label = done[key] = _classify_normalized(_norm(text), cached[0], filename, cached[1])
+        out.append(label)
+    return out
+
+
 def get_classification_details(text: str, filename: str = "") -> Tuple[PlatformLabel, Dict[str, int]]:
     """
     ✅ Return (platform, scores) for debugging
     """
     try:
+        # normalize once; scores and label share it
         t = _norm(text)
-        score = _weighted_score(t, filename=filename)
-        platform = classify_platform(text, filename, debug=False)
+        fn = _norm(filename)
+        fn_ids = _strong_ids(fn)
+        score = _weighted_score(t, filename=filename, ids=_strong_ids(t) | fn_ids, fn_norm=fn)
+        platform = _classify_normalized(t, fn, filename, fn_ids)
         return (platform, score)
     except Exception as e:
         logger.error("Error getting classification details: %s", e)
@@ -539,6 +728,7 @@ def get_platform_metadata(platform: PlatformLabel) -> Dict[str, str]:
 __all__ = [
     "PlatformLabel",
     "classify_platform",
+    "classify_platform_batch",
     "get_classification_details",
     "get_platform_metadata",
     # new helpers (to be used by extract_service/post_process)
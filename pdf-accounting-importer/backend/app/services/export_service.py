@@ -27,13 +27,23 @@ import io
 import os
 import re
 import logging
+import tempfile
 from decimal import Decimal, InvalidOperation
-from typing import List, Dict, Any, Tuple, Optional, Set
+from typing import IO, Iterator, List, Dict, Any, Tuple, Optional, Set
 
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, numbers
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 
+from ..extractors.common import compile_regex
+
+# Optional: xlsxwriter (constant_memory streaming writer, much less Python per cell)
+try:
+    import xlsxwriter  # type: ignore
+except Exception:  # pragma: no cover
+    xlsxwriter = None  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 # =========================
@@ -129,7 +139,7 @@ RE_DD_MM_YYYY = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
 RE_YYYY_SLASH_MM_DD = re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$")
 RE_EURO_DD_MM_YYYY = re.compile(r"^(\d{1,2})-(\d{1,2})-(\d{4})$")
 
-RE_ALL_WS = re.compile(r"\s+")
+RE_ALL_WS = compile_regex(r"\s+")  # per cell in _compact_no_ws; RE2 when EXTRACT_USE_RE2=1
 MAX_ROWS = 50000
 MAX_CELL_LENGTH = 32767
 
@@ -584,48 +594,54 @@ def _to_number_or_text(key: str, raw: Any) -> Tuple[Any, str]:
 
     return (_escape_excel_formula(s), numbers.FORMAT_TEXT)
 
-def _auto_fit_columns(ws, max_width: int = 60, min_width: int = 10) -> None:
-    try:
-        for col_idx, (_key, label) in enumerate(COLUMNS, start=1):
-            col_letter = get_column_letter(col_idx)
-            max_len = len(str(label))
-
-            max_check = min(ws.max_row + 1, 220)
-            for row_idx in range(2, max_check):
-                try:
-                    v = ws.cell(row=row_idx, column=col_idx).value
-                    if v is None:
-                        continue
-                    s = str(v)
-                    if "\n" in s:
-                        s = s.split("\n", 1)[0]
-                    max_len = max(max_len, len(s))
-                except Exception:
+def _column_widths(value_rows: List[List[Any]], max_width: int = 60, min_width: int = 10) -> List[int]:
+    """
+    Width per column from the header + sampled values (same rule as the old ws auto-fit).
+    Write-only sheets cannot be read back, so widths are computed before writing.
+    """
+    widths: List[int] = []
+    for col_idx, (_key, label) in enumerate(COLUMNS):
+        max_len = len(str(label))
+        for values in value_rows:
+            try:
+                v = values[col_idx]
+                if v is None:
                     continue
-
-            ws.column_dimensions[col_letter].width = int(min(max(max_len + 2, min_width), max_width))
-    except Exception as e:
-        logger.error("Auto-fit columns error: %s", e)
+                s = str(v)
+                if "\n" in s:
+                    s = s.split("\n", 1)[0]
+                max_len = max(max_len, len(s))
+            except Exception:
+                continue
+        widths.append(int(min(max(max_len + 2, min_width), max_width)))
+    return widths
 
 # =========================
 # CSV Export
 # =========================
-def export_rows_to_csv_bytes(rows: List[Dict[str, Any]]) -> bytes:
-    try:
-        is_valid, errors = validate_rows(rows)
-        if not is_valid:
-            raise ExportValidationError("; ".join(errors))
+CSV_CHUNK_ROWS = 500
 
-        rows2 = _preprocess_rows_for_export(rows)
-        if not rows2:
-            raise ExportValidationError("No valid rows after preprocessing")
 
-        out = io.StringIO()
-        wri = csv.writer(out, quoting=csv.QUOTE_MINIMAL)
+def _prepare_export_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    is_valid, errors = validate_rows(rows)
+    if not is_valid:
+        raise ExportValidationError("; ".join(errors))
 
-        wri.writerow([label for _, label in COLUMNS])
+    rows2 = _preprocess_rows_for_export(rows)
+    if not rows2:
+        raise ExportValidationError("No valid rows after preprocessing")
+    return rows2
 
-        for r in rows2:
+
+def _iter_csv_chunks(rows2: List[Dict[str, Any]], chunk_rows: int) -> Iterator[bytes]:
+    out = io.StringIO()
+    wri = csv.writer(out, quoting=csv.QUOTE_MINIMAL)
+
+    wri.writerow([label for _, label in COLUMNS])
+    prefix = b"\xef\xbb\xbf"  # utf-8-sig BOM, once at the start
+
+    try:
+        for i, r in enumerate(rows2, start=1):
             row_out: List[str] = []
             for k, _label in COLUMNS:
                 s = _s(r.get(k, ""))
@@ -633,83 +649,201 @@ def export_rows_to_csv_bytes(rows: List[Dict[str, Any]]) -> bytes:
                 row_out.append(s)
             wri.writerow(row_out)
 
-        return out.getvalue().encode("utf-8-sig")
+            if i % chunk_rows == 0:
+                yield prefix + out.getvalue().encode("utf-8")
+                prefix = b""
+                out.seek(0)
+                out.truncate()
+
+        tail = out.getvalue()
+        if tail or prefix:
+            yield prefix + tail.encode("utf-8")
+    except Exception as e:
+        logger.error("CSV export error: %s", e, exc_info=True)
+        raise Exception(f"CSV export failed: {str(e)}")
+
 
+def export_rows_to_csv_chunks(rows: List[Dict[str, Any]], chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Streaming CSV: validate + preprocess ทันที (error ออกก่อนเริ่มส่ง response)
+    แล้วคืน iterator ของ bytes ทีละ chunk_rows แถว -> ไม่ต้องถือทั้งไฟล์ไว้ใน RAM
+    """
+    try:
+        rows2 = _prepare_export_rows(rows)
     except ExportValidationError:
         raise
     except Exception as e:
         logger.error("CSV export error: %s", e, exc_info=True)
         raise Exception(f"CSV export failed: {str(e)}")
+    return _iter_csv_chunks(rows2, max(1, int(chunk_rows)))
+
+
+def export_rows_to_csv_bytes(rows: List[Dict[str, Any]]) -> bytes:
+    return b"".join(export_rows_to_csv_chunks(rows))
 
 # =========================
 # XLSX Export
 # =========================
-def export_rows_to_xlsx_bytes(rows: List[Dict[str, Any]]) -> bytes:
+AUTO_FIT_SAMPLE_ROWS = 218
+
+
+# 1-based columns written with wrap_text (L_description / T_note)
+WRAP_COL_INDEXES = frozenset({13, 21})
+
+HEADER_FILL_COLOR = "E8F1FF"
+BORDER_COLOR = "D0D7E2"
+
+
+def _convert_row(r: Dict[str, Any]) -> Tuple[List[Any], List[str]]:
+    values: List[Any] = []
+    formats: List[str] = []
+    for k, _label in COLUMNS:
+        v, fmt = _to_number_or_text(k, r.get(k, ""))
+        values.append(v)
+        formats.append(fmt)
+    return values, formats
+
+
+def _write_xlsx_openpyxl(
+    rows2: List[Dict[str, Any]],
+    head: List[Tuple[List[Any], List[str]]],
+    widths: List[int],
+    fileobj: IO[bytes],
+) -> None:
+    # ✅ write-only: rows go straight to the sheet's temp XML, not a cell graph in RAM
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("PEAK_IMPORT")
+
+    header_fill = PatternFill("solid", fgColor=HEADER_FILL_COLOR)
+    header_font = Font(bold=True)
+    header_align = Alignment(vertical="center", horizontal="center", wrap_text=True)
+
+    thin = Side(style="thin", color=BORDER_COLOR)
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    align_top = Alignment(vertical="top", wrap_text=False)
+    align_top_wrap = Alignment(vertical="top", wrap_text=True)
+
+    # sheet layout must be set before the first row is written
+    for col_idx, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+    ws.freeze_panes = "A2"
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(COLUMNS))}1"
+
+    header_cells: List[WriteOnlyCell] = []
+    for _key, label in COLUMNS:
+        c = WriteOnlyCell(ws, value=label)
+        c.fill = header_fill
+        c.font = header_font
+        c.alignment = header_align
+        c.border = border
+        header_cells.append(c)
+    ws.append(header_cells)
+
+    def _write(values: List[Any], formats: List[str]) -> None:
+        cells: List[WriteOnlyCell] = []
+        for col_idx, (v, fmt) in enumerate(zip(values, formats), start=1):
+            cell = WriteOnlyCell(ws, value=v)
+            if fmt:
+                cell.number_format = fmt
+            cell.alignment = align_top_wrap if col_idx in WRAP_COL_INDEXES else align_top
+            cell.border = border
+            cells.append(cell)
+        ws.append(cells)
+
+    # TEXT/DATE columns already come back as FORMAT_TEXT from _to_number_or_text
+    for values, formats in head:
+        _write(values, formats)
+    for r in rows2[AUTO_FIT_SAMPLE_ROWS:]:
+        _write(*_convert_row(r))
+
+    wb.save(fileobj)
+
+
+def _write_xlsx_xlsxwriter(
+    rows2: List[Dict[str, Any]],
+    head: List[Tuple[List[Any], List[str]]],
+    widths: List[int],
+    fileobj: IO[bytes],
+) -> None:
+    """
+    Same sheet as _write_xlsx_openpyxl via xlsxwriter constant_memory:
+    one shared Format per (number format, wrap) instead of per-cell style objects,
+    each row flushed to the temp file as soon as the next one starts.
+    """
+    wb = xlsxwriter.Workbook(fileobj, {"constant_memory": True})
     try:
-        is_valid, errors = validate_rows(rows)
-        if not is_valid:
-            raise ExportValidationError("; ".join(errors))
-
-        rows2 = _preprocess_rows_for_export(rows)
-        if not rows2:
-            raise ExportValidationError("No valid rows after preprocessing")
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "PEAK_IMPORT"
-
-        ws.append([label for _, label in COLUMNS])
-
-        header_fill = PatternFill("solid", fgColor="E8F1FF")
-        header_font = Font(bold=True)
-        header_align = Alignment(vertical="center", horizontal="center", wrap_text=True)
-
-        thin = Side(style="thin", color="D0D7E2")
-        border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-        for col_idx in range(1, len(COLUMNS) + 1):
-            c = ws.cell(row=1, column=col_idx)
-            c.fill = header_fill
-            c.font = header_font
-            c.alignment = header_align
-            c.border = border
-
-        for r in rows2:
-            values: List[Any] = []
-            formats: List[str] = []
-            for k, _label in COLUMNS:
-                v, fmt = _to_number_or_text(k, r.get(k, ""))
-                values.append(v)
-                formats.append(fmt)
-
-            ws.append(values)
-            row_i = ws.max_row
-            for col_idx, fmt in enumerate(formats, start=1):
-                cell = ws.cell(row=row_i, column=col_idx)
-                if fmt:
-                    cell.number_format = fmt
-                cell.alignment = Alignment(vertical="top", wrap_text=(col_idx in {13, 21}))
-                cell.border = border
-
-        ws.freeze_panes = "A2"
-        ws.auto_filter.ref = f"A1:{get_column_letter(len(COLUMNS))}1"
-
-        col_index = {k: i + 1 for i, (k, _) in enumerate(COLUMNS)}
-        for key in (TEXT_COL_KEYS | DATE_COL_KEYS):
-            ci = col_index.get(key)
-            if not ci:
-                continue
-            for row_i in range(2, 2 + len(rows2)):
-                try:
-                    ws.cell(row=row_i, column=ci).number_format = numbers.FORMAT_TEXT
-                except Exception:
-                    continue
+        ws = wb.add_worksheet("PEAK_IMPORT")
+        border = {"border": 1, "border_color": "#" + BORDER_COLOR}
+
+        header_fmt = wb.add_format({
+            "bold": True,
+            "bg_color": "#" + HEADER_FILL_COLOR,
+            "align": "center",
+            "valign": "vcenter",
+            "text_wrap": True,
+            **border,
+        })
+
+        fmt_cache: Dict[Tuple[str, bool], Any] = {}
+
+        def _fmt(num_format: str, wrap: bool) -> Any:
+            key = (num_format, wrap)
+            f = fmt_cache.get(key)
+            if f is None:
+                props: Dict[str, Any] = {"valign": "top", "text_wrap": wrap, **border}
+                if num_format:
+                    props["num_format"] = num_format
+                f = fmt_cache[key] = wb.add_format(props)
+            return f
+
+        for col, width in enumerate(widths):
+            ws.set_column(col, col, width)
+
+        ws.freeze_panes(1, 0)
+        ws.autofilter(0, 0, 0, len(COLUMNS) - 1)
+        ws.write_row(0, 0, [label for _key, label in COLUMNS], header_fmt)
+
+        wrap_cols = frozenset(i - 1 for i in WRAP_COL_INDEXES)
+        write_string = ws.write_string
+        write_number = ws.write_number
+        row_no = 1
+
+        def _write(values: List[Any], formats: List[str]) -> None:
+            for col, (v, fmt) in enumerate(zip(values, formats)):
+                cell_fmt = _fmt(fmt, col in wrap_cols)
+                if isinstance(v, (int, float)):
+                    write_number(row_no, col, v, cell_fmt)
+                else:
+                    write_string(row_no, col, v, cell_fmt)
+
+        for values, formats in head:
+            _write(values, formats)
+            row_no += 1
+        for r in rows2[AUTO_FIT_SAMPLE_ROWS:]:
+            _write(*_convert_row(r))
+            row_no += 1
+    finally:
+        wb.close()
+
+
+def _save_xlsx(rows: List[Dict[str, Any]], fileobj: IO[bytes]) -> None:
+    try:
+        rows2 = _prepare_export_rows(rows)
 
-        _auto_fit_columns(ws)
+        # widths come from a sample converted up front (streaming sheets cannot be re-read)
+        head = [_convert_row(r) for r in rows2[:AUTO_FIT_SAMPLE_ROWS]]
+        try:
+            widths = _column_widths([v for v, _ in head])
+        except Exception as e:
+            logger.error("Auto-fit columns error: %s", e)
+            widths = []
 
-        bio = io.BytesIO()
-        wb.save(bio)
-        return bio.getvalue()
+        if xlsxwriter is not None:
+            _write_xlsx_xlsxwriter(rows2, head, widths, fileobj)
+        else:
+            _write_xlsx_openpyxl(rows2, head, widths, fileobj)
 
     except ExportValidationError:
         raise
@@ -717,6 +851,27 @@ def export_rows_to_xlsx_bytes(rows: List[Dict[str, Any]]) -> bytes:
         logger.error("XLSX export error: %s", e, exc_info=True)
         raise Exception(f"XLSX export failed: {str(e)}")
 
+
+def export_rows_to_xlsx_bytes(rows: List[Dict[str, Any]]) -> bytes:
+    with export_rows_to_xlsx_file(rows) as f:
+        return f.read()
+
+
+def export_rows_to_xlsx_file(rows: List[Dict[str, Any]]) -> IO[bytes]:
+    """
+    XLSX saved into a SpooledTemporaryFile (RAM up to EXPORT_SPOOL_MAX_BYTES, then disk),
+    rewound to 0 -> caller streams it out in chunks and closes it.
+    ไม่ต้อง copy ทั้งไฟล์เป็น bytes แล้วห่อ BytesIO อีกรอบ
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(4 * 1024 * 1024))))
+    try:
+        _save_xlsx(rows, spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
 # =========================
 # Summary
 # =========================
@@ -792,7 +947,9 @@ __all__ = [
     "PLATFORM_VAT_RULES",
     "PLATFORM_GROUPS",
     "export_rows_to_csv_bytes",
+    "export_rows_to_csv_chunks",
     "export_rows_to_xlsx_bytes",
+    "export_rows_to_xlsx_file",
     "ExportValidationError",
     "validate_rows",
     "get_export_summary",
@@ -34,6 +34,17 @@ from .platform_constants import (
 # Helpers
 # ============================================================
 
+def _close_payloads(payloads: List[Tuple[str, str, Any]]) -> None:
+    """close spooled upload files (bytes payloads need nothing)"""
+    for _name, _ctype, content in payloads:
+        close = getattr(content, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+
 def _utc_iso_z(dt: Optional[datetime] = None) -> str:
     """Generate UTC ISO timestamp with Z suffix"""
     dt = dt or datetime.now(timezone.utc)
@@ -199,36 +210,41 @@ class JobService:
         job_id: str,
         filename: str,
         content_type: str,
-        content: bytes,
+        content: Any,
         cfg: Optional[Dict[str, Any]] = None,
     ) -> None:
-        """Add file to job"""
+        """
+        Add file to job
+
+        content: bytes or a binary file object (e.g. spooled upload);
+        the worker reads file objects one at a time when it processes them
+        """
         filename = (filename or "").strip() or "file"
         content_type = (content_type or "").strip() or "application/octet-stream"
 
         with self._lock:
             job = self._jobs.get(job_id)
-            if not job:
-                return
+            accepted = bool(job) and job.get("state") not in {"processing", "done", "cancelled"}
+            if accepted:
+                if cfg:
+                    job["cfg"] = _safe_cfg({**job.get("cfg", {}), **cfg})
 
-            if job.get("state") in {"processing", "done"}:
-                return
+                job["total_files"] = int(job.get("total_files") or 0) + 1
+                job["updated_at"] = _utc_iso_z()
+                job["_payloads"].append((filename, content_type, content))
 
-            if cfg:
-                job["cfg"] = _safe_cfg({**job.get("cfg", {}), **cfg})
+                job["files"].append({
+                    "filename": filename,
+                    "platform": "unknown",
+                    "company": "",
+                    "state": "queued",
+                    "message": "",
+                    "rows_count": 0,
+                })
 
-            job["total_files"] = int(job.get("total_files") or 0) + 1
-            job["updated_at"] = _utc_iso_z()
-            job["_payloads"].append((filename, content_type, content))
-            
-            job["files"].append({
-                "filename": filename,
-                "platform": "unknown",
-                "company": "",
-                "state": "queued",
-                "message": "",
-                "rows_count": 0,
-            })
+        if not accepted:
+            # nobody will ever read it -> release the spool (fd / temp file) now
+            _close_payloads([(filename, content_type, content)])
 
     def start_processing(self, job_id: str, cfg: Optional[Dict[str, Any]] = None) -> None:
         """
@@ -273,9 +289,13 @@ class JobService:
                 return False
             if job["state"] not in {"queued", "processing"}:
                 return False
+            never_started = job["state"] == "queued"
             job["_cancel"] = True
             job["state"] = "cancelled"
             job["updated_at"] = _utc_iso_z()
+        if never_started:
+            # no worker will run -> release the uploads now (a running one does it itself)
+            self.release_payloads(job_id)
         return True
 
     def should_cancel(self, job_id: str) -> bool:
@@ -318,6 +338,10 @@ class JobService:
                     job["_finished_at"] = _utc_iso_z()
                     job["updated_at"] = _utc_iso_z()
 
+        finally:
+            # whatever the worker did not release (crash before/while looping)
+            self.release_payloads(job_id)
+
     # -------------------------
     # Helpers for worker
     # -------------------------
@@ -392,7 +416,7 @@ class JobService:
             job["_platform_stats"] = platform_stats
             job["_extraction_methods"] = extraction_methods
 
-    def get_payloads(self, job_id: str) -> List[Tuple[str, str, bytes]]:
+    def get_payloads(self, job_id: str) -> List[Tuple[str, str, Any]]:
         """Get file payloads (for worker)"""
         with self._lock:
             job = self._jobs.get(job_id)
@@ -400,6 +424,29 @@ class JobService:
                 return []
             return list(job.get("_payloads") or [])
 
+    def release_payload(self, job_id: str, index: int) -> None:
+        """
+        Close a consumed payload and drop it from the job (worker calls this once
+        the file's text is extracted). The slot stays, so indexes keep matching files.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            payloads = (job or {}).get("_payloads") or []
+            if not 0 <= index < len(payloads):
+                return
+            filename, content_type, content = payloads[index]
+            payloads[index] = (filename, content_type, None)
+        _close_payloads([(filename, content_type, content)])
+
+    def release_payloads(self, job_id: str) -> None:
+        """Close and drop every payload still held by the job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            payloads = (job or {}).get("_payloads") or []
+            held = list(payloads)
+            payloads[:] = [(name, ctype, None) for name, ctype, _content in held]
+        _close_payloads(held)
+
     def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """Get job snapshot (for worker)"""
         with self._lock:
@@ -504,7 +551,8 @@ class JobService:
                     to_delete.append(job_id)
 
             for job_id in to_delete:
-                self._jobs.pop(job_id, None)
+                job = self._jobs.pop(job_id, None) or {}
+                _close_payloads(job.get("_payloads") or [])
                 self._rows.pop(job_id, None)
                 self._threads.pop(job_id, None)
                 removed += 1
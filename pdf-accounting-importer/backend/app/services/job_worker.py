@@ -16,10 +16,16 @@ Notes:
 from __future__ import annotations
 
 import io
+import multiprocessing
 import os
 import re
+import shutil
 import tempfile
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import pdfplumber
 
@@ -67,6 +73,7 @@ ACCOUNT_BY_CLIENT_TAX_ID: Dict[str, str] = {
 # ============================================================
 
 RE_ALL_WS = re.compile(r"\s+")
+RE_NON_DIGIT = re.compile(r"\D+")
 RE_SELLER_ID_HINTS = [
     re.compile(
         r"\b(?:seller_id|seller\s*id|shop_id|shop\s*id|merchant_id|merchant\s*id)\b\D{0,20}(\d{5,20})",
@@ -93,7 +100,9 @@ def _safe_str(v: Any) -> str:
 
 
 def _digits_only(s: str) -> str:
-    return "".join(c for c in (s or "") if c.isdigit())
+    s = s or ""
+    # ASCII: one C-level regex pass; otherwise isdigit() (keeps Thai/other digit semantics)
+    return RE_NON_DIGIT.sub("", s) if s.isascii() else "".join(filter(str.isdigit, s))
 
 
 def _clean_money_str(v: Any) -> str:
@@ -518,9 +527,10 @@ def _normalize_row_fields(row: Dict[str, Any], seq: int) -> None:
 # PDF/OCR helpers
 # ============================================================
 
-def _extract_embedded_pdf_text(data: bytes, max_pages: int = 15) -> str:
+def _extract_embedded_pdf_text(data: Any, max_pages: int = 15) -> str:
     try:
-        with pdfplumber.open(io.BytesIO(data)) as pdf:
+        # pdfplumber reads the (spooled) file object directly; it does not close external streams
+        with pdfplumber.open(_payload_stream(data)) as pdf:
             parts: List[str] = []
             for p in pdf.pages[:max_pages]:
                 parts.append(p.extract_text() or "")
@@ -529,21 +539,143 @@ def _extract_embedded_pdf_text(data: bytes, max_pages: int = 15) -> str:
         return ""
 
 
-def _write_temp_file(filename: str, data: bytes) -> str:
+def _payload_stream(data: Any) -> Any:
+    """
+    payload = bytes or a binary file object (spooled upload from /api/upload)
+    -> readable binary stream at offset 0. File objects are used as-is (no full
+    read into RAM; large uploads stay on disk); bytes get a BytesIO view.
+    """
+    if data is None:
+        return io.BytesIO(b"")
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
+
+
+def _write_temp_file(filename: str, data: Any) -> str:
+    src = _payload_stream(data)
     ext = os.path.splitext(filename or "")[1].lower()
     if ext not in {".pdf", ".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}:
-        if data[:5] == b"%PDF-":
+        if src.read(5) == b"%PDF-":
             ext = ".pdf"
         else:
             ext = ext or ".bin"
+        src.seek(0)
 
     fd, path = tempfile.mkstemp(prefix="peak_import_", suffix=ext)
     os.close(fd)
     with open(path, "wb") as f:
-        f.write(data)
+        shutil.copyfileobj(src, f, 1024 * 1024)
     return path
 
 
+def _resolve_file_client(text: str, filename: str, cfg: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """normalized text -> (company, client_tax_id, cfg_for_file); pure, also runs in the pool"""
+    # detect client from text / cfg
+    detected_tax = _detect_client_tax_id(text, filename, cfg=cfg)
+    company = _company_from_tax_id(detected_tax, filename)
+
+    # ✅ resolve to SINGLE client_tax_id per file
+    client_tax_id = _resolve_client_tax_id_for_file(
+        detected_tax_id=detected_tax,
+        company_tag=company,
+        cfg=cfg,
+    )
+
+    # keep meta in cfg too (helps extract_service if it looks for client_tax_id)
+    cfg_for_file = dict(cfg)
+    if client_tax_id:
+        cfg_for_file["client_tax_id"] = client_tax_id
+    return company, client_tax_id, cfg_for_file
+
+
+# ============================================================
+# Optional process pool for text + row extraction (pdfplumber / OCR / regex are CPU-bound)
+#   OCR_PROCS=0 (default): extract in the job thread as before
+#   OCR_PROCS=N          : N spawn'd processes, up to N files extracted ahead
+#   (extractors are pure module-level code -> each worker imports them once)
+# ============================================================
+
+_TEXT_POOL: Optional[ProcessPoolExecutor] = None
+_TEXT_POOL_LOCK = threading.Lock()
+
+
+def _text_pool() -> Optional[ProcessPoolExecutor]:
+    global _TEXT_POOL
+    procs = _env_int("OCR_PROCS", 0)
+    if procs <= 0:
+        return None
+    with _TEXT_POOL_LOCK:
+        if _TEXT_POOL is None:
+            # spawn: the API process is multi-threaded, fork is not safe there
+            _TEXT_POOL = ProcessPoolExecutor(max_workers=procs, mp_context=multiprocessing.get_context("spawn"))
+        return _TEXT_POOL
+
+
+def _drop_broken_text_pool() -> None:
+    """worker died (e.g. OOM-killed during OCR) -> forget the pool; next job spawns a fresh one"""
+    global _TEXT_POOL
+    with _TEXT_POOL_LOCK:
+        pool = _TEXT_POOL
+        if pool is None or not getattr(pool, "_broken", True):
+            return
+        _TEXT_POOL = None
+    try:
+        pool.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def _extract_text_from_path(path: str, is_pdf: bool) -> str:
+    """process-pool entry: embedded PDF text first, OCR fallback (same order as _prepare_file)"""
+    text = ""
+    if is_pdf:
+        with open(path, "rb") as fh:
+            text = _extract_embedded_pdf_text(fh, max_pages=15)
+    if not text:
+        text = maybe_ocr_to_text(path)
+    return text
+
+
+def _extract_file_from_path(
+    path: str, is_pdf: bool, filename: str, cfg: Dict[str, Any]
+) -> Tuple[str, Optional[Tuple[str, Dict[str, Any], List[str]]]]:
+    """
+    process-pool entry: raw text + extract_row_from_text result, computed exactly as
+    _prepare_file would in-thread. Row None (no text / extraction raised) ->
+    _prepare_file runs it in-thread, so failures are reported the usual way.
+    """
+    raw = _extract_text_from_path(path, is_pdf)
+    text = normalize_text(raw)
+    if not text:
+        return raw, None
+    try:
+        _company, client_tax_id, cfg_for_file = _resolve_file_client(text, filename, cfg)
+        return raw, extract_row_from_text(text, filename=filename, client_tax_id=client_tax_id, cfg=cfg_for_file)
+    except Exception:
+        return raw, None
+
+
+def _submit_text_extraction(
+    pool: ProcessPoolExecutor, filename: str, content_type: str, data: Any, cfg: Dict[str, Any]
+) -> Optional[Tuple[Future, str]]:
+    """temp file + submit; None -> _prepare_file extracts in-thread (and reports errors there)"""
+    try:
+        path = _write_temp_file(filename, data)
+    except Exception:
+        return None
+    is_pdf = filename.lower().endswith(".pdf") or (content_type == "application/pdf")
+    try:
+        return pool.submit(_extract_file_from_path, path, is_pdf, filename, cfg), path
+    except Exception:
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+        return None
+
+
 def _should_call_ai(errors: List[str], row: Dict[str, Any]) -> bool:
     critical_missing = (
         not _safe_str(row.get("B_doc_date"))
@@ -631,36 +763,96 @@ def _detect_username(text: str) -> str:
 # Main worker
 # ============================================================
 
-def process_job_files(job_service, job_id: str) -> None:
-    payloads: List[Tuple[str, str, bytes]] = job_service.get_payloads(job_id)
-
-    allowed_companies, allowed_platforms, strict_mode = _get_job_filters(job_service, job_id)
-    cfg = _get_job_cfg(job_service, job_id)
-
-    # ✅ Running sequence across whole job
-    seq = 1
+# ============================================================
+# Per-file pipeline
+#   prepare (text -> locked row)  : runs ahead, no job-level side effects
+#   ai patch                      : ai_fill_peak_row on a small thread pool
+#   commit (patch/lock/append)    : strictly in upload order
+# ============================================================
 
-    ok_files = 0
-    review_files = 0
-    error_files = 0
-    processed = 0
+_AI_PARTIAL_KEYS: Tuple[str, ...] = (
+    "B_doc_date",
+    "C_reference",
+    "D_vendor_code",
+    "E_tax_id_13",
+    "F_branch_5",
+    "G_invoice_no",
+    "H_invoice_date",
+    "I_tax_purchase_date",
+    "J_price_type",
+    "K_account",
+    "L_description",
+    "M_qty",
+    "N_unit_price",
+    "O_vat_rate",
+    "P_wht",
+    "Q_payment_method",
+    "R_paid_amount",
+    "S_pnd",
+    "T_note",
+    "U_group",
+)
 
-    ai_only_fill_empty = _env_bool("AI_ONLY_FILL_EMPTY", default=False)
 
-    for idx, (filename, content_type, data) in enumerate(payloads):
-        filename = filename or "unknown"
-        content_type = content_type or ""
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except (TypeError, ValueError):
+        return default
 
-        job_service.update_file(job_id, idx, {"state": "processing"})
 
-        platform_u = "UNKNOWN"
-        company = ""
-        rows_out: List[Dict[str, Any]] = []
-        tmp_path: Optional[str] = None
+def _prepare_file(
+    job_service,
+    job_id: str,
+    idx: int,
+    filename: str,
+    content_type: str,
+    data: Any,
+    *,
+    seq: int,
+    cfg: Dict[str, Any],
+    allowed_companies: List[str],
+    allowed_platforms: List[str],
+    strict_mode: bool,
+    text_job: Optional[Tuple[Future, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Text -> extracted + locked row (before AI).
+    text_job = (future, temp path) when the text (and its row) came from the process pool.
+    Only touches this file's own state, so the next files can be prepared while
+    earlier ones still wait for the LLM. Exceptions are kept in work["error"].
+    """
+    job_service.update_file(job_id, idx, {"state": "processing"})
+
+    work: Dict[str, Any] = {
+        "idx": idx,
+        "filename": filename,
+        "seq": seq,
+        "platform_u": "UNKNOWN",
+        "company": "",
+        "row": None,
+        "no_text": False,
+        "ai_args": None,
+        "error": None,
+    }
+    platform_u = "UNKNOWN"
+    company = ""
+    tmp_path: Optional[str] = None
 
-        try:
-            # ---------- Extract text ----------
-            text = ""
+    try:
+        # ---------- Extract text ----------
+        text = ""
+        extracted: Optional[Tuple[str, Dict[str, Any], List[str]]] = None
+        if text_job is not None:
+            fut_text, tmp_path = text_job
+            try:
+                text, extracted = fut_text.result()
+            except (BrokenProcessPool, CancelledError):
+                # pool failure (not an extraction error) -> same extraction in-thread
+                _drop_broken_text_pool()
+                is_pdf = filename.lower().endswith(".pdf") or (content_type == "application/pdf")
+                text = _extract_text_from_path(tmp_path, is_pdf)
+        else:
             is_pdf = filename.lower().endswith(".pdf") or (content_type == "application/pdf")
 
             if is_pdf:
@@ -670,295 +862,396 @@ def process_job_files(job_service, job_id: str) -> None:
                 tmp_path = _write_temp_file(filename, data)
                 text = maybe_ocr_to_text(tmp_path)
 
-            text = normalize_text(text)
+        text = normalize_text(text)
 
-            # detect client from text / cfg
-            detected_tax = _detect_client_tax_id(text, filename, cfg=cfg)
-            company = _company_from_tax_id(detected_tax, filename)
+        company, client_tax_id, cfg_for_file = _resolve_file_client(text, filename, cfg)
 
-            # ✅ resolve to SINGLE client_tax_id per file
-            client_tax_id = _resolve_client_tax_id_for_file(
-                detected_tax_id=detected_tax,
-                company_tag=company,
-                cfg=cfg,
-            )
+        work["text"] = text
+        work["client_tax_id"] = client_tax_id
 
-            # keep meta in cfg too (helps extract_service if it looks for client_tax_id)
-            if client_tax_id:
-                cfg_for_file = dict(cfg)
-                cfg_for_file["client_tax_id"] = client_tax_id
-            else:
-                cfg_for_file = dict(cfg)
+        # ---------- If still no text ----------
+        if not text:
+            platform_u = _norm_platform(_detect_platform_hint_from_filename(filename)) or "UNKNOWN"
 
-            # ---------- If still no text ----------
-            if not text:
-                platform_u = _norm_platform(_detect_platform_hint_from_filename(filename)) or "UNKNOWN"
-
-                is_mismatch, mismatch_reason = _cfg_mismatch(
-                    allowed_companies,
-                    allowed_platforms,
-                    strict_mode,
-                    company=company,
-                    platform_u=platform_u,
-                )
-
-                row_min: Dict[str, Any] = {
-                    "A_seq": seq,
-                    "A_company_name": company,
-                    "_source_file": filename,
-                    "_platform": platform_u,
-                    "_client_tax_id": client_tax_id,
-                    "_status": "NEEDS_REVIEW",
-                    "_status_reason": "no_text",
-                    "_errors": ["ไม่พบข้อความจากเอกสาร"],
-                }
+            is_mismatch, mismatch_reason = _cfg_mismatch(
+                allowed_companies,
+                allowed_platforms,
+                strict_mode,
+                company=company,
+                platform_u=platform_u,
+            )
 
-                _normalize_row_fields(row_min, seq=seq)
-                _apply_locked_fields(row_min, filename=filename, platform_u=platform_u, text="", client_tax_id=client_tax_id)
+            row_min: Dict[str, Any] = {
+                "A_seq": seq,
+                "A_company_name": company,
+                "_source_file": filename,
+                "_platform": platform_u,
+                "_client_tax_id": client_tax_id,
+                "_status": "NEEDS_REVIEW",
+                "_status_reason": "no_text",
+                "_errors": ["ไม่พบข้อความจากเอกสาร"],
+            }
 
-                if is_mismatch:
-                    row_min["_errors"] = list(row_min.get("_errors") or []) + [f"ไม่ตรง filter: {mismatch_reason}"]
-                    row_min["_status_reason"] = "filter_mismatch"
-                    _add_note(row_min, f"Filtered: {mismatch_reason}")
+            _normalize_row_fields(row_min, seq=seq)
+            _apply_locked_fields(row_min, filename=filename, platform_u=platform_u, text="", client_tax_id=client_tax_id)
 
-                rows_out.append(row_min)
-                seq += 1
+            message = "ไม่พบข้อความจากเอกสาร"
+            if is_mismatch:
+                row_min["_errors"] = list(row_min.get("_errors") or []) + [f"ไม่ตรง filter: {mismatch_reason}"]
+                row_min["_status_reason"] = "filter_mismatch"
+                _add_note(row_min, f"Filtered: {mismatch_reason}")
+                message += f" | {mismatch_reason}"
 
-                file_state = "needs_review"
-                message = "ไม่พบข้อความจากเอกสาร"
-                if is_mismatch:
-                    message += f" | {mismatch_reason}"
-                review_files += 1
-
-                _append_and_update_file(
-                    job_service,
-                    job_id,
-                    idx,
-                    rows=rows_out,
-                    state=file_state,
-                    platform=platform_u,
-                    company=company,
-                    message=message,
-                )
+            work.update(no_text=True, row=row_min, message=message)
 
-            else:
-                # ---------- Extract structured row ----------
-                # ✅ MUST: pass filename + cfg every file
-                platform, base_row, errors = extract_row_from_text(
+        else:
+            # ---------- Extract structured row ----------
+            # ✅ MUST: pass filename + cfg every file (already done in the pool when it ran there)
+            if extracted is None:
+                extracted = extract_row_from_text(
                     text,
                     filename=filename,
                     client_tax_id=client_tax_id,
                     cfg=cfg_for_file,
                 )
-                platform_u = _norm_platform(platform) or "UNKNOWN"
-
-                is_mismatch, mismatch_reason = _cfg_mismatch(
-                    allowed_companies,
-                    allowed_platforms,
-                    strict_mode,
-                    company=company,
-                    platform_u=platform_u,
-                )
+            platform, base_row, errors = extracted
+            platform_u = _norm_platform(platform) or "UNKNOWN"
+
+            is_mismatch, mismatch_reason = _cfg_mismatch(
+                allowed_companies,
+                allowed_platforms,
+                strict_mode,
+                company=company,
+                platform_u=platform_u,
+            )
 
-                seller_id = _detect_seller_id(text, filename)
-                shop_name_hint = _filename_stem(filename)
-
-                wallet_code = ""
-                if resolve_wallet_code is not None:
-                    try:
-                        wallet_code = (
-                            resolve_wallet_code(
-                                client_tax_id,
-                                seller_id=seller_id,
-                                shop_name=shop_name_hint,
-                                text=text,
-                            )
-                            or ""
+            seller_id = _detect_seller_id(text, filename)
+            shop_name_hint = _filename_stem(filename)
+
+            wallet_code = ""
+            if resolve_wallet_code is not None:
+                try:
+                    wallet_code = (
+                        resolve_wallet_code(
+                            client_tax_id,
+                            seller_id=seller_id,
+                            shop_name=shop_name_hint,
+                            text=text,
                         )
-                    except Exception:
-                        wallet_code = ""
-
-                # Company name fallback (if you want company name column always filled)
-                if not company and client_tax_id:
-                    company = _company_from_tax_id(client_tax_id, filename)
-
-                row: Dict[str, Any] = {
-                    "A_seq": seq,
-                    "A_company_name": company,
-                    "_source_file": filename,
-                    "_platform": platform_u,
-                    "_client_tax_id": client_tax_id,
-                    "_seller_id": seller_id,
-                    "_errors": list(errors) if errors else [],
-                }
-                if isinstance(base_row, dict):
-                    row.update(base_row)
-
-                if wallet_code:
-                    row["Q_payment_method"] = wallet_code
-
-                _normalize_row_fields(row, seq=seq)
-
-                # ✅ LOCK BEFORE AI
-                _apply_locked_fields(row, filename=filename, platform_u=platform_u, text=text, client_tax_id=client_tax_id)
-
-                # ---------- Optional AI patch ----------
-                if _should_call_ai(list(row.get("_errors") or []), row):
-                    partial_keys = [
-                        "B_doc_date",
-                        "C_reference",
-                        "D_vendor_code",
-                        "E_tax_id_13",
-                        "F_branch_5",
-                        "G_invoice_no",
-                        "H_invoice_date",
-                        "I_tax_purchase_date",
-                        "J_price_type",
-                        "K_account",
-                        "L_description",
-                        "M_qty",
-                        "N_unit_price",
-                        "O_vat_rate",
-                        "P_wht",
-                        "Q_payment_method",
-                        "R_paid_amount",
-                        "S_pnd",
-                        "T_note",
-                        "U_group",
-                    ]
-
-                    ai_patch = ai_fill_peak_row(
-                        text=text,
-                        platform_hint=platform_u,
-                        partial_row={k: row.get(k, "") for k in partial_keys},
-                        source_filename=filename,
+                        or ""
                     )
+                except Exception:
+                    wallet_code = ""
 
-                    if ai_patch and isinstance(ai_patch, dict):
-                        for k, v in ai_patch.items():
-                            if not k:
-                                continue
-                            if k.startswith("_"):
-                                row[k] = v
-                                continue
+            # Company name fallback (if you want company name column always filled)
+            if not company and client_tax_id:
+                company = _company_from_tax_id(client_tax_id, filename)
 
-                            # ✅ HARD LOCK: AI ห้ามใส่ P_wht
-                            if k == "P_wht":
-                                continue
+            row: Dict[str, Any] = {
+                "A_seq": seq,
+                "A_company_name": company,
+                "_source_file": filename,
+                "_platform": platform_u,
+                "_client_tax_id": client_tax_id,
+                "_seller_id": seller_id,
+                "_errors": list(errors) if errors else [],
+            }
+            if isinstance(base_row, dict):
+                row.update(base_row)
 
-                            v_str = _safe_str(v)
-                            if not v_str:
-                                continue
+            if wallet_code:
+                row["Q_payment_method"] = wallet_code
 
-                            if ai_only_fill_empty:
-                                if _safe_str(row.get(k)) in {"", "0", "0.0", "0.00"}:
-                                    row[k] = v_str
-                            else:
-                                if row.get("_errors"):
-                                    row[k] = v_str
-                                else:
-                                    if _safe_str(row.get(k)) in {"", "0", "0.0", "0.00"}:
-                                        row[k] = v_str
+            _normalize_row_fields(row, seq=seq)
 
-                if wallet_code:
-                    row["Q_payment_method"] = wallet_code
+            # ✅ LOCK BEFORE AI
+            _apply_locked_fields(row, filename=filename, platform_u=platform_u, text=text, client_tax_id=client_tax_id)
 
-                _normalize_row_fields(row, seq=seq)
+            # ---------- Optional AI patch (runs later, off this thread) ----------
+            if _should_call_ai(list(row.get("_errors") or []), row):
+                work["ai_args"] = {
+                    "text": text,
+                    "platform_hint": platform_u,
+                    "partial_row": {k: row.get(k, "") for k in _AI_PARTIAL_KEYS},
+                    "source_filename": filename,
+                }
 
-                # ✅ re-lock again after AI
-                _apply_locked_fields(row, filename=filename, platform_u=platform_u, text=text, client_tax_id=client_tax_id)
+            work.update(
+                row=row,
+                wallet_code=wallet_code,
+                is_mismatch=is_mismatch,
+                mismatch_reason=mismatch_reason,
+            )
 
-                errors2 = _revalidate(row)
-                row["_errors"] = _merge_unique_errors(list(row.get("_errors") or []), errors2)
+    except Exception as e:
+        work["error"] = e
 
-                if is_mismatch:
-                    row["_status"] = "NEEDS_REVIEW"
-                    row["_status_reason"] = "filter_mismatch"
-                    row["_errors"] = _merge_unique_errors(list(row.get("_errors") or []), [f"ไม่ตรง filter: {mismatch_reason}"])
-                    _add_note(row, f"Filtered: {mismatch_reason}")
-                    file_state = "needs_review"
-                    message = mismatch_reason
-                    review_files += 1
-                else:
-                    if row.get("_errors"):
-                        row["_status"] = "NEEDS_REVIEW"
-                        row["_status_reason"] = "validation_or_missing"
-                        file_state = "needs_review"
-                        message = "มีช่องที่ต้องตรวจสอบ"
-                        review_files += 1
+    finally:
+        # text is extracted already -> temp file not needed while waiting for commit
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+    work["platform_u"] = platform_u
+    work["company"] = company
+    return work
+
+
+def _commit_file(
+    job_service,
+    job_id: str,
+    work: Dict[str, Any],
+    ai_future: Optional[Future],
+    tally: Dict[str, int],
+    *,
+    ai_only_fill_empty: bool,
+) -> None:
+    """Apply the AI patch, re-lock, validate and append the file's row (called in upload order)."""
+    idx = work["idx"]
+    filename = work["filename"]
+    seq = work["seq"]
+    platform_u = work["platform_u"]
+    company = work["company"]
+    appended = False
+
+    try:
+        if work["error"] is not None:
+            raise work["error"]
+
+        row: Dict[str, Any] = work["row"]
+
+        if work["no_text"]:
+            tally["review_files"] += 1
+            _append_and_update_file(
+                job_service,
+                job_id,
+                idx,
+                rows=[row],
+                state="needs_review",
+                platform=platform_u,
+                company=company,
+                message=work["message"],
+            )
+            appended = True
+
+        else:
+            text = work["text"]
+            client_tax_id = work["client_tax_id"]
+            wallet_code = work["wallet_code"]
+            is_mismatch = work["is_mismatch"]
+            mismatch_reason = work["mismatch_reason"]
+
+            ai_patch = None
+            if ai_future is not None:
+                ai_patch = ai_future.result()
+            elif work["ai_args"]:
+                ai_patch = ai_fill_peak_row(**work["ai_args"])
+
+            if ai_patch and isinstance(ai_patch, dict):
+                for k, v in ai_patch.items():
+                    if not k:
+                        continue
+                    if k.startswith("_"):
+                        row[k] = v
+                        continue
+
+                    # ✅ HARD LOCK: AI ห้ามใส่ P_wht
+                    if k == "P_wht":
+                        continue
+
+                    v_str = _safe_str(v)
+                    if not v_str:
+                        continue
+
+                    if ai_only_fill_empty:
+                        if _safe_str(row.get(k)) in {"", "0", "0.0", "0.00"}:
+                            row[k] = v_str
                     else:
-                        row["_status"] = "OK"
-                        row["_status_reason"] = ""
-                        file_state = "done"
-                        message = ""
-                        ok_files += 1
-
-                rows_out.append(row)
-                seq += 1
-
-                _append_and_update_file(
-                    job_service,
-                    job_id,
-                    idx,
-                    rows=rows_out,
-                    state=file_state,
-                    platform=platform_u,
-                    company=company,
-                    message=message,
-                )
+                        if row.get("_errors"):
+                            row[k] = v_str
+                        else:
+                            if _safe_str(row.get(k)) in {"", "0", "0.0", "0.00"}:
+                                row[k] = v_str
 
-        except Exception as e:
-            error_files += 1
+            if wallet_code:
+                row["Q_payment_method"] = wallet_code
 
-            err_row: Dict[str, Any] = {
-                "A_seq": seq,
-                "A_company_name": company or "",
-                "_source_file": filename,
-                "_platform": platform_u or "UNKNOWN",
-                "_status": "ERROR",
-                "_status_reason": "exception",
-                "_errors": [f"{type(e).__name__}: {e}"],
-            }
-            _normalize_row_fields(err_row, seq=seq)
-            _apply_locked_fields(err_row, filename=filename, platform_u=platform_u or "UNKNOWN", text="", client_tax_id="")
-            seq += 1
+            _normalize_row_fields(row, seq=seq)
 
-            try:
-                job_service.append_rows(job_id, [err_row])
-            except Exception:
-                pass
+            # ✅ re-lock again after AI
+            _apply_locked_fields(row, filename=filename, platform_u=platform_u, text=text, client_tax_id=client_tax_id)
+
+            errors2 = _revalidate(row)
+            row["_errors"] = _merge_unique_errors(list(row.get("_errors") or []), errors2)
 
-            job_service.update_file(
+            if is_mismatch:
+                row["_status"] = "NEEDS_REVIEW"
+                row["_status_reason"] = "filter_mismatch"
+                row["_errors"] = _merge_unique_errors(list(row.get("_errors") or []), [f"ไม่ตรง filter: {mismatch_reason}"])
+                _add_note(row, f"Filtered: {mismatch_reason}")
+                file_state = "needs_review"
+                message = mismatch_reason
+                tally["review_files"] += 1
+            else:
+                if row.get("_errors"):
+                    row["_status"] = "NEEDS_REVIEW"
+                    row["_status_reason"] = "validation_or_missing"
+                    file_state = "needs_review"
+                    message = "มีช่องที่ต้องตรวจสอบ"
+                    tally["review_files"] += 1
+                else:
+                    row["_status"] = "OK"
+                    row["_status_reason"] = ""
+                    file_state = "done"
+                    message = ""
+                    tally["ok_files"] += 1
+
+            _append_and_update_file(
+                job_service,
                 job_id,
                 idx,
-                {
-                    "state": "error",
-                    "platform": platform_u or "UNKNOWN",
-                    "company": company or "",
-                    "message": f"Error: {type(e).__name__}: {e}",
-                    "rows_count": 1,
-                },
+                rows=[row],
+                state=file_state,
+                platform=platform_u,
+                company=company,
+                message=message,
             )
+            appended = True
+
+    except Exception as e:
+        tally["error_files"] += 1
+
+        # the file's own seq, unless its row already went in (then take the next free one)
+        if appended:
+            seq = tally["seq"]
+            tally["seq"] += 1
+
+        err_row: Dict[str, Any] = {
+            "A_seq": seq,
+            "A_company_name": company or "",
+            "_source_file": filename,
+            "_platform": platform_u or "UNKNOWN",
+            "_status": "ERROR",
+            "_status_reason": "exception",
+            "_errors": [f"{type(e).__name__}: {e}"],
+        }
+        _normalize_row_fields(err_row, seq=seq)
+        _apply_locked_fields(err_row, filename=filename, platform_u=platform_u or "UNKNOWN", text="", client_tax_id="")
 
-        finally:
-            if tmp_path:
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+        try:
+            job_service.append_rows(job_id, [err_row])
+        except Exception:
+            pass
 
-        processed += 1
-        job_service.update_job(
+        job_service.update_file(
             job_id,
+            idx,
             {
-                "processed_files": processed,
-                "ok_files": ok_files,
-                "review_files": review_files,
-                "error_files": error_files,
+                "state": "error",
+                "platform": platform_u or "UNKNOWN",
+                "company": company or "",
+                "message": f"Error: {type(e).__name__}: {e}",
+                "rows_count": 1,
             },
         )
 
-    final_state = "done" if error_files == 0 else "error"
+    tally["processed"] += 1
+    job_service.update_job(
+        job_id,
+        {
+            "processed_files": tally["processed"],
+            "ok_files": tally["ok_files"],
+            "review_files": tally["review_files"],
+            "error_files": tally["error_files"],
+        },
+    )
+
+
+def process_job_files(job_service, job_id: str) -> None:
+    payloads: List[Tuple[str, str, Any]] = job_service.get_payloads(job_id)
+
+    allowed_companies, allowed_platforms, strict_mode = _get_job_filters(job_service, job_id)
+    cfg = _get_job_cfg(job_service, job_id)
+
+    # ✅ Running sequence across whole job (one A_seq per file, reserved in upload order)
+    tally: Dict[str, int] = {"seq": 1, "ok_files": 0, "review_files": 0, "error_files": 0, "processed": 0}
+
+    ai_only_fill_empty = _env_bool("AI_ONLY_FILL_EMPTY", default=False)
+
+    # ✅ LLM calls are independent per file: up to LLM_CONCURRENCY in flight while
+    #    the next files are OCR'd/extracted; rows are still committed in upload order.
+    #    LLM_CONCURRENCY=1 -> fully sequential (AI called inline at commit)
+    window = max(1, _env_int("LLM_CONCURRENCY", 8))
+    pool = ThreadPoolExecutor(max_workers=window, thread_name_prefix="peak-llm") if window > 1 else None
+    pending: Deque[Tuple[Dict[str, Any], Optional[Future]]] = deque()
+
+    text_pool = _text_pool()
+    text_ahead: Dict[int, Tuple[Future, str]] = {}
+    next_text = 0
+
+    def _commit_head() -> None:
+        work, fut = pending.popleft()
+        _commit_file(job_service, job_id, work, fut, tally, ai_only_fill_empty=ai_only_fill_empty)
+
+    try:
+        for idx, (filename, content_type, data) in enumerate(payloads):
+            seq = tally["seq"]
+            tally["seq"] += 1
+
+            # keep the process pool busy: this file + the next ones up to its size
+            if text_pool is not None:
+                lookahead = idx + max(1, _env_int("OCR_PROCS", 0))
+                while next_text < len(payloads) and next_text <= lookahead:
+                    f_name, f_ctype, f_data = payloads[next_text]
+                    job = _submit_text_extraction(text_pool, f_name or "unknown", f_ctype or "", f_data, cfg)
+                    if job is not None:
+                        text_ahead[next_text] = job
+                    next_text += 1
+
+            work = _prepare_file(
+                job_service,
+                job_id,
+                idx,
+                filename or "unknown",
+                content_type or "",
+                data,
+                seq=seq,
+                cfg=cfg,
+                allowed_companies=allowed_companies,
+                allowed_platforms=allowed_platforms,
+                strict_mode=strict_mode,
+                text_job=text_ahead.pop(idx, None),
+            )
+            # text is extracted (or failed) -> the upload spool is no longer needed
+            job_service.release_payload(job_id, idx)
+
+            fut: Optional[Future] = None
+            if pool is not None and work["ai_args"]:
+                fut = pool.submit(ai_fill_peak_row, **work["ai_args"])
+            pending.append((work, fut))
+
+            # commit finished heads; block only when the window is full
+            while pending and (len(pending) >= window or pending[0][1] is None or pending[0][1].done()):
+                _commit_head()
+
+        while pending:
+            _commit_head()
+    finally:
+        # cancelled / aborted mid-job: close the uploads we never got to
+        job_service.release_payloads(job_id)
+        if pool is not None:
+            pool.shutdown(wait=True)
+        # aborted mid-job: drop extractions nobody will consume
+        for fut_text, path in text_ahead.values():
+            fut_text.cancel()
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+    final_state = "done" if tally["error_files"] == 0 else "error"
     job_service.update_job(job_id, {"state": final_state})
 
 